@@ -2,18 +2,25 @@
 Chat API endpoint with LangChain and relationship preservation
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Tuple, Optional, Dict
+import asyncio
 import json
 import sys
+import time
 from pathlib import Path
 import re
-import httpx
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from services.langchain_setup import get_langchain_service
+from services.availability_cache import get_availability_cache
+from services.availability_index import get_availability_index
+from services.response_cache import get_response_cache
+from services.identifier_index import get_identifier_index
+from services.meta_schema import decode_unicode, get_meta_schema
 
 router = APIRouter()
 
@@ -48,53 +55,240 @@ class ChatResponse(BaseModel):
     source_count: int
 
 
-def decode_unicode(text):
-    """Decode Unicode escape sequences"""
-    if not text:
-        return text
-    try:
-        if isinstance(text, str) and "\\u" in text:
-            return text.encode("utf-8").decode("unicode-escape")
-    except Exception:
-        # Best-effort decode; fall back to original text on any error
-        pass
-    return text
-
-
 async def check_item_urls(
     site_host: str, default_locale: str, item_numbers: List[str]
-) -> Dict[str, bool]:
+) -> Dict[str, Optional[bool]]:
     """
     For each item_number, build the product URL and check if it exists on the live site.
 
-    Returns a dict: { item_number: True/False } where False means the URL is broken (4xx/5xx or network error).
+    Items covered by the offline availability index (scripts/build_availability_index.py) are a
+    set lookup. The rest come from the persistent availability cache (services/availability_cache.py),
+    which only checks uncached items live, concurrently over a shared keep-alive connection pool.
+
+    Returns a dict: { item_number: True/False/None } where False means the page is gone (404/410)
+    and None that the check could not tell (other errors, timeouts) - those are still shown.
     """
-    results: Dict[str, bool] = {}
     if not item_numbers:
-        return results
-
-    base = f"https://{site_host}/{default_locale}/product-detail"
-
-    timeout = httpx.Timeout(5.0, connect=5.0)  # Increased timeout
-    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-        for item in item_numbers:
-            url = f"{base}/{item}"
-            try:
-                # Try HEAD first (cheaper); fall back to GET if needed
-                resp = await client.head(url)
-                if resp.status_code >= 400:
-                    resp = await client.get(url)
-                is_valid = resp.status_code < 400
-                results[item] = is_valid
-                print(f"  URL check: {item} -> {is_valid} (status: {resp.status_code})")
-            except Exception as e:
-                # Any error -> treat as not available
-                results[item] = False
-                print(f"  URL check: {item} -> False (error: {str(e)[:50]})")
+        return {}
 
+    results, unknown = get_availability_index().resolve(site_host, default_locale, item_numbers)
+    if unknown:
+        results.update(await get_availability_cache().check(site_host, default_locale, unknown))
     return results
 
 
+# Pattern: [text](item_number) or [text](https://...)
+LINK_PATTERN = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
+
+# A buffered stream tail that could still grow into a LINK_PATTERN match
+PARTIAL_LINK_PATTERN = re.compile(r"\[[^\]]*|\[[^\]]+\]|\[[^\]]+\]\([^)]*")
+
+
+def rewrite_item_link(
+    link_text: str, target: str, item_availability: Dict[str, Optional[bool]], site_host: str, default_locale: str
+) -> str:
+    """Turn [text](item_number) into [text](full_url), or plain text if the product URL is broken"""
+    # If it's already a full URL, leave it as-is
+    if target.startswith("http"):
+        return f"[{link_text}]({target})"
+
+    # Drop links for item_numbers that are confirmed gone or were never checked
+    is_available = item_availability.get(target, False) is not False
+    if not is_available:
+        # Return plain text without any link if the product URL is broken
+        return link_text
+
+    full_url = f"https://{site_host}/{default_locale}/product-detail/{target}"
+    return f"[{link_text}]({full_url})"
+
+
+def build_products(
+    source_documents, item_availability: Dict[str, Optional[bool]], site_host: str, default_locale: str
+) -> List[Product]:
+    """Extract products from source documents - ONLY include products with valid, clickable URLs"""
+    products: List[Product] = []
+    seen_items = set()
+    meta_schema = get_meta_schema()
+
+    for doc in source_documents:
+        metadata = doc.metadata
+
+        # Get SanitizedItemNumber from metadata (stored as 'item_number' during embedding creation)
+        # Rules.txt: "Products: Column SanitizedItemNumber = unique code for each item.
+        # And on the website you can type: https://www.kyocera-unimerco.com/en-dk/product-detail/SanitizedItemNumber"
+        item_number = metadata.get("item_number", "")
+        if not item_number or item_number in seen_items:
+            continue
+
+        # CRITICAL: Only include products with valid, clickable URLs (unknown ones get the benefit of the doubt)
+        is_available = item_availability.get(item_number, False) is not False
+        if not is_available:
+            # Skip products with broken URLs - don't send them to frontend
+            continue
+
+        seen_items.add(item_number)
+
+        # Parse stored specifications (from ProductSpecifications table)
+        try:
+            specs = json.loads(metadata.get("specifications", "[]"))
+        except Exception:
+            specs = []
+        # Readable name of each specification code (SimpleMetaFields), shown instead of the code
+        for spec in specs:
+            if isinstance(spec, dict) and spec.get("Type"):
+                spec["FieldName"] = meta_schema.field_name(str(spec["Type"]))
+
+        # Parse stored product data (from ProductData table)
+        try:
+            product_data = json.loads(metadata.get("product_data", "[]"))
+        except Exception:
+            product_data = []
+
+        # Decode description
+        description = decode_unicode(metadata.get("description", ""))
+
+        # Create product object - only for products with valid URLs
+        # Link format per Rules.txt: https://www.kyocera-unimerco.com/en-dk/product-detail/SanitizedItemNumber
+        product = Product(
+            id=item_number,  # This is SanitizedItemNumber
+            description=description,
+            category=metadata.get("category", ""),
+            specifications=specs,
+            product_data=product_data,
+            link=f"https://{site_host}/{default_locale}/product-detail/{item_number}",  # Using SanitizedItemNumber
+            ean=metadata.get("ean", ""),
+        )
+
+        products.append(product)
+
+    return products
+
+
+class StreamingLinkRewriter:
+    """
+    Applies the [text](item_number) -> [text](full_url) rewrite to a token stream.
+
+    Text that might be the start of a markdown link is held back until the link is complete
+    (or can no longer become one), so links split across tokens are rewritten correctly.
+    Item numbers the LLM cites that were not among the source documents are checked on demand.
+    """
+
+    # Give up waiting for a link to close after this many buffered characters
+    max_pending = 400
+
+    def __init__(self, item_availability: Dict[str, Optional[bool]], site_host: str, default_locale: str):
+        self.item_availability = item_availability
+        self.site_host = site_host
+        self.default_locale = default_locale
+        self._pending = ""
+
+    async def _rewrite(self, match: re.Match) -> str:
+        target = match.group(2)
+        if not target.startswith("http") and target not in self.item_availability:
+            self.item_availability.update(
+                await check_item_urls(self.site_host, self.default_locale, [target])
+            )
+        return rewrite_item_link(
+            match.group(1), target, self.item_availability, self.site_host, self.default_locale
+        )
+
+    async def feed(self, chunk: str) -> str:
+        """Add a chunk of LLM output, return the text that is safe to send"""
+        self._pending += chunk
+        out = []
+        while self._pending:
+            start = self._pending.find("[")
+            if start == -1:
+                out.append(self._pending)
+                self._pending = ""
+                break
+            out.append(self._pending[:start])
+            self._pending = self._pending[start:]
+
+            match = LINK_PATTERN.match(self._pending)
+            if match:
+                out.append(await self._rewrite(match))
+                self._pending = self._pending[match.end():]
+            elif PARTIAL_LINK_PATTERN.fullmatch(self._pending) and len(self._pending) < self.max_pending:
+                break  # wait for more tokens
+            else:
+                # This "[" cannot start a link - emit it and keep scanning
+                out.append(self._pending[0])
+                self._pending = self._pending[1:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        """Return whatever is still buffered at the end of the stream"""
+        tail, self._pending = self._pending, ""
+        return tail
+
+
+def render_identifier_answer(matches: List[Tuple[str, str]], documents) -> str:
+    """Templated answer for a message that only contained item numbers / EANs"""
+    by_id = {doc.metadata.get("item_number"): doc for doc in documents}
+    lines = []
+    for identifier, item_number in matches:
+        metadata = by_id[item_number].metadata
+        line = f"[{decode_unicode(metadata.get('description', '')) or item_number}]({item_number})"
+        details = [metadata.get("category", "")]
+        # Material and key dimensions from the compact summary written at ingest
+        for summary_line in (metadata.get("summary") or "").splitlines():
+            if summary_line.startswith(("Material/Application: ", "Key dimensions: ")):
+                details.append(summary_line.split(": ", 1)[1])
+        if metadata.get("ean") and metadata.get("ean") != identifier:
+            details.append(f"EAN {metadata['ean']}")
+        details = [detail for detail in details if detail]
+        if details:
+            line += " – " + " | ".join(details)
+        lines.append(line)
+
+    if len(lines) == 1:
+        return f"Here is the product for **{matches[0][0]}**:\n\n{lines[0]}"
+    return "Here are the products you asked for:\n\n" + "\n".join(
+        f"{number}. {line}" for number, line in enumerate(lines, 1)
+    )
+
+
+async def answer_identifier_query(service, message: str) -> Optional[ChatResponse]:
+    """
+    Fast path for messages that are nothing but item numbers / EANs
+
+    Dictionary lookup in the identifier index plus a Chroma fetch by id - no embedding,
+    retrieval or LLM call. Returns None when the message needs the normal chat pipeline.
+    """
+    index = get_identifier_index()
+    if index is None:
+        return None
+    matches = index.match_message(message)
+    if not matches:
+        return None
+
+    item_numbers = list(dict.fromkeys(item_number for _, item_number in matches))
+    documents = await asyncio.to_thread(service.retriever.get_documents, item_numbers)
+    if len(documents) != len(item_numbers):
+        # Index is newer or older than the collection - let the normal pipeline answer
+        return None
+    matches = list({item_number: (identifier, item_number) for identifier, item_number in matches}.values())
+
+    site_host = service.site_host
+    default_locale = service.default_locale
+    item_availability = await check_item_urls(site_host, default_locale, item_numbers)
+    response_text = LINK_PATTERN.sub(
+        lambda m: rewrite_item_link(m.group(1), m.group(2), item_availability, site_host, default_locale),
+        render_identifier_answer(matches, documents),
+    )
+    return ChatResponse(
+        response=response_text,
+        products=build_products(documents, item_availability, site_host, default_locale),
+        source_count=len(documents),
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -107,16 +301,32 @@ async def chat(request: ChatRequest):
     Returns:
         ChatResponse with answer and related products
     """
+    started = time.perf_counter()
     try:
-        # Get LangChain service
-        service = get_langchain_service()
+        # Get LangChain service (first call loads models - keep it off the event loop)
+        service = await asyncio.to_thread(get_langchain_service)
 
         # Get site configuration
         site_host = service.site_host
         default_locale = service.default_locale
 
-        # Query with conversation history
-        result = service.query(
+        # A pasted item number / EAN is answered with a lookup instead of retrieval + LLM
+        identifier_response = await answer_identifier_query(service, request.message)
+        if identifier_response is not None:
+            print(f"Answered from identifier index in {(time.perf_counter() - started) * 1000:.1f} ms")
+            return identifier_response
+
+        # First-turn questions can be answered from the semantic response cache
+        question_vector = None
+        if not request.conversation_history:
+            question_vector = await asyncio.to_thread(service.embeddings.embed_query, request.message)
+            cached = get_response_cache().lookup(question_vector, request.message)
+            if cached is not None:
+                print("Answered from semantic response cache")
+                return ChatResponse(**cached)
+
+        # Query with conversation history (async - other requests keep being served meanwhile)
+        result = await service.aquery(
             question=request.message,
             chat_history=request.conversation_history,
         )
@@ -125,8 +335,7 @@ async def chat(request: ChatRequest):
         # Pattern: [text](item_number) -> [text](https://site/product-detail/item_number)
         response_text = result["answer"]
 
-        pattern = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
-        matches = list(pattern.finditer(response_text))
+        matches = list(LINK_PATTERN.finditer(response_text))
 
         # Collect all unique item_numbers that are not already URLs
         raw_item_numbers = {
@@ -145,90 +354,39 @@ async def chat(request: ChatRequest):
         
         # Check which of these item_numbers actually exist on the live site
         print(f"\nFound {len(all_item_numbers)} item numbers to validate: {list(all_item_numbers)[:5]}")
-        item_availability: Dict[str, bool] = await check_item_urls(
+        item_availability: Dict[str, Optional[bool]] = await check_item_urls(
             site_host, default_locale, list(all_item_numbers)
         )
-        print(f"Validation results: {sum(item_availability.values())}/{len(item_availability)} URLs are valid")
-
-        def replace_item_link(match: re.Match) -> str:
-            link_text = match.group(1)
-            target = match.group(2)
-
-            # If it's already a full URL, leave it as-is
-            if target.startswith("http"):
-                return match.group(0)
-
-            # Only keep links for item_numbers that are confirmed to exist
-            is_available = item_availability.get(target, False)
-            if not is_available:
-                # Return plain text without any link if the product URL is broken
-                return link_text
-
-            full_url = f"https://{site_host}/{default_locale}/product-detail/{target}"
-            return f"[{link_text}]({full_url})"
+        print(f"Validation results: {sum(1 for ok in item_availability.values() if ok)}/{len(item_availability)} URLs are valid")
 
         # Replace [text](item_number) with [text](full_url) only for valid products
         print(f"\nBefore URL replacement:\n{response_text[:500]}")
-        response_text = pattern.sub(replace_item_link, response_text)
+        response_text = LINK_PATTERN.sub(
+            lambda m: rewrite_item_link(m.group(1), m.group(2), item_availability, site_host, default_locale),
+            response_text,
+        )
         print(f"\nAfter URL replacement:\n{response_text[:500]}")
 
-        # Extract products from source documents - ONLY include products with valid, clickable URLs
-        products: List[Product] = []
-        seen_items = set()
-
-        for doc in result["source_documents"]:
-            metadata = doc.metadata
-
-            # Get SanitizedItemNumber from metadata (stored as 'item_number' during embedding creation)
-            # Rules.txt: "Products: Column SanitizedItemNumber = unique code for each item.
-            # And on the website you can type: https://www.kyocera-unimerco.com/en-dk/product-detail/SanitizedItemNumber"
-            item_number = metadata.get("item_number", "")
-            if not item_number or item_number in seen_items:
-                continue
-
-            # CRITICAL: Only include products with valid, clickable URLs
-            is_available = item_availability.get(item_number, False)
-            if not is_available:
-                # Skip products with broken URLs - don't send them to frontend
-                continue
-
-            seen_items.add(item_number)
-
-            # Parse stored specifications (from ProductSpecifications table)
-            try:
-                specs = json.loads(metadata.get("specifications", "[]"))
-            except Exception:
-                specs = []
-
-            # Parse stored product data (from ProductData table)
-            try:
-                product_data = json.loads(metadata.get("product_data", "[]"))
-            except Exception:
-                product_data = []
-
-            # Decode description
-            description = decode_unicode(metadata.get("description", ""))
-
-            # Create product object - only for products with valid URLs
-            # Link format per Rules.txt: https://www.kyocera-unimerco.com/en-dk/product-detail/SanitizedItemNumber
-            product = Product(
-                id=item_number,  # This is SanitizedItemNumber
-                description=description,
-                category=metadata.get("category", ""),
-                specifications=specs,
-                product_data=product_data,
-                link=f"https://{site_host}/{default_locale}/product-detail/{item_number}",  # Using SanitizedItemNumber
-                ean=metadata.get("ean", ""),
-            )
-
-            products.append(product)
+        products = build_products(
+            result["source_documents"], item_availability, site_host, default_locale
+        )
 
-        return ChatResponse(
+        response = ChatResponse(
             response=response_text,  # Use converted response with filtered, valid URLs only
             products=products,
             source_count=len(result["source_documents"]),
         )
 
+        if question_vector is not None:
+            get_response_cache().store(
+                request.message,
+                question_vector,
+                response.model_dump(),
+                latency=time.perf_counter() - started,
+                tokens=result.get("total_tokens", 0),
+            )
+        return response
+
     except Exception as e:
         import traceback
 
@@ -237,11 +395,107 @@ async def chat(request: ChatRequest):
             status_code=500, detail=f"Error processing chat request: {str(e)}"
         )
 
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming chat endpoint (Server-Sent Events).
+
+    Events, in order:
+    - `products`: product cards (valid URLs only) as soon as retrieval finishes
+    - `token`: answer text as it is generated, with item-number links already rewritten
+    - `done`: the complete rewritten answer and source_count
+    - `error`: sent instead of the remaining events if something fails mid-stream
+    """
+    service = await asyncio.to_thread(get_langchain_service)
+    site_host = service.site_host
+    default_locale = service.default_locale
+
+    async def event_stream():
+        try:
+            # A pasted item number / EAN is answered with a lookup instead of retrieval + LLM
+            identifier_response = await answer_identifier_query(service, request.message)
+            if identifier_response is not None:
+                yield sse_event("products", {
+                    "products": [product.model_dump() for product in identifier_response.products],
+                    "source_count": identifier_response.source_count,
+                })
+                yield sse_event("token", {"text": identifier_response.response})
+                yield sse_event("done", {
+                    "response": identifier_response.response,
+                    "source_count": identifier_response.source_count,
+                })
+                return
+
+            # First-turn questions can be answered from the semantic response cache
+            if not request.conversation_history:
+                question_vector = await asyncio.to_thread(service.embeddings.embed_query, request.message)
+                cached = get_response_cache().lookup(question_vector, request.message)
+                if cached is not None:
+                    yield sse_event("products", {
+                        "products": cached["products"],
+                        "source_count": cached["source_count"],
+                    })
+                    yield sse_event("token", {"text": cached["response"]})
+                    yield sse_event("done", {
+                        "response": cached["response"],
+                        "source_count": cached["source_count"],
+                    })
+                    return
+
+            async with service.query_slot():
+                question = await service.acondense_question(
+                    request.message, request.conversation_history
+                )
+                documents = await service.aretrieve(question)
+
+                source_item_numbers = list(dict.fromkeys(
+                    doc.metadata.get("item_number", "") for doc in documents
+                    if doc.metadata.get("item_number", "")
+                ))
+                item_availability = await check_item_urls(site_host, default_locale, source_item_numbers)
+                products = build_products(documents, item_availability, site_host, default_locale)
+                yield sse_event("products", {
+                    "products": [product.model_dump() for product in products],
+                    "source_count": len(documents),
+                })
+
+                rewriter = StreamingLinkRewriter(item_availability, site_host, default_locale)
+                response_parts = []
+                async for token in service.astream_answer(
+                    question, documents, request.conversation_history
+                ):
+                    text = await rewriter.feed(token)
+                    if text:
+                        response_parts.append(text)
+                        yield sse_event("token", {"text": text})
+                tail = rewriter.flush()
+                if tail:
+                    response_parts.append(tail)
+                    yield sse_event("token", {"text": tail})
+
+            yield sse_event("done", {
+                "response": "".join(response_parts),
+                "source_count": len(documents),
+            })
+
+        except Exception as e:
+            import traceback
+
+            traceback.print_exc()
+            yield sse_event("error", {"detail": f"Error processing chat request: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/chat/count")
 async def get_product_count():
     """Get number of products in vector database"""
     try:
-        service = get_langchain_service()
+        service = await asyncio.to_thread(get_langchain_service)
         count = service.get_collection_count()
         return {"count": count, "status": "ready"}
     except Exception as e:
@@ -250,3 +504,84 @@ async def get_product_count():
             detail=f"Error getting product count: {str(e)}"
         )
 
+
+@router.get("/chat/availability-stats")
+async def get_availability_stats():
+    """Get product availability cache counters"""
+    try:
+        return get_availability_cache().stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting availability stats: {str(e)}"
+        )
+
+
+@router.get("/chat/embedding-cache-stats")
+async def get_embedding_cache_stats():
+    """Get query embedding cache counters"""
+    try:
+        service = await asyncio.to_thread(get_langchain_service)
+        return service.query_embedding_cache.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting embedding cache stats: {str(e)}"
+        )
+
+
+@router.get("/chat/response-cache-stats")
+async def get_response_cache_stats():
+    """Get semantic response cache counters"""
+    try:
+        return get_response_cache().stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting response cache stats: {str(e)}"
+        )
+
+
+@router.get("/chat/rewrite-stats")
+async def get_rewrite_stats():
+    """Get follow-up question rewrite counters (condense LLM calls skipped)"""
+    try:
+        service = await asyncio.to_thread(get_langchain_service)
+        return service.question_rewriter.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting rewrite stats: {str(e)}"
+        )
+
+@router.get("/chat/context-stats")
+async def get_context_stats():
+    """Get prompt context packing statistics (tokens per request, full vs summary products)"""
+    try:
+        service = await asyncio.to_thread(get_langchain_service)
+        return service.context_packer.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting context stats: {str(e)}"
+        )
+
+@router.get("/chat/retrieval-stats")
+async def get_retrieval_stats():
+    """Get retrieval counters (searches narrowed by a dimension pre-filter, fallbacks)"""
+    try:
+        service = await asyncio.to_thread(get_langchain_service)
+        return service.retriever.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error getting retrieval stats: {str(e)}"
+        )
+
+@router.get("/chat/identifier-stats")
+async def get_identifier_stats():
+    """Get item-number / EAN fast path counters"""
+    index = get_identifier_index()
+    if index is None:
+        return {"loaded": False}
+    return {"loaded": True, **index.stats()}
@@ -1,9 +1,17 @@
 """
-Health check endpoint
+Health check and readiness endpoints
 """
+import sys
+from pathlib import Path
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime
 
+# Add parent directory to path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services import langchain_setup
+
 router = APIRouter()
 
 @router.get("/health")
@@ -15,3 +23,20 @@ async def health_check():
         "service": "Product Search Chatbot API"
     }
 
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 503 until models are loaded and warmed up at startup,
+    so orchestrators only route traffic to warmed instances
+    """
+    readiness = langchain_setup.readiness
+    service = langchain_setup.langchain_service
+    timings = service.init_timings if service is not None else {}
+    body = {
+        "status": "ready" if readiness["ready"] else ("failed" if readiness["error"] else "warming_up"),
+        "timestamp": datetime.utcnow().isoformat(),
+        "error": readiness["error"],
+        "component_init_ms": {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+        "total_warm_up_ms": round(readiness["total_seconds"] * 1000, 1) if readiness["total_seconds"] is not None else None,
+    }
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=body)
@@ -5,14 +5,30 @@ import os
 # Fix OpenMP library conflict (safe workaround for multiple OpenMP runtimes)
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api import chat, health
+from services.availability_index import get_availability_index
+from services.langchain_setup import warm_up_langchain_service
+from services.url_validator import get_url_validator
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up models and indexes in the background at boot; /api/ready reports when done"""
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up_langchain_service))
+    get_availability_index()
+    yield
+    # Release pooled keep-alive connections used for product URL checks
+    await get_url_validator().aclose()
 
 app = FastAPI(
     title="Product Search Chatbot API",
     description="Embeddings-based product search using LangChain, ChromaDB, and OpenAI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for frontend (allow all origins so ngrok + remote browsers can call the API)
@@ -33,7 +49,8 @@ async def root():
     return {
         "message": "Product Search Chatbot API",
         "docs": "/docs",
-        "health": "/api/health"
+        "health": "/api/health",
+        "ready": "/api/ready"
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""
+Load test for the chat query path against a local fake OpenAI endpoint
+Compares the blocking query() call (old handler behaviour) with the async aquery()
+and reports throughput plus event-loop stall time while the load runs
+
+Run (after setup_embeddings): python scripts/benchmark_chat_concurrency.py [--latency 0.5]
+"""
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+QUESTIONS = [
+    "I need a digital caliper",
+    "Show me sawblades for cutting wood",
+    "drill 10mm",
+    "bandsaw blade for metal",
+]
+
+def serve_fake_openai(port, latency):
+    """Minimal OpenAI-compatible chat completions endpoint with a fixed response delay"""
+    import uvicorn
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def completions(body: dict):
+        await asyncio.sleep(latency)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "Fake answer for load testing."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 10, "total_tokens": 1010},
+        }
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def measure_loop_stall(stop_event, stalls):
+    """Record how late a 10 ms timer fires - a blocked event loop shows up as large delays"""
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - started - 0.01)
+
+async def run_load(service, clients, requests_per_client, use_async):
+    async def client(n):
+        for i in range(requests_per_client):
+            question = QUESTIONS[(n + i) % len(QUESTIONS)]
+            if use_async:
+                await service.aquery(question, chat_history=[])
+            else:
+                # What the handler used to do: a synchronous call inside an async endpoint
+                service.query(question, chat_history=[])
+
+    stop_event = asyncio.Event()
+    stalls = []
+    probe = asyncio.create_task(measure_loop_stall(stop_event, stalls))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    stop_event.set()
+    await probe
+    total = clients * requests_per_client
+    return total / elapsed, max(stalls, default=0.0)
+
+async def run_benchmark(service, client_counts, requests_per_client):
+    print(f"\n{'mode':<8}{'clients':>8}{'req/s':>10}{'max loop stall':>18}")
+    for use_async in (False, True):
+        for clients in client_counts:
+            throughput, stall = await run_load(service, clients, requests_per_client, use_async)
+            mode = "async" if use_async else "blocking"
+            print(f"{mode:<8}{clients:>8}{throughput:>10.2f}{stall * 1000:>15.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat query path load test")
+    parser.add_argument('--latency', type=float, default=0.5, help="Fake OpenAI response time in seconds")
+    parser.add_argument('--clients', default="1,2,4,8", help="Comma-separated concurrent client counts")
+    parser.add_argument('--requests', type=int, default=4, help="Requests per client")
+    args = parser.parse_args()
+
+    port = free_port()
+    server = multiprocessing.Process(target=serve_fake_openai, args=(port, args.latency), daemon=True)
+    server.start()
+    time.sleep(2)
+
+    # Point the OpenAI client at the fake endpoint before the service is created
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{port}/v1"
+    os.environ['OPENAI_API_KEY'] = "sk-fake"
+
+    from services.langchain_setup import get_langchain_service
+
+    print("="*60)
+    print(f"Chat concurrency benchmark (fake OpenAI latency {args.latency * 1000:.0f} ms)")
+    print("="*60)
+    service = get_langchain_service()
+    try:
+        asyncio.run(run_benchmark(
+            service,
+            [int(c) for c in args.clients.split(',')],
+            args.requests,
+        ))
+    finally:
+        server.terminate()
@@ -0,0 +1,203 @@
+"""
+Export benchmark: per-product queries (N+1) vs set-based ordered streams vs partitioned
+Builds a local SQLite stand-in with the Products / ProductSpecifications / ProductData /
+SimpleMetaFields tables, exports it both ways and prints queries, rows and timing.
+--round-trip-ms adds a simulated network round trip per query and per fetch, which is
+what dominates the N+1 export against a real SQL Server. The partitioned export overlaps
+those round trips across --workers threads.
+
+Run: python scripts/benchmark_export.py [--products 20000] [--round-trip-ms 0.5] [--partitions 8]
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from scripts.export_data import export_products
+from services.export_source import PRODUCT_FILTER, SqliteSource
+from services.product_reader import iter_products
+
+PRODUCT_COLUMNS = [
+    ('Id', 'INTEGER'), ('SanitizedItemNumber', 'TEXT'), ('Ean', 'TEXT'), ('MetaClass', 'TEXT'),
+    ('ItemDescriptionSerialized', 'TEXT'), ('FilterMetaDataSerialized', 'TEXT'),
+    ('MarketsSerialized', 'TEXT'), ('IsDeleted', 'INTEGER'), ('Parent', 'TEXT'),
+]
+
+def build_database(path, products, specs_per_product=4, data_per_product=2, seed=42):
+    """Synthetic catalog; ~10% of products are deleted, purchase items or other markets"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE Products ({', '.join(f'[{name}] {kind}' for name, kind in PRODUCT_COLUMNS)})")
+    conn.execute("CREATE TABLE ProductSpecifications (ItemNumber TEXT, Type TEXT, Data TEXT)")
+    conn.execute("CREATE TABLE ProductData (ItemNumber TEXT, Type TEXT, Content TEXT)")
+    conn.execute("CREATE TABLE SimpleMetaFields (MetaClass TEXT, FieldName TEXT)")
+    # Indexed like the real tables, so the per-product lookups are not table scans
+    conn.execute("CREATE INDEX ix_specs_item ON ProductSpecifications (ItemNumber)")
+    conn.execute("CREATE INDEX ix_data_item ON ProductData (ItemNumber)")
+    conn.execute("CREATE INDEX ix_products_item ON Products (SanitizedItemNumber)")
+
+    product_rows, spec_rows, data_rows = [], [], []
+    for i in range(products):
+        item_number = f"W{rng.randint(100000, 999999)}-{i:07d}"
+        diameter = rng.choice([160, 200, 250, 300])
+        product_rows.append((
+            i, item_number, str(5700000000000 + i), rng.choice(['SAWBLADES', 'DRILLS', 'CALIPERS']),
+            json.dumps({'en': f'Circular saw blade {diameter}x30', 'da': f'Rundsavklinge {diameter}x30'}),
+            json.dumps({'SAW_DIAMETER': str(diameter)}),
+            '["001"]' if rng.random() > 0.03 else '["002"]',
+            1 if rng.random() < 0.04 else 0,
+            'purchases' if rng.random() < 0.03 else 'sales',
+        ))
+        spec_rows.extend(
+            (item_number, f'SPEC_{n}', json.dumps({'Diameter (mm)': {'value': str(diameter)}}))
+            for n in range(specs_per_product)
+        )
+        data_rows.extend((item_number, 'Text', 'Suitable for hardwood and softwood. ' * 3) for _ in range(data_per_product))
+
+    conn.executemany(f"INSERT INTO Products VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})", product_rows)
+    conn.executemany("INSERT INTO ProductSpecifications VALUES (?, ?, ?)", spec_rows)
+    conn.executemany("INSERT INTO ProductData VALUES (?, ?, ?)", data_rows)
+    conn.executemany("INSERT INTO SimpleMetaFields VALUES (?, ?)", [(f'SPEC_{n}', f'Field {n}') for n in range(50)])
+    conn.commit()
+    conn.close()
+    return len(product_rows), len(spec_rows), len(data_rows)
+
+class _LatencyCursor:
+    def __init__(self, cursor, source):
+        self._cursor = cursor
+        self._source = source
+
+    def execute(self, *args):
+        self._source.round_trip()
+        self._cursor.execute(*args)
+        return self
+
+    def fetchall(self):
+        self._source.round_trip()
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        self._source.round_trip()
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+class _LatencyConnection:
+    def __init__(self, conn, source):
+        self._conn = conn
+        self._source = source
+
+    def cursor(self):
+        return _LatencyCursor(self._conn.cursor(), self._source)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def close(self):
+        self._conn.close()
+
+class LatencySqliteSource(SqliteSource):
+    """SqliteSource that sleeps for a simulated round trip on every execute / fetch and counts them"""
+
+    def __init__(self, path, round_trip_ms):
+        super().__init__(path)
+        self.round_trip_seconds = round_trip_ms / 1000
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.round_trip_seconds:
+            time.sleep(self.round_trip_seconds)
+
+    def connect(self):
+        return _LatencyConnection(super().connect(), self)
+
+def export_n_plus_one(source, output_path):
+    """The previous export loop: one products query, then one specs and one data query per product"""
+    conn = source.connect()
+    cursor = conn.cursor()
+    columns = [name for name, _ in PRODUCT_COLUMNS]
+    cursor.execute(f"SELECT {', '.join(f'p.[{c}]' for c in columns)} FROM Products p WHERE {PRODUCT_FILTER}")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for row in cursor.fetchall():
+            product = dict(zip(columns, row))
+            for field, table, child_columns in (
+                ('specifications', 'ProductSpecifications', ['ItemNumber', 'Type', 'Data']),
+                ('product_data', 'ProductData', ['ItemNumber', 'Type', 'Content']),
+            ):
+                child = conn.cursor()
+                child.execute(
+                    f"SELECT {', '.join(f'[{c}]' for c in child_columns)} FROM {table} WHERE [ItemNumber] = ?",
+                    (product['SanitizedItemNumber'],)
+                )
+                product[field] = [dict(zip(child_columns, child_row)) for child_row in child.fetchall()]
+                child.close()
+            f.write(json.dumps(product, ensure_ascii=False) + '\n')
+    conn.close()
+
+def canonical(products):
+    return sorted(json.dumps(product, sort_keys=True) for product in products)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark N+1 vs set-based product export")
+    parser.add_argument('--products', type=int, default=20000, help="Products in the synthetic database")
+    parser.add_argument('--round-trip-ms', type=float, default=0.5, help="Simulated latency per query / fetch")
+    parser.add_argument('--fetch-size', type=int, default=5000, help="Rows per fetchmany in the set-based export")
+    parser.add_argument('--partitions', type=int, default=8, help="Key ranges in the partitioned export")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent partitions")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Export Benchmark: N+1 queries vs set-based streams vs partitioned")
+    print("="*60)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        db_path = tmp / 'catalog.sqlite3'
+        products, specs, data = build_database(db_path, args.products)
+        print(f"SQLite stand-in: {products} products, {specs} specifications, {data} product data rows")
+        print(f"Simulated round trip: {args.round_trip_ms} ms\n")
+
+        results = {}
+        source = LatencySqliteSource(db_path, args.round_trip_ms)
+        started = time.perf_counter()
+        export_n_plus_one(source, tmp / 'n_plus_one.jsonl')
+        results['n+1'] = (time.perf_counter() - started, source.round_trips, list(iter_products(tmp / 'n_plus_one.jsonl')))
+
+        source = LatencySqliteSource(db_path, args.round_trip_ms)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            export_products(source=source, output_dir=tmp, fetch_size=args.fetch_size)
+        results['set-based'] = (time.perf_counter() - started, source.round_trips, list(iter_products(tmp / 'products_export')))
+
+        source = LatencySqliteSource(db_path, args.round_trip_ms)
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            export_products(source=source, output_dir=tmp / 'partitioned', fetch_size=args.fetch_size,
+                            partitions=args.partitions, workers=args.workers)
+        results['partitioned'] = (time.perf_counter() - started, source.round_trips,
+                                  list(iter_products(tmp / 'partitioned' / 'products_export')))
+        print(f"Partitioned: {args.partitions} key ranges, {args.workers} workers\n")
+
+        for name, (seconds, round_trips, exported) in results.items():
+            print(f"{name:<11} {len(exported):>7} products  {round_trips:>8} round trips  "
+                  f"{seconds:7.2f} s  ({len(exported) / seconds:,.0f} products/s)")
+
+        expected = canonical(results['n+1'][2])
+        same = all(canonical(exported) == expected for _, _, exported in results.values())
+        print(f"\nIdentical products, specifications and data: {'yes' if same else 'NO'}")
+        print(f"Speedup: {results['n+1'][0] / results['set-based'][0]:.1f}x set-based, "
+              f"{results['n+1'][0] / results['partitioned'][0]:.1f}x partitioned")
+
+if __name__ == "__main__":
+    main()
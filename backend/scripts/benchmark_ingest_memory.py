@@ -0,0 +1,130 @@
+"""
+Ingest memory benchmark: json.load of the whole export vs the streaming product reader
+Writes a synthetic products_joined.json (same layout as export_data.py), then reads it in
+batches of --batch-size both ways, each in a fresh subprocess, and prints peak resident memory
+
+Run: python scripts/benchmark_ingest_memory.py [--products 100000] [--batch-size 1000]
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def synthetic_product(i, rng):
+    """A product shaped like an export row: multilingual descriptions, filter metadata, specs"""
+    diameter = rng.choice([160, 180, 200, 250, 300, 350])
+    return {
+        'Id': i,
+        'SanitizedItemNumber': f'W{381000 + i}-{rng.randint(1000000, 9999999)}',
+        'Ean': str(5700000000000 + i),
+        'MetaClass': rng.choice(['SAWBLADES', 'DRILLS', 'CALIPERS', 'ROUTER_BITS']),
+        'ItemDescriptionSerialized': json.dumps({
+            'da': f'Rundsavklinge HM {diameter}x30 Z{rng.choice([24, 48, 60])} til træ',
+            'en': f'Circular saw blade TCT {diameter}x30 T{rng.choice([24, 48, 60])} for wood',
+        }, ensure_ascii=False),
+        'ItemDescription2Serialized': json.dumps({'en': 'Professional quality, long service life ' * 3}),
+        'FilterMetaDataSerialized': json.dumps({
+            'SAW_DIAMETER': str(diameter), 'SAW_BORE': '30', 'SAW_TEETH': str(rng.choice([24, 48, 60])),
+        }),
+        'CuttingFilterMetaDataSerialized': json.dumps({'CUT_MATERIAL': {'da': 'Træ', 'en': 'Wood'}}),
+        'MarketsSerialized': '["001","002"]',
+        'IsDeleted': 0,
+        'Parent': 'sales',
+        'specifications': [
+            {'Type': f'SPEC_{n}', 'Data': json.dumps({'Diameter (mm)': {'value': str(diameter), 'type': 'number'}})}
+            for n in range(4)
+        ],
+        'product_data': [{'Type': 'Text', 'Content': 'Suitable for hardwood, softwood and chipboard. ' * 4}],
+    }
+
+def write_synthetic_export(path, products, seed=42):
+    """Write the export incrementally (the generator itself must not hold the catalog)"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n  "products": [\n')
+        for i in range(products):
+            if i:
+                f.write(',\n')
+            f.write(json.dumps(synthetic_product(i, rng), indent=2, ensure_ascii=False))
+        meta_fields = [{'MetaClass': f'SPEC_{n}', 'FieldName': f'Field {n}'} for n in range(200)]
+        f.write('\n  ],\n  "meta_fields": ')
+        f.write(json.dumps(meta_fields, indent=2, ensure_ascii=False))
+        f.write('\n}')
+
+def consume(batch):
+    """Stand-in for per-batch ingest work: touch every product"""
+    return sum(len(product.get('ItemDescriptionSerialized', '')) for product in batch)
+
+def run_scenario(name, path, batch_size):
+    """Read the export one way and print peak RSS delta (runs inside a subprocess)"""
+    from services.product_reader import iter_batches, iter_products, load_meta_fields
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    products = 0
+    if name == 'json.load':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        meta_fields = data.get('meta_fields', [])
+        all_products = data.get('products', [])
+        for i in range(0, len(all_products), batch_size):
+            batch = all_products[i:i+batch_size]
+            consume(batch)
+            products += len(batch)
+    else:
+        meta_fields = load_meta_fields(path)
+        for batch in iter_batches(iter_products(path), batch_size):
+            consume(batch)
+            products += len(batch)
+    print(f"{peak_rss_mb() - baseline:.1f} {time.perf_counter() - started:.2f} {products} {len(meta_fields)}")
+
+def measure(name, path, batch_size):
+    output = subprocess.run(
+        [sys.executable, __file__, '--scenario', name, '--path', str(path), '--batch-size', str(batch_size)],
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    delta, seconds, products, meta_fields = output.split()
+    return float(delta), float(seconds), int(products), int(meta_fields)
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of json.load vs streaming ingest")
+    parser.add_argument('--products', type=int, default=100000, help="Products in the synthetic export")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Products per ingest batch")
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args.path, args.batch_size)
+        return
+
+    print("="*60)
+    print("Ingest memory: json.load vs streaming reader")
+    print("="*60)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'products_joined.json'
+        print(f"Writing synthetic export with {args.products} products...")
+        write_synthetic_export(path, args.products)
+        print(f"Export size: {path.stat().st_size / 1e6:.1f} MB, batch size {args.batch_size}\n")
+
+        results = {}
+        for name in ('json.load', 'streaming'):
+            results[name] = measure(name, path, args.batch_size)
+            delta, seconds, products, meta_fields = results[name]
+            print(f"{name:<10} peak +{delta:8.1f} MB RSS, {seconds:6.2f} s "
+                  f"({products} products, {meta_fields} meta fields)")
+
+    ratio = results['json.load'][0] / max(results['streaming'][0], 0.1)
+    print(f"\nPeak RSS reduction: {results['json.load'][0] - results['streaming'][0]:.1f} MB ({ratio:.0f}x less)")
+
+if __name__ == "__main__":
+    main()
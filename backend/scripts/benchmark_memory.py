@@ -0,0 +1,77 @@
+"""
+Memory report for the shared model/index registry
+Loads the embedding model and Chroma client the old way (one copy per service) and
+through the registry, each in a fresh subprocess, and prints resident memory (RSS)
+
+Run: python scripts/benchmark_memory.py
+"""
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+CHROMA_DIR = './scripts/scripts/chroma_db'
+
+def rss_mb():
+    """Current resident set size in MB (Linux /proc, falls back to peak RSS elsewhere)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_scenario(name):
+    """Load both services' model + client and print RSS (runs inside a subprocess)"""
+    baseline = rss_mb()
+    started = time.perf_counter()
+    if name == 'separate':
+        # What EmbeddingService + LangChainService used to do
+        import chromadb
+        from sentence_transformers import SentenceTransformer
+        models = [SentenceTransformer(MODEL_NAME, device='cpu') for _ in range(2)]
+        clients = [chromadb.PersistentClient(path=CHROMA_DIR) for _ in range(2)]
+        for model in models:
+            model.encode(["warm-up query"])
+    else:
+        from services.embeddings import EmbeddingService
+        from services.model_registry import SharedEncoderEmbeddings, get_chroma_client
+        service = EmbeddingService()
+        embeddings = SharedEncoderEmbeddings(MODEL_NAME)
+        client = get_chroma_client(CHROMA_DIR)
+        service.encode_text("warm-up query")
+        embeddings.embed_query("warm-up query")
+    print(f"{rss_mb() - baseline:.1f} {rss_mb():.1f} {time.perf_counter() - started:.2f}")
+
+def measure(name):
+    output = subprocess.run(
+        [sys.executable, __file__, '--scenario', name],
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    delta, total, seconds = (float(x) for x in output.split())
+    return delta, total, seconds
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--scenario':
+        run_scenario(sys.argv[2])
+        sys.exit(0)
+
+    print("="*60)
+    print("Memory report: separate copies vs shared registry")
+    print("="*60)
+    results = {}
+    for name in ('separate', 'shared'):
+        results[name] = measure(name)
+        delta, total, seconds = results[name]
+        print(f"{name:<10} +{delta:7.1f} MB loaded (RSS {total:7.1f} MB), load time {seconds:.2f} s")
+    saving = results['separate'][0] - results['shared'][0]
+    print(f"\nRSS saved by sharing: {saving:.1f} MB")
@@ -0,0 +1,143 @@
+"""
+Embedding backend benchmark: SentenceTransformer (torch) vs int8 ONNX Runtime
+Each backend runs in a fresh subprocess (so load time and RSS are its own) and encodes the
+same synthetic product texts. Prints load time, memory (model loaded / RSS after the batch),
+single-query latency (p50/p95), batch throughput, and how close the int8 vectors are to the
+torch ones (cosine similarity).
+The ONNX model is exported on first use (needs the onnx package).
+
+Run: python scripts/benchmark_onnx_encoder.py [--products 2000] [--queries 200] [--threads 0]
+"""
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from scripts.benchmark_memory import rss_mb
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+BACKENDS = ('torch', 'onnx')
+QUERIES = [
+    'circular saw blade for wood 250 mm', 'digital caliper', 'diamond cutting disc 125',
+    'HSS drill bit set', 'router bit 12 mm shank', 'savklinge til aluminium', 'grinding disc grit 60',
+]
+# Parity below this mean cosine similarity gets a warning
+MIN_COSINE = 0.99
+
+def synthetic_texts(count, rng):
+    """Product texts of roughly the length setup_embeddings.py builds"""
+    from scripts.benchmark_ingest_memory import synthetic_product
+    texts = []
+    for i in range(count):
+        product = synthetic_product(i, rng)
+        parts = [f"{key}: {value}" for key, value in product.items() if isinstance(value, (str, int, float))]
+        texts.append(" | ".join(parts)[:2000])
+    return texts
+
+def run_scenario(backend, texts_path, vectors_path, queries, threads):
+    """Load one backend, encode queries and texts, print timings as JSON (runs inside a subprocess)"""
+    if threads:
+        os.environ['ONNX_THREADS'] = str(threads)
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    with open(texts_path, 'r', encoding='utf-8') as f:
+        texts = json.load(f)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    # What get_encoder() loads for the backend, without the Chroma client next to it
+    if backend == 'onnx':
+        from services.onnx_encoder import load_onnx_encoder
+        model = load_onnx_encoder(MODEL_NAME)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME, device='cpu')
+    model.encode(["warm-up query"])
+    load_seconds = time.perf_counter() - started
+    loaded_mb = rss_mb() - baseline
+    if threads and backend == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        model.encode(QUERIES[i % len(QUERIES)], convert_to_tensor=False)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=32, convert_to_tensor=False), dtype=np.float32)
+    batch_seconds = time.perf_counter() - started
+    np.save(vectors_path, vectors)
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'loaded_mb': loaded_mb,
+        # After the batch run, including activation buffers
+        'rss_mb': rss_mb(),
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p95_ms': float(np.percentile(latencies, 95)) * 1000,
+        'texts_per_second': len(texts) / batch_seconds,
+    }))
+
+def measure(backend, texts_path, vectors_path, queries, threads):
+    output = subprocess.run(
+        [sys.executable, __file__, '--scenario', backend, '--texts', texts_path, '--vectors', vectors_path,
+         '--queries', str(queries), '--threads', str(threads)],
+        capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return json.loads(output)
+
+def main():
+    parser = argparse.ArgumentParser(description="torch vs int8 ONNX Runtime embedding backend")
+    parser.add_argument('--products', type=int, default=2000, help="Synthetic product texts to encode")
+    parser.add_argument('--queries', type=int, default=200, help="Single-query encodes timed for latency")
+    parser.add_argument('--threads', type=int, default=0, help="Intra-op threads (0 = library default)")
+    parser.add_argument('--scenario', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--texts', help=argparse.SUPPRESS)
+    parser.add_argument('--vectors', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args.scenario, args.texts, args.vectors, args.queries, args.threads)
+        return
+
+    print("="*60)
+    print("Embedding backend: torch vs int8 ONNX Runtime")
+    print("="*60)
+    texts = synthetic_texts(args.products, random.Random(42))
+    print(f"{MODEL_NAME}, {len(texts)} texts (avg {sum(map(len, texts)) / len(texts):.0f} chars), "
+          f"{args.queries} single queries, {os.cpu_count()} CPUs\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_path = os.path.join(tmp, 'texts.json')
+        with open(texts_path, 'w', encoding='utf-8') as f:
+            json.dump(texts, f)
+        results, vectors = {}, {}
+        for backend in BACKENDS:
+            vectors_path = os.path.join(tmp, f'{backend}.npy')
+            results[backend] = result = measure(backend, texts_path, vectors_path, args.queries, args.threads)
+            vectors[backend] = np.load(vectors_path)
+            print(f"{backend:<6} load {result['load_seconds']:6.2f} s  +{result['loaded_mb']:6.1f} MB loaded "
+                  f"(RSS {result['rss_mb']:6.1f} MB after batch)  query p50 {result['p50_ms']:6.2f} ms / "
+                  f"p95 {result['p95_ms']:6.2f} ms  batch {result['texts_per_second']:8,.0f} texts/s")
+
+    torch_result, onnx_result = results['torch'], results['onnx']
+    print(f"\nSpeedup: query p50 {torch_result['p50_ms'] / onnx_result['p50_ms']:.2f}x, "
+          f"batch {onnx_result['texts_per_second'] / torch_result['texts_per_second']:.2f}x, "
+          f"{torch_result['loaded_mb'] - onnx_result['loaded_mb']:.1f} MB less loaded")
+
+    a, b = vectors['torch'], vectors['onnx']
+    cosine = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    marker = '[OK]' if cosine.mean() >= MIN_COSINE else '[WARN]'
+    print(f"{marker} Cosine similarity torch vs int8: mean {cosine.mean():.4f}, min {cosine.min():.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Retrieval benchmark: pure MMR vs hybrid BM25 + vector (reciprocal rank fusion)
+Reports recall@k and latency for the product retriever used by LangChainService
+
+Queries come from --queries (JSON lines: {"query": "...", "expected": ["ITEM-NUMBER", ...]})
+or are generated from a sample of the indexed products: the item number, the EAN and the
+product description, each expected to find its own product.
+
+Run from backend/: python scripts/benchmark_retrieval.py [--sample 200] [--queries file.jsonl]
+"""
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_community.vectorstores import Chroma
+
+from services.bm25_index import BM25_INDEX_PATH, build_from_collection, get_bm25_index
+from services.model_registry import SharedEncoderEmbeddings, get_chroma_client
+from services.product_retriever import ProductRetriever
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+CHROMA_DIR = './scripts/scripts/chroma_db'
+RECALL_AT = [1, 5, 10, 25]
+
+def load_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [dict(json.loads(line), kind='file') for line in f if line.strip()]
+
+def generate_queries(collection, sample, seed=42):
+    """Item number, EAN and description queries for a random sample of products"""
+    total = collection.count()
+    random.seed(seed)
+    offsets = random.sample(range(total), min(sample, total))
+    queries = []
+    for offset in offsets:
+        page = collection.get(limit=1, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            continue
+        item_number, metadata = page["ids"][0], page["metadatas"][0] or {}
+        queries.append({"query": f"Do you have {item_number}?", "expected": [item_number], "kind": "item_number"})
+        if metadata.get('ean'):
+            queries.append({"query": f"EAN {metadata['ean']}", "expected": [item_number], "kind": "ean"})
+        if metadata.get('description'):
+            queries.append({"query": metadata['description'], "expected": [item_number], "kind": "description"})
+    return queries
+
+def run(retriever, queries):
+    """Rank of the first expected product (None if missed) and latency per query"""
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        documents = retriever.retrieve(query["query"])
+        elapsed = time.perf_counter() - started
+        ranked = [doc.metadata.get('item_number') for doc in documents]
+        rank = next((i + 1 for i, item in enumerate(ranked) if item in query["expected"]), None)
+        results.append((query["kind"], rank, elapsed))
+    return results
+
+def summarize(name, results):
+    kinds = sorted({kind for kind, _, _ in results})
+    for kind in ['all'] + kinds:
+        rows = [r for r in results if kind == 'all' or r[0] == kind]
+        recall = "  ".join(
+            f"R@{k}={sum(1 for _, rank, _ in rows if rank and rank <= k) / len(rows):.2f}" for k in RECALL_AT
+        )
+        latencies = sorted(elapsed * 1000 for _, _, elapsed in rows)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"  {name:<7} {kind:<12} n={len(rows):<5} {recall}  "
+            f"latency p50={statistics.median(latencies):.1f} ms p95={p95:.1f} ms"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pure MMR vs hybrid BM25 + vector retrieval")
+    parser.add_argument('--queries', help="JSON lines file with query / expected item numbers")
+    parser.add_argument('--sample', type=int, default=200, help="Products to generate queries from")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Retrieval Benchmark: MMR vs Hybrid (BM25 + RRF)")
+    print("="*60)
+
+    vectorstore = Chroma(
+        client=get_chroma_client(CHROMA_DIR),
+        embedding_function=SharedEncoderEmbeddings(MODEL_NAME),
+        collection_name="products"
+    )
+    collection = vectorstore._collection
+    print(f"Collection: {collection.count()} products")
+
+    bm25_path = os.getenv("BM25_INDEX_PATH", BM25_INDEX_PATH)
+    if not Path(bm25_path).exists():
+        print(f"No BM25 index at {bm25_path} - building it from the collection...")
+        build_from_collection(collection, bm25_path)
+    started = time.perf_counter()
+    index = get_bm25_index()
+    print(f"BM25 index: {index.n_docs} documents, {index.n_terms} terms "
+          f"(mapped in {(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    queries = load_queries(args.queries) if args.queries else generate_queries(collection, args.sample)
+    print(f"Queries: {len(queries)}\n")
+
+    vector = ProductRetriever(vectorstore)
+    vector.mode = "vector"
+    hybrid = ProductRetriever(vectorstore)
+    hybrid.mode = "hybrid"
+
+    # Warm up the encoder and the HNSW index so the first query is not measured cold
+    vector.retrieve("warm-up query")
+    hybrid.retrieve("warm-up query")
+
+    summarize("mmr", run(vector, queries))
+    summarize("hybrid", run(hybrid, queries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Rich-text building benchmark: prepare_product() serially vs in a process pool
+Builds a synthetic catalog (same product shape as benchmark_ingest_memory.py), prepares it
+with 1, 2, 4, ... processes and prints products/second and the speedup over one process.
+Also checks that every worker count produces the same texts and metadata in the same order.
+
+Run: python scripts/benchmark_text_building.py [--products 20000] [--max-workers 8]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from scripts.benchmark_ingest_memory import synthetic_product
+from scripts.setup_embeddings import PREPARE_CHUNK_SIZE, ProductPreparer
+from services.product_reader import iter_batches
+
+def synthetic_meta_fields(count=200):
+    return [{'MetaClass': f'SPEC_{n}', 'FieldName': f'Field {n}'} for n in range(count)] + [
+        {'MetaClass': 'SAW_DIAMETER', 'FieldName': 'Diameter (mm)'},
+        {'MetaClass': 'SAW_BORE', 'FieldName': 'Bore (mm)'},
+        {'MetaClass': 'SAW_TEETH', 'FieldName': 'Number of teeth'},
+        {'MetaClass': 'CUT_MATERIAL', 'FieldName': 'Material'},
+    ]
+
+def run(products, meta_fields, workers, batch_size, chunk_size):
+    """Prepare all products; returns (seconds, prepared list)"""
+    prepared = []
+    started = time.perf_counter()
+    with ProductPreparer(meta_fields, workers, chunk_size=chunk_size) as preparer:
+        for _, batch_prepared in preparer.prepare_batches(iter_batches(products, batch_size)):
+            prepared.extend(batch_prepared)
+    return time.perf_counter() - started, prepared
+
+def main():
+    parser = argparse.ArgumentParser(description="Products/second of rich-text building by process count")
+    parser.add_argument('--products', type=int, default=20000, help="Products in the synthetic catalog")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1, help="Largest process count")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Products per ingest batch")
+    parser.add_argument('--chunk-size', type=int, default=PREPARE_CHUNK_SIZE, help="Products per work unit")
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Rich-text building: serial vs process pool")
+    print("="*60)
+    rng = random.Random(42)
+    products = [synthetic_product(i, rng) for i in range(args.products)]
+    meta_fields = synthetic_meta_fields()
+    print(f"{len(products)} synthetic products, {len(meta_fields)} meta fields, "
+          f"batches of {args.batch_size}, work units of {args.chunk_size}, {os.cpu_count()} CPUs\n")
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    baseline_seconds, baseline = None, None
+    for workers in worker_counts:
+        seconds, prepared = run(products, meta_fields, workers, args.batch_size, args.chunk_size)
+        if baseline is None:
+            baseline_seconds, baseline = seconds, prepared
+        same = 'same output' if prepared == baseline else 'OUTPUT DIFFERS'
+        print(f"{workers:>3} process{'es' if workers > 1 else '  '}  {seconds:7.2f} s  "
+              f"{len(products) / seconds:>9,.0f} products/s  {baseline_seconds / seconds:5.2f}x  ({same})")
+
+if __name__ == "__main__":
+    main()
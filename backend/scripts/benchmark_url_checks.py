@@ -0,0 +1,111 @@
+"""
+Benchmark product URL validation against a local stub HTTP server
+Compares the old serial HEAD/GET loop with the pooled concurrent validator
+
+Run: python scripts/benchmark_url_checks.py [--items 50] [--rtt 0.1]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.url_validator import ProductUrlValidator
+
+
+def serve_stub_site(rtt, port_queue):
+    """Serve a stub product site; odd item numbers exist, even ones return 404"""
+
+    async def handle(reader, writer):
+        # Minimal HTTP/1.1 keep-alive handler: one request per loop iteration
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                method, path, _ = request_line.decode().split(" ", 2)
+                await asyncio.sleep(rtt)
+                item = path.rstrip("/").rsplit("/", 1)[-1]
+                status = "200 OK" if item.isdigit() and int(item) % 2 else "404 Not Found"
+                body = b"<html>product</html>"
+                head = f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                writer.write(head if method == "HEAD" else head + body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=256)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_stub_server(rtt):
+    """Run the stub site in its own process so it does not share the GIL with the client"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_stub_site, args=(rtt, port_queue), daemon=True)
+    process.start()
+    return process, port_queue.get(timeout=10)
+
+
+async def serial_check(base, items):
+    """Previous implementation: new client per batch, one item at a time, HEAD then GET on any error"""
+    results = {}
+    async with httpx.AsyncClient(timeout=httpx.Timeout(5.0), follow_redirects=True) as client:
+        for item in items:
+            resp = await client.head(f"{base}/{item}")
+            if resp.status_code >= 400:
+                resp = await client.get(f"{base}/{item}")
+            results[item] = resp.status_code < 400
+    return results
+
+
+async def run_benchmark(n_items, rtt):
+    server, port = start_stub_server(rtt)
+    base = f"http://127.0.0.1:{port}/en-dk/product-detail"
+    items = [str(i) for i in range(1, n_items + 1)]
+
+    print("=" * 60)
+    print(f"URL validation benchmark: {n_items} items, stub RTT {rtt * 1000:.0f} ms")
+    print("=" * 60)
+
+    started = time.perf_counter()
+    serial = await serial_check(base, items)
+    serial_time = time.perf_counter() - started
+    print(f"\nSerial HEAD/GET loop:   {serial_time:.2f} s ({serial_time / rtt:.1f} x RTT)")
+
+    validator = ProductUrlValidator(max_in_flight=n_items, batch_deadline=30.0)
+    started = time.perf_counter()
+    concurrent = await validator.check(base, items)
+    concurrent_time = time.perf_counter() - started
+    print(f"Concurrent validator:   {concurrent_time:.2f} s ({concurrent_time / rtt:.1f} x RTT)")
+
+    # Second batch reuses the warm keep-alive pool
+    started = time.perf_counter()
+    await validator.check(base, items)
+    warm_time = time.perf_counter() - started
+    print(f"Concurrent (warm pool): {warm_time:.2f} s ({warm_time / rtt:.1f} x RTT)")
+    await validator.aclose()
+
+    server.terminate()
+    print(f"\nResults identical: {serial == concurrent}")
+    print(f"Speedup: {serial_time / concurrent_time:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rtt", type=float, default=0.1, help="Simulated round-trip time in seconds")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.items, args.rtt))
@@ -0,0 +1,121 @@
+"""
+Build the offline product availability index
+Checks every SanitizedItemNumber in the product export ahead of time so the API
+can filter product links with a set lookup instead of live HTTP checks
+
+Run: python scripts/build_availability_index.py [--url-list sitemap.xml] [--max-in-flight 50]
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.availability_index import write_availability_index
+from services.product_reader import find_deltas, find_export, iter_products_with_deltas
+from services.url_validator import ProductUrlValidator
+
+SITE_HOST = 'www.kyocera-unimerco.com'
+DEFAULT_LOCALE = 'en-dk'
+INDEX_PATH = './scripts/scripts/availability_index.json'
+
+def load_item_numbers():
+    """Load all SanitizedItemNumbers from the exported data"""
+    data_dir = Path(__file__).parent.parent / 'data'
+    data_file = find_export(data_dir)
+    if data_file is None:
+        print(f"\n❌ Error: No product export found in {data_dir}")
+        print("\nPlease run 'python scripts/export_data.py' first to export data from SSMS")
+        return None
+
+    print(f"\nLoading item numbers from {data_file}...")
+    products = iter_products_with_deltas(data_file, find_deltas(data_dir))
+    item_numbers = (p.get('SanitizedItemNumber') for p in products)
+    return list(dict.fromkeys(item for item in item_numbers if item))
+
+def read_url_list(url_list_file):
+    """
+    Read item numbers from a sitemap XML or a plain URL list (one URL or item number per line)
+    """
+    text = Path(url_list_file).read_text(encoding='utf-8')
+    if '<loc>' in text:
+        entries = re.findall(r'<loc>\s*([^<\s]+)\s*</loc>', text)
+    else:
+        entries = [line.strip() for line in text.splitlines() if line.strip()]
+
+    found = set()
+    for entry in entries:
+        if '/product-detail/' in entry:
+            entry = entry.split('/product-detail/', 1)[1]
+        entry = entry.split('?', 1)[0].split('#', 1)[0].strip('/')
+        if entry and '/' not in entry:
+            found.add(entry)
+    return found
+
+async def crawl(item_numbers, max_in_flight, chunk_size=1000):
+    """Check every product page with bounded concurrency (None = unknown, see ProductUrlValidator)"""
+    validator = ProductUrlValidator(max_in_flight=max_in_flight, batch_deadline=600.0)
+    base = f"https://{SITE_HOST}/{DEFAULT_LOCALE}/product-detail"
+    results = {}
+    try:
+        for i in range(0, len(item_numbers), chunk_size):
+            chunk = item_numbers[i:i+chunk_size]
+            results.update(await validator.check(base, chunk))
+            print(f"  Progress: {len(results)}/{len(item_numbers)} products checked")
+    finally:
+        await validator.aclose()
+    return results
+
+def build_availability_index(url_list=None, max_in_flight=50):
+    """Main function to build the availability index"""
+    print("="*60)
+    print("Building Product Availability Index")
+    print("="*60)
+
+    item_numbers = load_item_numbers()
+    if item_numbers is None:
+        return
+    print(f"Loaded {len(item_numbers)} item numbers")
+
+    started = time.perf_counter()
+    if url_list:
+        print(f"\nImporting product URLs from {url_list}...")
+        listed = read_url_list(url_list)
+        # A sitemap only says which pages exist - unlisted items stay unknown and are checked live
+        results = {item: True for item in item_numbers if item in listed}
+        source = f"url-list:{Path(url_list).name}"
+    else:
+        print(f"\nChecking {SITE_HOST} with up to {max_in_flight} requests in flight...")
+        results = asyncio.run(crawl(item_numbers, max_in_flight))
+        source = "crawl"
+
+    path = write_availability_index(INDEX_PATH, SITE_HOST, DEFAULT_LOCALE, results, source)
+    available = sum(1 for ok in results.values() if ok)
+    unavailable = sum(1 for ok in results.values() if ok is False)
+    unknown = len(item_numbers) - available - unavailable
+
+    print("\n" + "="*60)
+    print("✅ Availability Index Created!")
+    print("="*60)
+    print(f"Available product pages: {available}/{len(item_numbers)}")
+    print(f"Unavailable (404/410): {unavailable}")
+    if unknown:
+        print(f"[WARN] {unknown} items left out of the index (not listed, errors or timeouts) - checked live instead")
+    print(f"Time taken: {time.perf_counter() - started:.1f} s")
+    print(f"Index written to: {path}")
+    print("\nRestart the API server to load the new index.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the offline product availability index")
+    parser.add_argument('--url-list', help="Sitemap XML or text file with product URLs / item numbers")
+    parser.add_argument('--max-in-flight', type=int, default=50, help="Concurrent requests when crawling")
+    args = parser.parse_args()
+
+    try:
+        build_availability_index(url_list=args.url_list, max_in_flight=args.max_in_flight)
+    except Exception as e:
+        print(f"\n❌ Error building availability index: {e}")
+        import traceback
+        traceback.print_exc()
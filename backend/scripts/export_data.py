@@ -2,10 +2,31 @@
 One-time data export from SSMS with JOINs to preserve table relationships
 Run this script once to export all product data from the database
 """
-import pyodbc
+import argparse
 import json
 import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.export_source import (
+    DEFAULT_FETCH_SIZE, ConnectionPool, SqlServerSource, iter_joined_products, iter_rows, iter_tombstones,
+    max_watermark, merge_key, partition_bounds
+)
+from services.export_writer import (
+    DEFAULT_SHARD_SIZE, DELTA_DIR_NAME, EXPORT_DIR_NAME, LEGACY_EXPORT_NAME, JsonExportWriter,
+    PartitionedExportWriter, ShardedExportWriter, json_default
+)
+
+# High-water mark of the last export, for --delta
+EXPORT_STATE_NAME = 'export_state.json'
+# Products columns that change on every update, in order of preference
+WATERMARK_COLUMNS = ['UpdateIndex', 'Timestamp']
+# Partition workers for --partitions (each holds up to three connections)
+DEFAULT_WORKERS = 4
 
 def decode_unicode(text):
     """Decode Unicode escape sequences (e.g., \\u00E6 to æ)"""
@@ -17,24 +38,32 @@ def decode_unicode(text):
     except:
         return text
 
-def get_db_connection():
-    """Create database connection (configured inline, no .env required)"""
+def get_connection_string():
+    """Database connection string (configured inline, no .env required)"""
     
     # ⚠️ Choose your database: 'dbcopy' or 'dbcopy1'
     database = 'dbcopy1'  # Change to 'dbcopy1' if that's the one you want
     
     # Using Windows Authentication (works since --list-databases succeeded)
-    connection_string = (
+    return (
         f"DRIVER={{ODBC Driver 17 for SQL Server}};"
         f"Server=DESKTOP-U33UF27\\SQLEXPRESS;"
         f"Database={database};"
         f"Trusted_Connection=yes;"
         f"TrustServerCertificate=yes;"
     )
-    return pyodbc.connect(connection_string)
+
+def get_db_connection():
+    """Create database connection"""
+    return get_source().connect()
+
+def get_source():
+    """The SQL Server the export reads from"""
+    return SqlServerSource(get_connection_string())
 
 def list_available_databases():
     """List all available databases on the server"""
+    import pyodbc
     server = 'localhost\\SQLEXPRESS'
     try:
         # Connect to master database to list all databases
@@ -58,145 +87,198 @@ def list_available_databases():
         print(f"❌ Could not list databases: {e}")
         print("Make sure SQL Server is running and you have access\n")
 
-def get_table_columns(table_name):
+def get_table_columns(source, conn, table_name):
     """Get all columns for a specific table"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"""
-            SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = '{table_name}' 
-            ORDER BY ORDINAL_POSITION
-        """)
         columns = []
         print(f"\n📋 Columns in {table_name} table:")
-        for row in cursor.fetchall():
-            columns.append(row.COLUMN_NAME)
-            print(f"   - {row.COLUMN_NAME} ({row.DATA_TYPE}, nullable={row.IS_NULLABLE})")
-        cursor.close()
-        conn.close()
+        for name, data_type, nullable in source.table_columns(conn, table_name):
+            columns.append(name)
+            print(f"   - {name} ({data_type}, nullable={nullable})")
         return columns
     except Exception as e:
         print(f"❌ Could not get columns for {table_name}: {e}")
         return []
 
-def export_products():
-    """Export products with all related data (JOINs) - auto-detects columns"""
+def load_export_state(output_dir):
+    """Watermark of the last export, or None if there has not been one"""
+    try:
+        with open(Path(output_dir) / EXPORT_STATE_NAME, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # rowversion (Timestamp) watermarks are stored as hex
+    if state.get('watermark_binary') and state.get('watermark') is not None:
+        state['watermark'] = bytes.fromhex(state['watermark'])
+    return state
+
+def format_watermark(value):
+    return value.hex() if isinstance(value, (bytes, bytearray)) else value
+
+def save_export_state(output_dir, state):
+    path = Path(output_dir) / EXPORT_STATE_NAME
+    state = dict(state, watermark_binary=isinstance(state.get('watermark'), (bytes, bytearray)))
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, default=json_default)
+    os.replace(tmp_path, path)
+
+def export_partitions(source, writer, plan, products_columns, specs_columns, data_columns, id_column,
+                      fetch_size=DEFAULT_FETCH_SIZE, workers=DEFAULT_WORKERS):
+    """
+    Export the partitions of plan that are not checkpointed yet, `workers` at a time
+    A failed partition does not stop the others, so a rerun only repeats the failed ones
+    """
+    bounds = plan['bounds']
+    pending = [index for index in range(len(bounds)) if not writer.is_done(index)]
+    if len(pending) < len(bounds):
+        print(f"Resuming: {len(bounds) - len(pending)} of {len(bounds)} partitions already exported "
+              f"({writer.rows} products)")
+    pool = ConnectionPool(source)
+
+    def export_partition(index):
+        key_range = (bounds[index], bounds[index + 1] if index + 1 < len(bounds) else None)
+        products = iter_joined_products(pool, products_columns, specs_columns, data_columns, id_column=id_column,
+                                        fetch_size=fetch_size, key_range=key_range)
+        return writer.write_partition(index, products)
+
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(export_partition, index): index for index in pending}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failed.append(index)
+                    print(f"  ❌ Partition {index + 1}/{len(bounds)} failed: {e}")
+                    continue
+                print(f"  Partition {index + 1}/{len(bounds)}: {entry['rows']} products "
+                      f"({writer.rows} written)")
+    finally:
+        pool.close()
+    print(f"Connections opened: {pool.opened}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(bounds)} partitions failed - "
+                           f"run the export again to resume with the missing ones")
+
+def export_products(output_format='sharded', shard_size=DEFAULT_SHARD_SIZE, compress=True,
+                    source=None, output_dir=None, fetch_size=DEFAULT_FETCH_SIZE, delta=False,
+                    partitions=None, workers=DEFAULT_WORKERS, restart=False):
+    """
+    Export products with all related data (JOINs) - auto-detects columns
+    
+    Products are written as they are fetched: output_format='sharded' writes
+    data/products_export/ (JSON Lines shards + manifest), 'json' the legacy products_joined.json.
+    source defaults to the SQL Server (see get_source), a SqliteSource works the same way.
+    
+    delta=True exports only products whose UpdateIndex/Timestamp passed the watermark of the
+    last export, plus tombstones for products that were deleted or left the export filter,
+    to data/products_delta/<name>/ (apply with 'setup_embeddings.py --apply-delta').
+    
+    partitions=N splits a full sharded export into N key ranges exported concurrently by
+    `workers` threads, one shard each. Finished partitions are checkpointed, so rerunning
+    after a failure resumes with the rest (restart=True starts over).
+    """
+    if partitions and (delta or output_format == 'json'):
+        print("❌ Partitioned exports are full sharded exports (not --delta or --format json)")
+        return None
+    source = source or get_source()
     print("Connecting to database...")
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = source.connect()
     
     print("\n" + "="*60)
     print("Step 1: Discovering database schema...")
     print("="*60)
     
     # Get actual columns from Products table
-    products_columns = get_table_columns('Products')
+    products_columns = get_table_columns(source, conn, 'Products')
     if not products_columns:
         print("❌ Could not get Products table columns")
         return
     
     # Get columns from related tables
-    specs_columns = get_table_columns('ProductSpecifications')
-    data_columns = get_table_columns('ProductData')
-    meta_columns = get_table_columns('SimpleMetaFields')
+    specs_columns = get_table_columns(source, conn, 'ProductSpecifications')
+    data_columns = get_table_columns(source, conn, 'ProductData')
+    meta_columns = get_table_columns(source, conn, 'SimpleMetaFields')
     
     print("\n" + "="*60)
     print("Step 2: Exporting products with relationships...")
     print("="*60)
     
-    # Build dynamic query using actual columns
-    # Select all columns from Products
-    columns_str = ', '.join([f'p.[{col}]' for col in products_columns])
+    # Determine which column to use as ID (prefer SanitizedItemNumber)
+    id_column = 'SanitizedItemNumber' if 'SanitizedItemNumber' in products_columns else products_columns[0]
     
-    query = f"""
-    SELECT {columns_str}
-    FROM Products p
-    WHERE p.IsDeleted = 0
-    AND p.Parent != 'purchases'
-    AND p.MarketsSerialized LIKE '%001%'
-    """
+    output_dir = Path(output_dir) if output_dir else Path(__file__).parent.parent / 'data'
+    output_dir.mkdir(parents=True, exist_ok=True)
     
-    print(f"\nExecuting query with {len(products_columns)} columns...")
-    print(f"Sample columns: {', '.join(products_columns[:5])}...")
+    # Watermark taken before reading: rows changed during the export are picked up again next time
+    watermark_column = next((col for col in WATERMARK_COLUMNS if col in products_columns), None)
+    watermark = max_watermark(conn, watermark_column) if watermark_column else None
+    state = load_export_state(output_dir) or {}
+    changed_since = None
+    if delta:
+        if watermark_column is None or state.get('watermark_column') != watermark_column or state.get('watermark') is None:
+            print(f"❌ No {watermark_column or '/'.join(WATERMARK_COLUMNS)} watermark from a previous export "
+                  f"- run a full export first")
+            conn.close()
+            return None
+        changed_since = (watermark_column, state['watermark'])
+        print(f"\nDelta export: products with {watermark_column} > {format_watermark(state['watermark'])}")
     
-    cursor.execute(query)
-    products = []
+    print(f"\nStreaming {len(products_columns)} product columns ordered by '{id_column}', "
+          f"with specifications and data merged in (fetching {fetch_size} rows at a time)")
+    print(f"Sample columns: {', '.join(products_columns[:5])}...\n")
     
-    # Determine which column to use as ID (prefer SanitizedItemNumber)
-    id_column = 'SanitizedItemNumber' if 'SanitizedItemNumber' in products_columns else products_columns[0]
-    print(f"Using '{id_column}' as product ID\n")
+    if partitions:
+        writer = PartitionedExportWriter(output_dir / EXPORT_DIR_NAME, compress=compress)
+        schema = {'id_column': id_column, 'products_columns': products_columns, 'specs_columns': specs_columns,
+                  'data_columns': data_columns, 'partitions': partitions}
+        plan = None if restart else writer.resume(schema)
+        if plan is None:
+            plan = {'schema': schema, 'bounds': partition_bounds(conn, id_column, partitions),
+                    'watermark_column': watermark_column, 'watermark': format_watermark(watermark),
+                    'watermark_binary': isinstance(watermark, (bytes, bytearray))}
+            writer.start(plan)
+        elif plan['watermark_binary']:
+            # Keep the watermark of the interrupted run: later changes are left for the next delta
+            watermark = bytes.fromhex(plan['watermark'])
+        else:
+            watermark = plan['watermark']
+        print(f"Partitioned export: {len(plan['bounds'])} key ranges on '{id_column}', {workers} workers")
+        export_partitions(source, writer, plan, products_columns, specs_columns, data_columns, id_column,
+                          fetch_size=fetch_size, workers=workers)
+    elif delta:
+        state['deltas'] = state.get('deltas', 0) + 1
+        delta_name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{state['deltas']:04d}"
+        writer = ShardedExportWriter(output_dir / DELTA_DIR_NAME / delta_name, shard_size=shard_size, compress=compress)
+    elif output_format == 'json':
+        writer = JsonExportWriter(output_dir / LEGACY_EXPORT_NAME)
+    else:
+        writer = ShardedExportWriter(output_dir / EXPORT_DIR_NAME, shard_size=shard_size, compress=compress)
     
-    for row in cursor.fetchall():
-        # Build product dict dynamically from actual columns
-        product = {}
-        for i, col_name in enumerate(products_columns):
-            try:
-                product[col_name] = getattr(row, col_name)
-            except:
-                product[col_name] = row[i] if i < len(row) else None
-        
-        # Get ProductSpecifications for this product
-        if specs_columns:
-            spec_cursor = conn.cursor()
-            # Use first column of specs table as join key
-            join_col = specs_columns[0] if specs_columns else 'ItemNumber'
-            spec_cols_str = ', '.join([f'[{col}]' for col in specs_columns])
-            spec_query = f"""
-            SELECT {spec_cols_str}
-            FROM ProductSpecifications
-            WHERE [{join_col}] = ?
-            """
-            try:
-                spec_cursor.execute(spec_query, product.get(id_column))
-                specifications = []
-                for spec_row in spec_cursor.fetchall():
-                    spec_dict = {}
-                    for i, col_name in enumerate(specs_columns):
-                        try:
-                            spec_dict[col_name] = getattr(spec_row, col_name)
-                        except:
-                            spec_dict[col_name] = spec_row[i] if i < len(spec_row) else None
-                    specifications.append(spec_dict)
-                spec_cursor.close()
-                product['specifications'] = specifications
-            except Exception as e:
-                print(f"⚠️  Could not get specs for product {product.get(id_column)}: {e}")
-                product['specifications'] = []
-        
-        # Get ProductData for this product
-        if data_columns:
-            data_cursor = conn.cursor()
-            data_join_col = data_columns[0] if data_columns else 'ItemNumber'
-            data_cols_str = ', '.join([f'[{col}]' for col in data_columns])
-            data_query = f"""
-            SELECT {data_cols_str}
-            FROM ProductData
-            WHERE [{data_join_col}] = ?
-            """
-            try:
-                data_cursor.execute(data_query, product.get(id_column))
-                product_data = []
-                for data_row in data_cursor.fetchall():
-                    data_dict = {}
-                    for i, col_name in enumerate(data_columns):
-                        try:
-                            data_dict[col_name] = getattr(data_row, col_name)
-                        except:
-                            data_dict[col_name] = data_row[i] if i < len(data_row) else None
-                    product_data.append(data_dict)
-                data_cursor.close()
-                product['product_data'] = product_data
-            except Exception as e:
-                print(f"⚠️  Could not get data for product {product.get(id_column)}: {e}")
-                product['product_data'] = []
-        
-        products.append(product)
+    # Three ordered queries (products, specifications, data) instead of two queries per product
+    exported_keys = set()
+    if not partitions:
+        for product in iter_joined_products(source, products_columns, specs_columns, data_columns,
+                                            id_column=id_column, fetch_size=fetch_size, changed_since=changed_since):
+            writer.write(product)
+            if delta:
+                exported_keys.add(merge_key(product.get(id_column)))
+            if writer.rows % 10000 == 0:
+                print(f"  Progress: {writer.rows} products written")
     
-    cursor.close()
+    print(f"Exported {writer.rows} {'changed ' if delta else ''}products with relationships")
     
-    print(f"Exported {len(products)} products with relationships")
+    if delta:
+        # Changed rows that no longer pass the export filter (IsDeleted = 1, purchases, not market 001)
+        for item_number in iter_tombstones(source, changed_since, id_column=id_column, fetch_size=fetch_size):
+            # iter_tombstones skips keys the source still exports; this also covers keys that
+            # only differ in case or padding under a case-sensitive collation (SQLite)
+            if merge_key(item_number) not in exported_keys:
+                writer.write_tombstone(item_number)
+        print(f"Tombstones (removed since the last export): {writer.tombstones}")
     
     # Export SimpleMetaFields for decoding spec codes
     print("\n" + "="*60)
@@ -209,14 +291,8 @@ def export_products():
         meta_cols_str = ', '.join([f'[{col}]' for col in meta_columns])
         try:
             cursor.execute(f"SELECT {meta_cols_str} FROM SimpleMetaFields")
-            for row in cursor.fetchall():
-                meta_dict = {}
-                for i, col_name in enumerate(meta_columns):
-                    try:
-                        meta_dict[col_name] = getattr(row, col_name)
-                    except:
-                        meta_dict[col_name] = row[i] if i < len(row) else None
-                meta_fields.append(meta_dict)
+            for row in iter_rows(cursor, fetch_size):
+                meta_fields.append(dict(zip(meta_columns, row)))
             cursor.close()
         except Exception as e:
             print(f"⚠️  Could not export SimpleMetaFields: {e}")
@@ -226,34 +302,68 @@ def export_products():
     
     conn.close()
     
-    # Save to JSON
-    output_dir = Path(__file__).parent.parent / 'data'
-    output_dir.mkdir(exist_ok=True)
+    if delta:
+        summary = writer.close(meta_fields, kind='delta', watermark_column=watermark_column,
+                               since=state['watermark'], watermark=watermark)
+    elif output_format == 'json':
+        summary = writer.close(meta_fields)
+    elif partitions:
+        summary = writer.close(meta_fields, kind='full', watermark_column=watermark_column, watermark=watermark,
+                               partitions=len(plan['bounds']))
+    else:
+        summary = writer.close(meta_fields, kind='full', watermark_column=watermark_column, watermark=watermark)
+    output_file = writer.path
     
-    output_file = output_dir / 'products_joined.json'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump({
-            'products': products,
-            'meta_fields': meta_fields
-        }, f, indent=2, ensure_ascii=False)
+    # Written only after the export is complete, so a failed run is simply repeated
+    if not delta:
+        # A full export supersedes every delta
+        shutil.rmtree(output_dir / DELTA_DIR_NAME, ignore_errors=True)
+        state = {'deltas': 0, 'full_export_at': datetime.utcnow().isoformat()}
+    state.update(watermark_column=watermark_column, watermark=watermark,
+                 last_export_at=datetime.utcnow().isoformat(), last_export=str(output_file))
+    save_export_state(output_dir, state)
     
     print(f"\n✅ Data exported successfully to {output_file}")
-    print(f"   Products: {len(products)}")
+    print(f"   Products: {summary['products']}")
+    if delta:
+        print(f"   Tombstones: {writer.tombstones}")
     print(f"   Meta Fields: {len(meta_fields)}")
+    if watermark_column:
+        print(f"   Watermark: {watermark_column} = {format_watermark(watermark)}")
+    if delta or output_format != 'json':
+        size = sum(shard['bytes'] for shard in summary['shards'])
+        print(f"   Shards: {len(summary['shards'])} ({size / 1e6:.1f} MB{', gzip' if compress else ''})")
     print("\nYou can now disconnect from SSMS!")
     
     return output_file
 
 if __name__ == "__main__":
-    import sys
+    parser = argparse.ArgumentParser(description="Export products with their specifications and data from SSMS")
+    parser.add_argument('--list-databases', action='store_true', help="Show available databases and exit")
+    parser.add_argument('--format', choices=['sharded', 'json'], default='sharded',
+                        help="sharded: data/products_export/ JSON Lines shards + manifest (default), "
+                             "json: legacy data/products_joined.json")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="Products per shard")
+    parser.add_argument('--no-compress', action='store_true', help="Write plain .jsonl shards instead of gzip")
+    parser.add_argument('--delta', action='store_true',
+                        help="Export only products changed since the last export (UpdateIndex/Timestamp watermark)")
+    parser.add_argument('--partitions', type=int,
+                        help="Split a full export into N key ranges exported in parallel; "
+                             "an interrupted run resumes where it stopped")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Concurrent partitions")
+    parser.add_argument('--restart', action='store_true', help="Discard an unfinished partitioned export")
+    args = parser.parse_args()
+    if args.partitions and (args.delta or args.format == 'json'):
+        parser.error("--partitions writes a full sharded export (not with --delta or --format json)")
     
     # If --list-databases flag is passed, show available databases
-    if len(sys.argv) > 1 and sys.argv[1] == '--list-databases':
+    if args.list_databases:
         list_available_databases()
         sys.exit(0)
     
     try:
-        export_products()
+        export_products(output_format=args.format, shard_size=args.shard_size, compress=not args.no_compress,
+                        delta=args.delta, partitions=args.partitions, workers=args.workers, restart=args.restart)
     except Exception as e:
         print(f"\n❌ Error exporting data: {e}")
         print("\nMake sure:")
@@ -6,31 +6,42 @@ import os
 # Fix OpenMP library conflict (safe workaround for multiple OpenMP runtimes)
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
+import argparse
+import hashlib
 import json
+import multiprocessing
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from services.embeddings import EmbeddingService
+from services.response_cache import write_collection_version
+from services.context_packer import summarize_product_text
+from services.meta_schema import compile_meta_schema, decode_unicode, pick_language
+from services.bm25_index import BM25_INDEX_PATH, BM25IndexBuilder, build_from_collection
+from services.identifier_index import IDENTIFIER_INDEX_PATH, update_identifier_index, write_identifier_index
+from services.ingest_pipeline import DEFAULT_ENCODE_BATCH_SIZE, DEFAULT_WRITE_BATCH_SIZE, EncodeWritePipeline
+from services.product_attributes import MATERIAL_TERMS, extract_numeric_attributes, material_tags
+from services.product_reader import (
+    export_size, find_deltas, find_export, iter_batches, iter_products, iter_products_with_deltas,
+    load_export_manifest, load_meta_fields, load_tombstones
+)
 
-def decode_unicode(text):
-    """Decode Unicode escape sequences (e.g., \\u00E6 to æ, \\u00f8 to ø)"""
-    if not text:
-        return text
-    try:
-        # Try to decode unicode escapes
-        if isinstance(text, str) and '\\u' in text:
-            return text.encode('utf-8').decode('unicode-escape')
-    except:
-        pass
-    return text
+# Content hash per item_number from the last run - unchanged products are not re-encoded
+MANIFEST_PATH = './scripts/scripts/embedding_manifest.json'
+# Processes building rich text and metadata (1 = in the main process), overridable with PREPARE_WORKERS
+DEFAULT_PREPARE_WORKERS = max(1, min(4, (os.cpu_count() or 1) // 2))
+# Products per work unit sent to a preparation process
+PREPARE_CHUNK_SIZE = 100
 
 def get_field_name(spec_code, meta_fields):
-    """Map specification code to readable field name using SimpleMetaFields"""
-    for field in meta_fields:
-        if spec_code.startswith(field.get('MetaClass', '')):
-            return field.get('FieldName', spec_code)
-    return spec_code
+    """
+    Map specification code to readable field name using SimpleMetaFields
+    (most specific MetaClass prefix; meta_fields is the rows or a compiled MetaSchema)
+    """
+    return compile_meta_schema(meta_fields).field_name(spec_code)
 
 def parse_description(desc_raw):
     """Parse multilingual description JSON and return clean text"""
@@ -53,6 +64,35 @@ def parse_description(desc_raw):
     except:
         return decode_unicode(desc_raw)
 
+def parse_cutting_filter(product, meta_fields):
+    """
+    Parse CuttingFilterMetaDataSerialized into "Field: value" lines
+    Contains the material/application info (wood, metal, etc.) - also the source of the material tags
+    """
+    cutting_filter_text = ""
+    cutting_filter_meta = product.get('CuttingFilterMetaDataSerialized', '')
+    if cutting_filter_meta and cutting_filter_meta != '{}':
+        try:
+            cutting_dict = json.loads(cutting_filter_meta) if isinstance(cutting_filter_meta, str) else cutting_filter_meta
+            for key, value in cutting_dict.items():
+                if not value or value == {}:  # Skip empty values
+                    continue
+                
+                field_name = get_field_name(key, meta_fields)
+                
+                if isinstance(value, dict):
+                    # Multilingual dict like {"da":"...","en":"..."}: English > Danish > Swedish > Norwegian > first
+                    clean_value = pick_language(value)
+                    
+                    if clean_value and clean_value.strip():
+                        cutting_filter_text += f"{field_name}: {clean_value}\n"
+                elif str(value).strip():
+                    cutting_filter_text += f"{field_name}: {decode_unicode(str(value))}\n"
+        except Exception as e:
+            pass  # Skip if parsing fails
+    
+    return cutting_filter_text
+
 def create_rich_embedding_text(product, meta_fields):
     """
     Create rich text representation combining all related data
@@ -127,15 +167,8 @@ def create_rich_embedding_text(product, meta_fields):
                 field_name = get_field_name(key, meta_fields)
                 
                 if isinstance(value, dict):
-                    # Handle multilingual dict like {"da":"...","en":"..."}
-                    # Priority: English > Danish > first available
-                    clean_value = None
-                    for lang in ['en', 'da', 'sv', 'no']:
-                        if lang in value and value[lang]:
-                            clean_value = decode_unicode(str(value[lang]))
-                            break
-                    if not clean_value and value:
-                        clean_value = decode_unicode(str(list(value.values())[0]))
+                    # Multilingual dict like {"da":"...","en":"..."}: English > Danish > Swedish > Norwegian > first
+                    clean_value = pick_language(value)
                     
                     if clean_value and clean_value.strip():
                         filter_metadata_text += f"{field_name}: {clean_value}\n"
@@ -145,34 +178,7 @@ def create_rich_embedding_text(product, meta_fields):
             pass  # Skip if parsing fails
     
     # CRITICAL: Parse CuttingFilterMetaDataSerialized - contains material/application info (wood, metal, etc.)
-    cutting_filter_text = ""
-    cutting_filter_meta = product.get('CuttingFilterMetaDataSerialized', '')
-    if cutting_filter_meta and cutting_filter_meta != '{}':
-        try:
-            cutting_dict = json.loads(cutting_filter_meta) if isinstance(cutting_filter_meta, str) else cutting_filter_meta
-            for key, value in cutting_dict.items():
-                if not value or value == {}:  # Skip empty values
-                    continue
-                
-                field_name = get_field_name(key, meta_fields)
-                
-                if isinstance(value, dict):
-                    # Handle multilingual dict like {"da":"...","en":"..."}
-                    # Priority: English > Danish > first available
-                    clean_value = None
-                    for lang in ['en', 'da', 'sv', 'no']:
-                        if lang in value and value[lang]:
-                            clean_value = decode_unicode(str(value[lang]))
-                            break
-                    if not clean_value and value:
-                        clean_value = decode_unicode(str(list(value.values())[0]))
-                    
-                    if clean_value and clean_value.strip():
-                        cutting_filter_text += f"{field_name}: {clean_value}\n"
-                elif str(value).strip():
-                    cutting_filter_text += f"{field_name}: {decode_unicode(str(value))}\n"
-        except Exception as e:
-            pass  # Skip if parsing fails
+    cutting_filter_text = parse_cutting_filter(product, meta_fields)
     
     # Parse MachineFilterMetaDataSerialized - contains machine/compatibility info
     machine_filter_text = ""
@@ -187,15 +193,8 @@ def create_rich_embedding_text(product, meta_fields):
                 field_name = get_field_name(key, meta_fields)
                 
                 if isinstance(value, dict):
-                    # Handle multilingual dict like {"da":"...","en":"..."}
-                    # Priority: English > Danish > first available
-                    clean_value = None
-                    for lang in ['en', 'da', 'sv', 'no']:
-                        if lang in value and value[lang]:
-                            clean_value = decode_unicode(str(value[lang]))
-                            break
-                    if not clean_value and value:
-                        clean_value = decode_unicode(str(list(value.values())[0]))
+                    # Multilingual dict like {"da":"...","en":"..."}: English > Danish > Swedish > Norwegian > first
+                    clean_value = pick_language(value)
                     
                     if clean_value and clean_value.strip():
                         machine_filter_text += f"{field_name}: {clean_value}\n"
@@ -250,13 +249,7 @@ def create_rich_embedding_text(product, meta_fields):
                         parsed = json.loads(value)
                         if isinstance(parsed, dict) and parsed:
                             # Parse multilingual dicts
-                            clean_val = None
-                            for lang in ['en', 'da', 'sv', 'no']:
-                                if lang in parsed and parsed[lang]:
-                                    clean_val = decode_unicode(str(parsed[lang]))
-                                    break
-                            if not clean_val and parsed:
-                                clean_val = decode_unicode(str(list(parsed.values())[0]))
+                            clean_val = pick_language(parsed)
                             if clean_val and clean_val.strip():
                                 other_fields_text += f"{key}: {clean_val}\n"
                     except:
@@ -332,112 +325,554 @@ def create_rich_embedding_text(product, meta_fields):
     rich_text = '\n'.join(parts)
     return rich_text.strip()
 
-def setup_embeddings():
-    """Main function to create embeddings from exported data"""
+def collect_attribute_fields(product, meta_fields):
+    """
+    (field name, value) pairs from specifications and FilterMetaDataSerialized,
+    named with the SimpleMetaFields field names - input for the numeric attribute metadata
+    """
+    fields = []
+    for spec in product.get('specifications', []) or []:
+        spec_type = spec.get('Type', '')
+        spec_data = spec.get('Data', '')
+        if spec_data and isinstance(spec_data, str) and spec_data.strip().startswith('{'):
+            try:
+                for key, val in json.loads(spec_data).items():
+                    value = val.get('value', '') if isinstance(val, dict) else val
+                    fields.append((key, value))
+                continue
+            except (ValueError, AttributeError):
+                pass
+        fields.append((get_field_name(spec_type, meta_fields), spec_data))
+    
+    filter_meta = product.get('FilterMetaDataSerialized', '')
+    if filter_meta and filter_meta != '{}':
+        try:
+            filter_dict = json.loads(filter_meta) if isinstance(filter_meta, str) else filter_meta
+            for key, value in filter_dict.items():
+                if value and value != {}:
+                    fields.append((get_field_name(key, meta_fields), pick_language(value)))
+        except (ValueError, AttributeError):
+            pass
+    return fields
+
+# ProductData types that say what a tool is used on (English and Danish)
+APPLICATION_DATA_TYPES = ('application', 'anvendelse', 'material', 'materiale', 'usage')
+
+def material_source_text(product, cutting_filter_text, description):
+    """
+    Text the material tags are read from: the cutting filter, plus the description,
+    category and application data - most measuring tools have no cutting filter at all
+    """
+    parts = [cutting_filter_text, description, product.get('MetaClass', '') or '']
+    for data in product.get('product_data', []) or []:
+        if any(word in str(data.get('Type', '')).casefold() for word in APPLICATION_DATA_TYPES):
+            parts.append(decode_unicode(str(data.get('Content', '') or '')))
+    return '\n'.join(part for part in parts if part)
+
+def material_metadata(material_text):
+    """
+    Boolean mat_<material> fields from the material/application text, and mat_tagged
+    (any material found) so the retriever can keep products that name no material
+    """
+    tags = material_tags(material_text)
+    return {
+        **{f'mat_{material}': material in tags for material in MATERIAL_TERMS},
+        'mat_tagged': bool(tags),
+    }
+
+def prepare_product(product, meta_fields):
+    """Rich text and Chroma metadata for one product, or None if it has no item number"""
+    item_number = product.get('SanitizedItemNumber', '')
+    if not item_number:
+        return None
+    
+    # Create rich text embedding
+    rich_text = create_rich_embedding_text(product, meta_fields)
+    
+    # Parse description for metadata (use same parser for consistency)
+    description_clean = parse_description(product.get('ItemDescriptionSerialized', ''))
+    
+    # Prepare metadata
+    metadata = {
+        'item_number': item_number,
+        'description': description_clean,  # Store clean English/Danish description
+        'category': product.get('MetaClass', ''),
+        'specifications': json.dumps(product.get('specifications', [])),
+        'product_data': json.dumps(product.get('product_data', [])),
+        'filter_metadata': product.get('FilterMetaDataSerialized', ''),
+        'market': product.get('MarketsSerialized', ''),
+        'parent': product.get('Parent', ''),
+        'ean': product.get('Ean', '') or '',
+        # Compact version of rich_text used when the prompt context budget is tight
+        'summary': summarize_product_text(rich_text),
+        # Typed numeric attributes (diameter_mm, bore_mm, thickness_mm, length_mm, teeth)
+        # used as a range pre-filter for dimension queries
+        **extract_numeric_attributes(collect_attribute_fields(product, meta_fields)),
+        # Material tags (mat_wood, mat_panel, mat_metal, ..., mat_tagged) for the material pre-filter
+        **material_metadata(material_source_text(
+            product, parse_cutting_filter(product, meta_fields), description_clean
+        ))
+    }
+    return item_number, rich_text, metadata
+
+# meta_fields of a preparation process, set once by the pool initializer
+_worker_meta_fields = None
+
+def _init_prepare_worker(meta_fields):
+    global _worker_meta_fields
+    _worker_meta_fields = meta_fields
+
+def _prepare_chunk(products):
+    return [prepare_product(product, _worker_meta_fields) for product in products]
+
+class ProductPreparer:
+    """
+    prepare_product() for batches of products, in a process pool when workers > 1
+    
+    Text building is pure Python, so it only scales across processes. Batches are split into
+    chunks of chunk_size and the results come back in product order, so the output is the
+    same as a serial run. prepare_batches() keeps the next batch preparing while the caller
+    encodes the current one.
+    """
+    
+    def __init__(self, meta_fields, workers=1, chunk_size=PREPARE_CHUNK_SIZE):
+        # Compiled once here (and shipped to the workers) instead of per lookup
+        self.meta_fields = compile_meta_schema(meta_fields)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.executor = None
+        if workers > 1:
+            # Spawned, not forked: by the first submit the encoder and the ingest pipeline threads
+            # are running, and forking a process with threads / OpenMP state can deadlock
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_prepare_worker, initargs=(self.meta_fields,)
+            )
+    
+    def _submit(self, batch):
+        if self.executor is None:
+            return [prepare_product(product, self.meta_fields) for product in batch]
+        return [
+            self.executor.submit(_prepare_chunk, batch[i:i+self.chunk_size])
+            for i in range(0, len(batch), self.chunk_size)
+        ]
+    
+    def _collect(self, submitted):
+        if self.executor is None:
+            return submitted
+        return [prepared for future in submitted for prepared in future.result()]
+    
+    def prepare(self, batch):
+        """prepare_product() of every product in batch, in order"""
+        return self._collect(self._submit(batch))
+    
+    def prepare_batches(self, batches):
+        """Yield (batch, prepared) pairs, one batch ahead"""
+        pending = None
+        for batch in batches:
+            submitted = self._submit(batch)
+            if pending is not None:
+                yield pending[0], self._collect(pending[1])
+            pending = (batch, submitted)
+        if pending is not None:
+            yield pending[0], self._collect(pending[1])
+    
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def content_hash(rich_text, metadata):
+    """
+    Stable hashes of what is written to Chroma for a product: [text hash, metadata hash]
+    Only a text change needs a new embedding, a metadata-only change is a metadata update
+    """
+    metadata_json = json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+    return [
+        hashlib.sha256(rich_text.encode('utf-8')).hexdigest(),
+        hashlib.sha256(metadata_json.encode('utf-8')).hexdigest(),
+    ]
+
+def load_manifest(path, model_name):
+    """Hashes from the last run, or an empty manifest if there is none or the model changed"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'model': model_name, 'hashes': {}}
+    if manifest.get('model') != model_name:
+        print(f"Embedding model changed ({manifest.get('model')} -> {model_name}) - re-encoding everything")
+        return {'model': model_name, 'hashes': {}}
+    return manifest
+
+def save_manifest(path, manifest):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+class IngestRun:
+    """
+    Content hashes, counts and encoding time of one setup_embeddings run
+    
+    add_batch() decides what changed on the calling thread; encoding and Chroma writes run in
+    the background stages of an EncodeWritePipeline. Call flush() before reading the
+    collection and close() when done.
+    """
+    
+    def __init__(self, embedding_service, previous_hashes, existing_ids, hashes=None, bm25_builder=None,
+                 encode_batch_size=None, write_batch_size=None):
+        self.embedding_service = embedding_service
+        self.previous_hashes = previous_hashes
+        # Ids in the collection once everything queued is written
+        self.existing_ids = existing_ids
+        # Hashes of what the collection holds after this run
+        self.hashes = hashes if hashes is not None else {}
+        self.bm25_builder = bm25_builder
+        self.pipeline = EncodeWritePipeline(embedding_service, encode_batch_size, write_batch_size)
+        self.seen = set()
+        # (item number, EAN) of every product, for the identifier index
+        self.identifiers = []
+        self.deleted_ids = []
+        self.counts = {'added': 0, 'updated': 0, 'metadata_only': 0, 'unchanged': 0, 'deleted': 0, 'duplicates': 0}
+        self.processed = 0
+        self.read = 0
+        self.batches = 0
+    
+    @property
+    def encode_seconds(self):
+        return self.pipeline.encoder.stats.busy_seconds
+    
+    @property
+    def encoded(self):
+        return self.pipeline.encoder.stats.items
+    
+    def add_batches(self, prepared_batches):
+        """add_batch() for each (batch, prepared) pair, timed as the pipeline's build stage"""
+        build = self.pipeline.build
+        started = time.perf_counter()
+        blocked = build.blocked_seconds
+        for batch, prepared in prepared_batches:
+            self.add_batch(batch, prepared)
+            build.items += len(batch)
+            build.calls += 1
+        # Time spent waiting for room in the encode queue is the encoder's, not ours
+        build.busy_seconds += time.perf_counter() - started - (build.blocked_seconds - blocked)
+    
+    def add_batch(self, batch, prepared):
+        """Queue the new or changed products of a batch for encoding (prepared: ProductPreparer output)"""
+        self.batches += 1
+        self.read += len(batch)
+        
+        # Prepare data for batch (new or changed products only)
+        ids = []
+        texts = []
+        metadatas = []
+        # Products whose text (and so embedding) is unchanged but whose metadata changed
+        metadata_ids = []
+        metadata_updates = []
+        
+        for product, prepared_product in zip(batch, prepared):
+            self.identifiers.append((product.get('SanitizedItemNumber', ''), product.get('Ean', '')))
+            if prepared_product is None:
+                continue
+            item_number, rich_text, metadata = prepared_product
+            if item_number in self.seen:
+                self.counts['duplicates'] += 1
+                continue
+            self.seen.add(item_number)
+            
+            self.hashes[item_number] = content_hash(rich_text, metadata)
+            if self.bm25_builder is not None:
+                self.bm25_builder.add(item_number, rich_text)
+            self.processed += 1
+            previous = self.previous_hashes.get(item_number) if item_number in self.existing_ids else None
+            if previous == self.hashes[item_number]:
+                self.counts['unchanged'] += 1
+                continue
+            if previous and previous[0] == self.hashes[item_number][0]:
+                self.counts['updated'] += 1
+                self.counts['metadata_only'] += 1
+                metadata_ids.append(item_number)
+                metadata_updates.append(metadata)
+                continue
+            self.counts['updated' if item_number in self.existing_ids else 'added'] += 1
+            
+            ids.append(item_number)
+            texts.append(rich_text)
+            metadatas.append(metadata)
+        
+        self.pipeline.encode(ids, texts, metadatas)
+        self.existing_ids.update(ids)
+        self.pipeline.update_metadata(metadata_ids, metadata_updates)
+        
+        if self.batches % 10 == 0 or ids:
+            print(f"  Progress: {self.processed} products ({self.read} read, {self.encoded} encoded, "
+                  f"{self.pipeline.writer.stats.items} written)")
+    
+    def flush(self):
+        """Wait until everything queued is encoded and in the collection"""
+        self.pipeline.flush()
+    
+    def close(self):
+        self.pipeline.close()
+    
+    def delete(self, item_numbers, batch_size=1000):
+        """Remove products from the collection (those not in it are ignored)"""
+        # Queued writes land first, so a product added earlier in the run is really deleted
+        self.flush()
+        removed = sorted(set(item_numbers) & self.existing_ids)
+        for j in range(0, len(removed), batch_size):
+            self.embedding_service.delete_from_collection(removed[j:j+batch_size])
+        for item_number in removed:
+            self.hashes.pop(item_number, None)
+            self.existing_ids.discard(item_number)
+        self.deleted_ids.extend(removed)
+        self.counts['deleted'] += len(removed)
+        return removed
+    
+    def changed(self):
+        return self.counts['added'] + self.counts['updated'] + self.counts['deleted']
+    
+    def print_summary(self, seconds_per_product):
+        counts = self.counts
+        print(f"Total products processed: {self.processed}")
+        print(f"  Added:     {counts['added']}")
+        print(f"  Updated:   {counts['updated']} ({counts['metadata_only']} metadata only, not re-encoded)")
+        print(f"  Deleted:   {counts['deleted']}")
+        print(f"  Unchanged: {counts['unchanged']}")
+        if counts['duplicates']:
+            print(f"  Skipped duplicate item numbers: {counts['duplicates']}")
+        print(f"Encoding time: {self.encode_seconds:.1f}s for {self.encoded} products")
+        skipped = counts['unchanged'] + counts['metadata_only']
+        print(f"Estimated time saved vs full rebuild: {skipped * seconds_per_product:.1f}s ({skipped} products not re-encoded)")
+        self.pipeline.print_report()
+
+def get_prepare_workers():
+    return int(os.getenv("PREPARE_WORKERS", DEFAULT_PREPARE_WORKERS))
+
+def setup_embeddings(full=False, workers=None, encode_batch_size=None, write_batch_size=None, backend=None):
+    """
+    Main function to create embeddings from exported data
+    
+    Incremental: only new or changed products (by content hash, see MANIFEST_PATH) are
+    encoded and upserted, products missing from the export are deleted.
+    full=True re-encodes every product.
+    workers: processes building the rich text (default PREPARE_WORKERS / DEFAULT_PREPARE_WORKERS)
+    encode_batch_size / write_batch_size: texts per encoder call and rows per Chroma write
+    (default ENCODE_BATCH_SIZE / WRITE_BATCH_SIZE, see services/ingest_pipeline.py)
+    backend: 'torch' or 'onnx' (int8 ONNX Runtime), default EMBEDDING_BACKEND
+    Delta exports newer than the full export are applied on top of it.
+    """
     print("="*60)
     print("Creating Embeddings with Hybrid Strategy")
     print("="*60)
     
     # Load exported data
-    data_file = Path(__file__).parent.parent / 'data' / 'products_joined.json'
+    data_dir = Path(__file__).parent.parent / 'data'
+    data_file = find_export(data_dir)
     
-    if not data_file.exists():
-        print(f"\n❌ Error: Data file not found at {data_file}")
+    if data_file is None:
+        print(f"\n❌ Error: No product export found in {data_dir}")
         print("\nPlease run 'python scripts/export_data.py' first to export data from SSMS")
         return
     
-    print(f"\nLoading data from {data_file}...")
-    with open(data_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    products = data.get('products', [])
-    meta_fields = data.get('meta_fields', [])
-    
-    print(f"Loaded {len(products)} products")
+    # Products are streamed batch by batch, never loaded as a whole
+    print(f"\nStreaming data from {data_file} ({export_size(data_file) / 1e6:.1f} MB)...")
+    deltas = find_deltas(data_dir)
+    if deltas:
+        print(f"Applying {len(deltas)} delta export(s) on top: {', '.join(delta.name for delta in deltas)}")
+    # The newest export has the current SimpleMetaFields
+    meta_fields = load_meta_fields(deltas[-1] if deltas else data_file)
     print(f"Loaded {len(meta_fields)} metadata fields")
     
     # Initialize embedding service
     print("\nInitializing Sentence Transformer...")
-    embedding_service = EmbeddingService()
+    embedding_service = EmbeddingService(backend)
     collection = embedding_service.get_or_create_collection("products")
     
     print(f"Current collection count: {embedding_service.get_collection_count()}")
     
+    # Content hashes of what is already in the collection
+    manifest_path = os.getenv("EMBEDDING_MANIFEST_PATH", MANIFEST_PATH)
+    manifest = load_manifest(manifest_path, embedding_service.embedding_model_id)
+    run = IngestRun(
+        embedding_service,
+        previous_hashes={} if full else manifest['hashes'],
+        existing_ids=set(collection.get(include=[])['ids']),
+        # Keyword index over the same documents, for hybrid BM25 + vector retrieval
+        bm25_builder=BM25IndexBuilder(),
+        encode_batch_size=encode_batch_size,
+        write_batch_size=write_batch_size
+    )
+    
     # Process products in batches
     batch_size = 1000  
-    total_processed = 0
+    workers = workers or get_prepare_workers()
     
-    print(f"\nProcessing products in batches of {batch_size}...")
+    print(f"\nProcessing products in batches of {batch_size} ({'full rebuild' if full else 'incremental'}, "
+          f"{workers} text building process{'es' if workers > 1 else ''})...")
     
-    for i in range(0, len(products), batch_size):
-        batch = products[i:i+batch_size]
-        
-        # Prepare data for batch
-        ids = []
-        texts = []
-        metadatas = []
-        
-        for product in batch:
-            item_number = product.get('SanitizedItemNumber', '')
-            if not item_number:
-                continue
-            
-            # Create rich text embedding
-            rich_text = create_rich_embedding_text(product, meta_fields)
-            
-            # Parse description for metadata (use same parser for consistency)
-            description_clean = parse_description(product.get('ItemDescriptionSerialized', ''))
-            
-            # Prepare metadata
-            metadata = {
-                'item_number': item_number,
-                'description': description_clean,  # Store clean English/Danish description
-                'category': product.get('MetaClass', ''),
-                'specifications': json.dumps(product.get('specifications', [])),
-                'product_data': json.dumps(product.get('product_data', [])),
-                'filter_metadata': product.get('FilterMetaDataSerialized', ''),
-                'market': product.get('MarketsSerialized', ''),
-                'parent': product.get('Parent', ''),
-                'ean': product.get('Ean', '') or ''
-            }
-            
-            ids.append(item_number)
-            texts.append(rich_text)
-            metadatas.append(metadata)
-        
-        if not ids:
-            continue
-        
-        # Generate embeddings for batch
-        print(f"  Generating embeddings for batch {i//batch_size + 1}...")
-        embeddings = embedding_service.encode_batch(texts)
-        
-        # Add to ChromaDB
-        print(f"  Adding to ChromaDB...")
-        embedding_service.add_to_collection(
-            ids=ids,
-            embeddings=embeddings.tolist(),
-            documents=texts,
-            metadatas=metadatas
-        )
+    # Text building, encoding and Chroma writes run as concurrent stages
+    try:
+        with ProductPreparer(meta_fields, workers) as preparer:
+            run.add_batches(preparer.prepare_batches(iter_batches(iter_products_with_deltas(data_file, deltas), batch_size)))
         
-        total_processed += len(ids)
-        print(f"  Progress: {total_processed}/{len(products)} products")
+        # Products that disappeared from the export
+        removed = run.existing_ids - set(run.hashes)
+        if removed:
+            print(f"\nDeleting {len(removed)} products no longer in the export...")
+            run.delete(removed, batch_size)
+        run.flush()
+    finally:
+        run.close()
+    
+    # Time per product from this run, or from the last run that encoded anything
+    seconds_per_product = run.encode_seconds / run.encoded if run.encoded else manifest.get('encode_seconds_per_product', 0.0)
+    save_manifest(manifest_path, {
+        'model': embedding_service.embedding_model_id,
+        'encode_seconds_per_product': seconds_per_product,
+        'applied_deltas': [delta.name for delta in deltas],
+        'hashes': run.hashes,
+    })
     
     final_count = embedding_service.get_collection_count()
     
+    identifier_path = os.getenv("IDENTIFIER_INDEX_PATH", IDENTIFIER_INDEX_PATH)
+    item_count, ean_count = write_identifier_index(identifier_path, run.identifiers)
+    print(f"\nWrote identifier index ({item_count} item numbers, {ean_count} EANs) -> {identifier_path}")
+    
+    print(f"\nWriting BM25 keyword index ({len(run.bm25_builder)} documents)...")
+    bm25_path = os.getenv("BM25_INDEX_PATH", BM25_INDEX_PATH)
+    bm25_header = run.bm25_builder.write(bm25_path)
+    print(f"  {bm25_header['n_terms']} terms, {bm25_header['n_postings']} postings -> {bm25_path}")
+    
+    # New version stamp - running API servers drop cached answers from the old collection
+    if run.changed():
+        write_collection_version(final_count)
+    
     print("\n" + "="*60)
     print("✅ Embeddings Created Successfully!")
     print("="*60)
-    print(f"Total products processed: {total_processed}")
+    run.print_summary(seconds_per_product)
     print(f"ChromaDB collection count: {final_count}")
     print(f"\nVector database ready at: {embedding_service.chroma_persist_dir}")
+    print("\n💡 Optional: run 'python scripts/build_availability_index.py' to pre-check product links")
     print("\n✅ You can now start the API server!")
     print("   Run: uvicorn main:app --reload")
 
+def apply_deltas(workers=None, encode_batch_size=None, write_batch_size=None, backend=None):
+    """
+    Apply delta exports (export_data.py --delta) that are not in the collection yet:
+    changed products are re-embedded if their content changed, tombstoned products deleted.
+    Nothing else in the collection is read or re-encoded.
+    """
+    print("="*60)
+    print("Applying Delta Exports")
+    print("="*60)
+    
+    data_dir = Path(__file__).parent.parent / 'data'
+    embedding_service = EmbeddingService(backend)
+    collection = embedding_service.get_or_create_collection("products")
+    
+    manifest_path = os.getenv("EMBEDDING_MANIFEST_PATH", MANIFEST_PATH)
+    manifest = load_manifest(manifest_path, embedding_service.embedding_model_id)
+    if not manifest['hashes']:
+        print("\n❌ No embedding manifest - run 'python scripts/setup_embeddings.py' once first")
+        return
+    
+    applied = manifest.get('applied_deltas', [])
+    pending = [delta for delta in find_deltas(data_dir) if delta.name not in applied]
+    if not pending:
+        print("\nNo new delta exports to apply")
+        return
+    
+    run = IngestRun(
+        embedding_service,
+        previous_hashes=manifest['hashes'],
+        existing_ids=set(collection.get(include=[])['ids']),
+        hashes=dict(manifest['hashes']),
+        encode_batch_size=encode_batch_size,
+        write_batch_size=write_batch_size
+    )
+    batch_size = 1000
+    workers = workers or get_prepare_workers()
+    
+    try:
+        for delta in pending:
+            delta_manifest = load_export_manifest(delta)
+            tombstones = load_tombstones(delta)
+            print(f"\nDelta {delta.name}: {delta_manifest['products']} changed products, {len(tombstones)} tombstones")
+            meta_fields = load_meta_fields(delta)
+            # A product may change again in a later delta
+            run.seen.clear()
+            with ProductPreparer(meta_fields, workers) as preparer:
+                run.add_batches(preparer.prepare_batches(iter_batches(iter_products(delta), batch_size)))
+            # Also waits for this delta's writes, so the next delta sees them
+            removed = run.delete(tombstones, batch_size)
+            if removed:
+                print(f"  Deleted {len(removed)} products")
+            applied.append(delta.name)
+    finally:
+        run.close()
+    
+    seconds_per_product = run.encode_seconds / run.encoded if run.encoded else manifest.get('encode_seconds_per_product', 0.0)
+    save_manifest(manifest_path, {
+        'model': embedding_service.embedding_model_id,
+        'encode_seconds_per_product': seconds_per_product,
+        'applied_deltas': applied,
+        'hashes': run.hashes,
+    })
+    
+    final_count = embedding_service.get_collection_count()
+    
+    identifier_path = os.getenv("IDENTIFIER_INDEX_PATH", IDENTIFIER_INDEX_PATH)
+    item_count, ean_count = update_identifier_index(identifier_path, run.identifiers, run.deleted_ids)
+    print(f"\nUpdated identifier index ({item_count} item numbers, {ean_count} EANs) -> {identifier_path}")
+    
+    # BM25 statistics (document frequencies, lengths) are global, so the index is rebuilt from the collection
+    bm25_path = os.getenv("BM25_INDEX_PATH", BM25_INDEX_PATH)
+    bm25_header = build_from_collection(collection, bm25_path)
+    print(f"Rebuilt BM25 keyword index ({bm25_header['n_docs']} documents) -> {bm25_path}")
+    
+    if run.changed():
+        write_collection_version(final_count)
+    
+    print("\n" + "="*60)
+    print(f"✅ Applied {len(pending)} delta export(s)")
+    print("="*60)
+    run.print_summary(seconds_per_product)
+    print(f"ChromaDB collection count: {final_count}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or incrementally update product embeddings")
+    parser.add_argument('--full', action='store_true', help="Re-encode every product, ignoring the manifest")
+    parser.add_argument('--apply-delta', action='store_true',
+                        help="Only apply new delta exports from 'export_data.py --delta'")
+    parser.add_argument('--workers', type=int,
+                        help=f"Processes building the rich text (default PREPARE_WORKERS or {DEFAULT_PREPARE_WORKERS})")
+    parser.add_argument('--encode-batch-size', type=int,
+                        help=f"Texts per encoder call (default ENCODE_BATCH_SIZE or {DEFAULT_ENCODE_BATCH_SIZE})")
+    parser.add_argument('--write-batch-size', type=int,
+                        help=f"Rows per ChromaDB write (default WRITE_BATCH_SIZE or {DEFAULT_WRITE_BATCH_SIZE})")
+    parser.add_argument('--backend', choices=['torch', 'onnx'],
+                        help="Encoder: PyTorch SentenceTransformer or int8 ONNX Runtime (default EMBEDDING_BACKEND or torch)")
+    args = parser.parse_args()
+    options = {'workers': args.workers, 'encode_batch_size': args.encode_batch_size,
+               'write_batch_size': args.write_batch_size, 'backend': args.backend}
     try:
-        setup_embeddings()
+        if args.apply_delta:
+            apply_deltas(**options)
+        else:
+            setup_embeddings(full=args.full, **options)
     except Exception as e:
         print(f"\n❌ Error creating embeddings: {e}")
         import traceback
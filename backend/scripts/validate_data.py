@@ -1,9 +1,18 @@
 """
 Validate exported data meets client requirements
 """
-import json
+import sys
 from pathlib import Path
 from collections import Counter
+sys.path.append(str(Path(__file__).parent.parent))
+
+from services.meta_schema import MetaSchema
+from services.product_reader import export_size, find_export, is_sharded, iter_products, load_meta_fields, verify_export
+
+NUMERIC_SAMPLE_SIZE = 1000
+
+def has_numeric_spec(product):
+    return any(any(char.isdigit() for char in str(spec.get('Data', ''))) for spec in product.get('specifications', []))
 
 def validate_data():
     """Check if exported data is suitable for chatbot requirements"""
@@ -13,27 +22,63 @@ def validate_data():
     print("="*70)
     
     # Load data
-    json_path = Path(__file__).parent.parent / 'data' / 'products_joined.json'
+    json_path = find_export(Path(__file__).parent.parent / 'data')
     
-    if not json_path.exists():
-        print("❌ products_joined.json not found!")
+    if json_path is None:
+        print("❌ No product export (products_export/ or products_joined.json) found!")
         return False
     
     print(f"\n📁 File: {json_path}")
-    print(f"📊 Size: {json_path.stat().st_size / 1e6:.1f} MB")
-    
-    print("\n⏳ Loading JSON (this may take a moment)...")
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    products = data.get('products', [])
-    meta_fields = data.get('meta_fields', [])
-    
-    print(f"✅ Loaded successfully!")
-    print(f"   Products: {len(products):,}")
+    print(f"📊 Size: {export_size(json_path) / 1e6:.1f} MB")
+    
+    if is_sharded(json_path):
+        print("\n⏳ Verifying shard checksums and row counts...")
+        problems = verify_export(json_path)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return False
+        print("✅ All shards match the manifest")
+    
+    # One streaming pass collects every count and sample the checks below need,
+    # so memory stays flat however large the export is
+    print("\n⏳ Scanning products (this may take a moment)...")
+    meta_fields = load_meta_fields(json_path)
+    desc_field = 'ItemDescriptionSerialized'
+    total = 0
+    counts = Counter()
+    samples = {}
+    categories = Counter()
+    spec_types = Counter()
+    for product in iter_products(json_path):
+        total += 1
+        description = str(product.get(desc_field, '')).lower()
+        flags = {
+            'market': '001' in str(product.get('MarketsSerialized', '')),
+            'deleted': product.get('IsDeleted') not in (0, None),
+            'purchases': product.get('Parent') == 'purchases',
+            'sawblade': 'saw' in description,
+            'caliper': 'caliper' in description,
+            'drill': 'drill' in description,
+            'knife': 'knife' in description or 'kniv' in description,
+            'specs': bool(product.get('specifications')),
+            'data': bool(product.get('product_data')),
+            'numbers': total <= NUMERIC_SAMPLE_SIZE and has_numeric_spec(product),
+        }
+        for name, matched in flags.items():
+            if matched:
+                counts[name] += 1
+                samples.setdefault(name, product)
+        samples.setdefault('first', product)
+        categories[product.get('MetaClass', 'Unknown')] += 1
+        for spec in product.get('specifications') or []:
+            spec_types[spec.get('Type') or ''] += 1
+    
+    print(f"✅ Scanned successfully!")
+    print(f"   Products: {total:,}")
     print(f"   Meta Fields: {len(meta_fields):,}")
     
-    if not products:
+    if not total:
         print("❌ No products found!")
         return False
     
@@ -42,7 +87,7 @@ def validate_data():
     print("CHECK 1: Product Structure")
     print("="*70)
     
-    sample = products[0]
+    sample = samples['first']
     print(f"✅ Product columns ({len(sample)} fields):")
     for i, key in enumerate(sample.keys(), 1):
         print(f"   {i:2d}. {key}")
@@ -52,10 +97,9 @@ def validate_data():
     print("CHECK 2: Market Filtering (Danish = 001)")
     print("="*70)
     
-    market_products = [p for p in products if '001' in str(p.get('MarketsSerialized', ''))]
-    print(f"✅ Products with market 001: {len(market_products):,} / {len(products):,}")
+    print(f"✅ Products with market 001: {counts['market']:,} / {total:,}")
     
-    if len(market_products) == 0:
+    if counts['market'] == 0:
         print("⚠️  WARNING: No products for Danish market (001)")
     
     # Check 3: Deleted/Parent filtering
@@ -63,52 +107,39 @@ def validate_data():
     print("CHECK 3: IsDeleted and Parent Filtering")
     print("="*70)
     
-    deleted = [p for p in products if p.get('IsDeleted') not in (0, None)]
-    purchases = [p for p in products if p.get('Parent') == 'purchases']
+    print(f"✅ Active products (IsDeleted=0): {total - counts['deleted']:,}")
+    print(f"✅ Non-purchase items (Parent!=purchases): {total - counts['purchases']:,}")
     
-    print(f"✅ Active products (IsDeleted=0): {len(products) - len(deleted):,}")
-    print(f"✅ Non-purchase items (Parent!=purchases): {len(products) - len(purchases):,}")
-    
-    if deleted:
-        print(f"⚠️  Found {len(deleted)} deleted products (should be 0)")
-    if purchases:
-        print(f"⚠️  Found {len(purchases)} purchase items (should be 0)")
+    if counts['deleted']:
+        print(f"⚠️  Found {counts['deleted']} deleted products (should be 0)")
+    if counts['purchases']:
+        print(f"⚠️  Found {counts['purchases']} purchase items (should be 0)")
     
     # Check 4: Product descriptions (for "sawblades", "calipers", etc.)
     print("\n" + "="*70)
     print("CHECK 4: Product Descriptions (Client Examples)")
     print("="*70)
     
-    # Count products with key terms
-    desc_field = 'ItemDescriptionSerialized'
-    sawblades = [p for p in products if 'saw' in str(p.get(desc_field, '')).lower()]
-    calipers = [p for p in products if 'caliper' in str(p.get(desc_field, '')).lower()]
-    drills = [p for p in products if 'drill' in str(p.get(desc_field, '')).lower()]
-    knives = [p for p in products if 'knife' or 'kniv' in str(p.get(desc_field, '')).lower()]
-    
-    print(f"✅ Sawblades/Saw products: {len(sawblades):,}")
-    print(f"✅ Calipers: {len(calipers):,}")
-    print(f"✅ Drills: {len(drills):,}")
-    print(f"✅ Knives: {len(knives):,}")
+    print(f"✅ Sawblades/Saw products: {counts['sawblade']:,}")
+    print(f"✅ Calipers: {counts['caliper']:,}")
+    print(f"✅ Drills: {counts['drill']:,}")
+    print(f"✅ Knives: {counts['knife']:,}")
     
-    if sawblades:
-        print(f"\n   Sample sawblade: {sawblades[0].get(desc_field, '')[:80]}...")
-    if calipers:
-        print(f"   Sample caliper: {calipers[0].get(desc_field, '')[:80]}...")
+    if counts['sawblade']:
+        print(f"\n   Sample sawblade: {samples['sawblade'].get(desc_field, '')[:80]}...")
+    if counts['caliper']:
+        print(f"   Sample caliper: {samples['caliper'].get(desc_field, '')[:80]}...")
     
     # Check 5: Specifications (for "160mm", "soft wood", etc.)
     print("\n" + "="*70)
     print("CHECK 5: Product Specifications")
     print("="*70)
     
-    with_specs = [p for p in products if p.get('specifications')]
-    with_data = [p for p in products if p.get('product_data')]
-    
-    print(f"✅ Products with specifications: {len(with_specs):,} / {len(products):,} ({len(with_specs)/len(products)*100:.1f}%)")
-    print(f"✅ Products with product_data: {len(with_data):,} / {len(products):,} ({len(with_data)/len(products)*100:.1f}%)")
+    print(f"✅ Products with specifications: {counts['specs']:,} / {total:,} ({counts['specs']/total*100:.1f}%)")
+    print(f"✅ Products with product_data: {counts['data']:,} / {total:,} ({counts['data']/total*100:.1f}%)")
     
-    if with_specs:
-        sample_specs = with_specs[0].get('specifications', [])
+    if counts['specs']:
+        sample_specs = samples['specs'].get('specifications', [])
         print(f"\n   Sample product has {len(sample_specs)} specifications:")
         for spec in sample_specs[:5]:
             print(f"      - {spec}")
@@ -118,19 +149,11 @@ def validate_data():
     print("CHECK 6: Numeric Dimensions (e.g., 160mm)")
     print("="*70)
     
-    # Look for products with numeric values in specs
-    products_with_numbers = []
-    for p in products[:1000]:  # Check first 1000
-        specs = p.get('specifications', [])
-        for spec in specs:
-            if any(char.isdigit() for char in str(spec.get('Data', ''))):
-                products_with_numbers.append(p)
-                break
-    
-    print(f"✅ Products with numeric specs (sample of 1000): {len(products_with_numbers):,}")
+    # Products with numeric values in specs, among the first NUMERIC_SAMPLE_SIZE
+    print(f"✅ Products with numeric specs (sample of {NUMERIC_SAMPLE_SIZE}): {counts['numbers']:,}")
     
-    if products_with_numbers:
-        sample = products_with_numbers[0]
+    if counts['numbers']:
+        sample = samples['numbers']
         print(f"\n   Sample: {sample.get(desc_field, '')[:60]}...")
         print(f"   Specs with numbers:")
         for spec in sample.get('specifications', [])[:3]:
@@ -148,12 +171,20 @@ def validate_data():
         for field in meta_fields[:5]:
             print(f"      - {field}")
     
+    schema = MetaSchema(meta_fields)
+    resolved = {code: schema.resolve(code) for code in spec_types if code}
+    named = sum(spec_types[code] for code, match in resolved.items() if match)
+    print(f"\n   Specification types with a field name: {sum(1 for match in resolved.values() if match):,} "
+          f"of {len(resolved):,} ({named:,} of {sum(spec_types.values()):,} specifications)")
+    for code, _ in spec_types.most_common(5):
+        if code:
+            print(f"      - {code} → {schema.field_name(code)}")
+    
     # Check 8: Categories/MetaClass
     print("\n" + "="*70)
     print("CHECK 8: Product Categories")
     print("="*70)
     
-    categories = Counter(p.get('MetaClass', 'Unknown') for p in products)
     print(f"✅ Unique categories: {len(categories)}")
     print(f"\n   Top 10 categories:")
     for cat, count in categories.most_common(10):
@@ -167,7 +198,7 @@ def validate_data():
     checks = []
     
     # Requirement 1: "sawblades 160" - needs descriptions + numeric specs
-    if sawblades and products_with_numbers:
+    if counts['sawblade'] and counts['numbers']:
         print("✅ Can handle 'sawblades 160' queries")
         print("   → Has sawblade products with numeric dimensions")
         checks.append(True)
@@ -176,7 +207,7 @@ def validate_data():
         checks.append(False)
     
     # Requirement 2: "blade for soft wood" - needs specs/materials
-    if with_specs:
+    if counts['specs']:
         print("✅ Can help with material-based queries ('soft wood')")
         print("   → Products have specifications for recommendations")
         checks.append(True)
@@ -185,9 +216,9 @@ def validate_data():
         checks.append(False)
     
     # Requirement 3: "digital calipers" - needs product variety
-    if calipers:
+    if counts['caliper']:
         print("✅ Can find 'digital calipers'")
-        print(f"   → Found {len(calipers)} caliper products")
+        print(f"   → Found {counts['caliper']} caliper products")
         checks.append(True)
     else:
         print("⚠️  No caliper products found")
@@ -200,7 +231,7 @@ def validate_data():
     checks.append(True)
     
     # Requirement 5: Complex DB handling
-    if with_specs and meta_fields:
+    if counts['specs'] and meta_fields:
         print("✅ Handles complex database structure")
         print("   → Specs joined and preserved")
         print("   → Meta fields for decoding")
@@ -0,0 +1,211 @@
+"""
+Persistent TTL cache for product page availability
+Stored in SQLite so it survives restarts and is shared by all uvicorn workers
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from services.url_validator import get_url_validator
+
+
+class AvailabilityCache:
+    """Serves cached product URL checks and refreshes stale entries in the background"""
+
+    def __init__(self, db_path=None, positive_ttl=None, negative_ttl=None, max_stale=None):
+        """Open (or create) the cache database"""
+        self.db_path = db_path or os.getenv(
+            "AVAILABILITY_CACHE_PATH", "./scripts/scripts/availability_cache.sqlite3"
+        )
+        # Product pages rarely change, broken ones are re-checked sooner
+        self.positive_ttl = float(positive_ttl or os.getenv("AVAILABILITY_POSITIVE_TTL", str(7 * 24 * 3600)))
+        self.negative_ttl = float(negative_ttl or os.getenv("AVAILABILITY_NEGATIVE_TTL", str(24 * 3600)))
+        # How long past its TTL an entry may still be served while it is refreshed
+        self.max_stale = float(max_stale or os.getenv("AVAILABILITY_MAX_STALE", str(7 * 24 * 3600)))
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS availability (
+                site_host TEXT NOT NULL,
+                locale TEXT NOT NULL,
+                item_number TEXT NOT NULL,
+                available INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (site_host, locale, item_number)
+            )
+            """
+        )
+
+        self._refreshing = set()
+        self._refresh_tasks = set()
+
+        # Per-process counters (item level, except live_batches/requests)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.requests = 0
+        self.requests_served_from_cache = 0
+        self.live_batches = 0
+        self.live_seconds = 0.0
+        self.background_refreshes = 0
+        self.unknown = 0
+
+    def lookup(self, site_host: str, locale: str, item_numbers: List[str]) -> Tuple[Dict[str, bool], Dict[str, bool], List[str]]:
+        """Split item numbers into fresh results, stale results and missing items"""
+        fresh: Dict[str, bool] = {}
+        stale: Dict[str, bool] = {}
+        if not item_numbers:
+            return fresh, stale, []
+
+        now = time.time()
+        rows = {}
+        # Chunked to stay below SQLite's bound-parameter limit
+        for start in range(0, len(item_numbers), 500):
+            chunk = item_numbers[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"SELECT item_number, available, checked_at FROM availability "
+                    f"WHERE site_host = ? AND locale = ? AND item_number IN ({placeholders})",
+                    [site_host, locale, *chunk],
+                )
+                for item, available, checked_at in cursor.fetchall():
+                    rows[item] = (bool(available), checked_at)
+
+        missing = []
+        for item in item_numbers:
+            if item not in rows:
+                missing.append(item)
+                continue
+            available, checked_at = rows[item]
+            age = now - checked_at
+            ttl = self.positive_ttl if available else self.negative_ttl
+            if age <= ttl:
+                fresh[item] = available
+            elif age <= ttl + self.max_stale:
+                stale[item] = available
+            else:
+                missing.append(item)
+        return fresh, stale, missing
+
+    def store(self, site_host: str, locale: str, results: Dict[str, Optional[bool]]):
+        """Record definitive check results (unknown ones are left out)"""
+        results = {item: available for item, available in results.items() if available is not None}
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO availability (site_host, locale, item_number, available, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(site_host, locale, item, int(available), now) for item, available in results.items()],
+            )
+
+    async def _live_check(self, site_host: str, locale: str, item_numbers: List[str]) -> Dict[str, Optional[bool]]:
+        """
+        Check items against the live site and store the definitive results
+
+        Unknown results (errors, timeouts) are returned but not cached, so the next
+        request checks those items again instead of hiding them for a TTL.
+        """
+        base = f"https://{site_host}/{locale}/product-detail"
+        started = time.perf_counter()
+        results = await get_url_validator().check(base, item_numbers)
+        self.live_batches += 1
+        self.live_seconds += time.perf_counter() - started
+        self.store(site_host, locale, results)
+        self.unknown += sum(1 for available in results.values() if available is None)
+        return results
+
+    async def _refresh(self, site_host: str, locale: str, item_numbers: List[str]):
+        """Background refresh of stale entries"""
+        try:
+            await self._live_check(site_host, locale, item_numbers)
+            self.background_refreshes += 1
+        except Exception as e:
+            print(f"  Availability refresh failed: {str(e)[:80]}")
+        finally:
+            for item in item_numbers:
+                self._refreshing.discard((site_host, locale, item))
+
+    def _schedule_refresh(self, site_host: str, locale: str, item_numbers: Iterable[str]):
+        """Refresh stale items without blocking the caller (one refresh per item at a time)"""
+        todo = [item for item in item_numbers if (site_host, locale, item) not in self._refreshing]
+        if not todo:
+            return
+        self._refreshing.update((site_host, locale, item) for item in todo)
+        task = asyncio.create_task(self._refresh(site_host, locale, todo))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def check(self, site_host: str, locale: str, item_numbers: Iterable[str]) -> Dict[str, Optional[bool]]:
+        """
+        Return { item_number: True/False/None } using cached answers where possible.
+        None means the live check could not tell (error or timeout).
+
+        Fresh and stale entries are answered from the cache immediately (stale ones are
+        refreshed in the background); only missing items are checked live.
+        """
+        items = list(dict.fromkeys(item_numbers))
+        if not items:
+            return {}
+
+        fresh, stale, missing = self.lookup(site_host, locale, items)
+        self.requests += 1
+        self.hits += len(fresh)
+        self.stale += len(stale)
+        self.misses += len(missing)
+
+        if stale:
+            self._schedule_refresh(site_host, locale, stale.keys())
+
+        results = {**fresh, **stale}
+        if missing:
+            results.update(await self._live_check(site_host, locale, missing))
+        else:
+            self.requests_served_from_cache += 1
+        return results
+
+    def stats(self) -> dict:
+        """Hit/miss/stale counters and an estimate of network time saved"""
+        lookups = self.hits + self.stale + self.misses
+        avg_batch_seconds = self.live_seconds / self.live_batches if self.live_batches else 0.0
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM availability").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale) / lookups, 3) if lookups else 0.0,
+            "requests": self.requests,
+            "requests_served_from_cache": self.requests_served_from_cache,
+            "background_refreshes": self.background_refreshes,
+            "unknown_live_results": self.unknown,
+            "live_batches": self.live_batches,
+            "avg_live_batch_ms": round(avg_batch_seconds * 1000, 1),
+            "estimated_network_ms_saved": round(self.requests_served_from_cache * avg_batch_seconds * 1000, 1),
+        }
+
+
+# Global instance
+availability_cache = None
+
+
+def get_availability_cache():
+    """Get or create availability cache singleton"""
+    global availability_cache
+    if availability_cache is None:
+        availability_cache = AvailabilityCache()
+    return availability_cache
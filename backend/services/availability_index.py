@@ -0,0 +1,95 @@
+"""
+Offline product availability index
+Built ahead of time by scripts/build_availability_index.py and stored next to the Chroma directory
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+
+class AvailabilityIndex:
+    """
+    Set lookup of product pages known to exist (or not) on the live site
+    Items in neither set are unknown and fall through to the cache / a live check
+    """
+
+    def __init__(self, index_path=None):
+        """Load the index file if it exists"""
+        self.index_path = index_path or os.getenv(
+            "AVAILABILITY_INDEX_PATH", "./scripts/scripts/availability_index.json"
+        )
+        self.site_host = None
+        self.locale = None
+        self.built_at = None
+        self.available = set()
+        self.unavailable = set()
+
+        path = Path(self.index_path)
+        if not path.exists():
+            print(f"No availability index at {self.index_path} - all product links are checked live")
+            return
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.site_host = data.get("site_host")
+        self.locale = data.get("locale")
+        self.built_at = data.get("built_at")
+        self.available = set(data.get("available", []))
+        self.unavailable = set(data.get("unavailable", []))
+        print(
+            f"Loaded availability index ({len(self.available)} available, "
+            f"{len(self.unavailable)} unavailable, built {self.built_at})"
+        )
+
+    def resolve(self, site_host: str, locale: str, item_numbers: Iterable[str]) -> Tuple[Dict[str, bool], List[str]]:
+        """Split item numbers into known results and items the index does not cover"""
+        if site_host != self.site_host or locale != self.locale:
+            return {}, list(item_numbers)
+
+        known: Dict[str, bool] = {}
+        unknown: List[str] = []
+        for item in item_numbers:
+            if item in self.available:
+                known[item] = True
+            elif item in self.unavailable:
+                known[item] = False
+            else:
+                unknown.append(item)
+        return known, unknown
+
+
+def write_availability_index(index_path, site_host, locale, results, source):
+    """
+    Write an index file from { item_number: True/False/None } results
+
+    Only definitive results are written; unknown (None) items are left out of the index.
+    """
+    path = Path(index_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "site_host": site_host,
+            "locale": locale,
+            "built_at": datetime.utcnow().isoformat(),
+            "source": source,
+            "available": sorted(item for item, ok in results.items() if ok),
+            "unavailable": sorted(item for item, ok in results.items() if ok is False),
+        }, f)
+    # Atomic replace so a running server never reads a half-written index
+    os.replace(tmp_path, path)
+    return path
+
+
+# Global instance
+availability_index = None
+
+
+def get_availability_index():
+    """Get or load availability index singleton"""
+    global availability_index
+    if availability_index is None:
+        availability_index = AvailabilityIndex()
+    return availability_index
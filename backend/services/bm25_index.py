@@ -0,0 +1,288 @@
+"""
+BM25 inverted index over the product documents
+Built by setup_embeddings.py next to the Chroma directory and memory-mapped by the API
+
+Catches exact tokens the MiniLM embeddings miss: brand names (MITUTOYO, Hartner), type codes,
+item numbers and EANs.
+
+File layout: magic, JSON header (sizes, BM25 parameters, section offsets), then 8-byte aligned
+little-endian arrays. Terms and document ids are stored as sorted UTF-8 blobs with offset
+tables, so lookups binary-search the mapped file and loading does not parse anything.
+"""
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"BM25IDX1"
+BM25_INDEX_PATH = './scripts/scripts/bm25_index.bin'
+
+# Words, keeping item numbers / type codes like W381195-2125412 or 8.20mm together
+TOKEN_PATTERN = re.compile(r'\w+(?:[-./]\w+)*')
+SPLIT_PATTERN = re.compile(r'[-./]')
+
+
+def tokenize(text):
+    """Casefolded tokens; compound tokens (W381195-2125412) also yield their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').casefold()):
+        tokens.append(token)
+        if SPLIT_PATTERN.search(token):
+            tokens.extend(part for part in SPLIT_PATTERN.split(token) if part)
+    return tokens
+
+
+class BM25IndexBuilder:
+    """Collects term frequencies document by document, then writes the index file"""
+
+    def __init__(self):
+        self.doc_ids = []
+        self.doc_lengths = array('I')
+        self.postings = {}  # term -> array of (doc, tf) pairs, interleaved
+
+    def add(self, doc_id, text):
+        tokens = tokenize(text)
+        doc = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array('I')
+            postings.append(doc)
+            postings.append(min(tf, 65535))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def write(self, path=BM25_INDEX_PATH, k1=1.2, b=0.75):
+        """Write the index atomically (a running server keeps its mapping of the old file)"""
+        terms = sorted(term.encode('utf-8') for term in self.postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype='<u8')
+        term_offsets[1:] = np.cumsum([len(term) for term in terms])
+        posting_offsets = np.zeros(len(terms) + 1, dtype='<u8')
+        posting_offsets[1:] = np.cumsum([len(self.postings[term.decode('utf-8')]) // 2 for term in terms])
+
+        postings_docs = np.empty(int(posting_offsets[-1]), dtype='<u4')
+        postings_tf = np.empty(int(posting_offsets[-1]), dtype='<u2')
+        for index, term in enumerate(terms):
+            pairs = np.frombuffer(self.postings[term.decode('utf-8')], dtype=np.uint32)
+            start, end = posting_offsets[index], posting_offsets[index + 1]
+            postings_docs[start:end] = pairs[0::2]
+            postings_tf[start:end] = pairs[1::2]
+
+        doc_ids = [doc_id.encode('utf-8') for doc_id in self.doc_ids]
+        doc_id_offsets = np.zeros(len(doc_ids) + 1, dtype='<u8')
+        doc_id_offsets[1:] = np.cumsum([len(doc_id) for doc_id in doc_ids])
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32).astype('<u4')
+
+        sections = [
+            ("doc_lengths", doc_lengths),
+            ("doc_id_offsets", doc_id_offsets),
+            ("doc_ids", np.frombuffer(b''.join(doc_ids), dtype=np.uint8)),
+            ("term_offsets", term_offsets),
+            ("terms", np.frombuffer(b''.join(terms), dtype=np.uint8)),
+            ("posting_offsets", posting_offsets),
+            ("postings_docs", postings_docs),
+            ("postings_tf", postings_tf),
+        ]
+        header = {
+            "n_docs": len(doc_ids),
+            "n_terms": len(terms),
+            "n_postings": int(posting_offsets[-1]),
+            "avgdl": float(doc_lengths.mean()) if len(doc_lengths) else 0.0,
+            "k1": k1,
+            "b": b,
+            "built_at": datetime.utcnow().isoformat(),
+            "sections": {},
+        }
+        # Offsets are relative to the end of the header, so they can be computed before it is sized
+        offset = 0
+        for name, values in sections:
+            offset = (offset + 7) // 8 * 8
+            header["sections"][name] = [offset, values.dtype.str, int(values.size)]
+            offset += values.nbytes
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = (len(MAGIC) + 4 + len(header_bytes) + 7) // 8 * 8
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            for name, values in sections:
+                f.write(b'\0' * (data_start + header["sections"][name][0] - f.tell()))
+                f.write(values.tobytes())
+        os.replace(tmp_path, path)
+        return header
+
+
+def build_from_collection(collection, path=BM25_INDEX_PATH, page_size=1000):
+    """Rebuild the index from every document stored in a Chroma collection"""
+    builder = BM25IndexBuilder()
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        for doc_id, text in zip(page["ids"], page["documents"]):
+            builder.add(doc_id, text or '')
+        offset += len(page["ids"])
+    return builder.write(path)
+
+
+class BM25Index:
+    """Read-only, memory-mapped BM25 index"""
+
+    def __init__(self, path=BM25_INDEX_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a BM25 index")
+        (header_length,) = struct.unpack_from('<I', buffer, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+        data_start = (header_start + header_length + 7) // 8 * 8
+
+        # Zero-copy views into the mapped file
+        for name, (offset, dtype, count) in self.header["sections"].items():
+            setattr(self, name, np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + offset))
+
+        self.n_docs = self.header["n_docs"]
+        self.n_terms = self.header["n_terms"]
+        self.avgdl = self.header["avgdl"] or 1.0
+        self.k1 = self.header["k1"]
+        self.b = self.header["b"]
+        self.file_bytes = len(self._mmap)
+
+        # close() waits for searches still running on this instance (see get_bm25_index)
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._closing = False
+
+    def close(self):
+        """Unmap the file once the searches in flight have finished"""
+        with self._lock:
+            self._closing = True
+            idle = not self._searches
+        if idle:
+            self._release()
+
+    def _release(self):
+        # The section views pin the mapping; mmap.close() raises BufferError while they exist
+        for name in self.header["sections"]:
+            setattr(self, name, None)
+        if not self._mmap.closed:
+            self._mmap.close()
+
+    def _term(self, index):
+        return self.terms[self.term_offsets[index]:self.term_offsets[index + 1]].tobytes()
+
+    def _term_id(self, term):
+        """Binary search of the sorted term blob (UTF-8 byte order)"""
+        target = term.encode('utf-8')
+        low, high = 0, self.n_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_terms and self._term(low) == target:
+            return low
+        return None
+
+    def doc_id(self, doc):
+        return self.doc_ids[self.doc_id_offsets[doc]:self.doc_id_offsets[doc + 1]].tobytes().decode('utf-8')
+
+    def search(self, query, top_n=25):
+        """Top documents for the query as [(doc_id, score), ...], best first"""
+        with self._lock:
+            if self._closing:
+                return []
+            self._searches += 1
+        try:
+            return self._search(query, top_n)
+        finally:
+            with self._lock:
+                self._searches -= 1
+                release = self._closing and not self._searches
+            if release:
+                self._release()
+
+    def _search(self, query, top_n):
+        scores = None
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            start, end = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end].astype(np.float32)
+            idf = math.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avgdl)
+            if scores is None:
+                scores = np.zeros(self.n_docs, dtype=np.float32)
+            # Each document appears once per posting list, so plain fancy indexing is safe
+            scores[docs] += query_tf * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if scores is None:
+            return []
+        top_n = min(top_n, self.n_docs)
+        best = np.argpartition(-scores, top_n - 1)[:top_n]
+        best = best[np.argsort(-scores[best])]
+        return [(self.doc_id(doc), float(scores[doc])) for doc in best if scores[doc] > 0]
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "documents": self.n_docs,
+            "terms": self.n_terms,
+            "postings": self.header["n_postings"],
+            "built_at": self.header["built_at"],
+            "file_bytes": self.file_bytes,
+        }
+
+
+# Global instance, reloaded when setup_embeddings.py replaces the file
+bm25_index = None
+_bm25_index_mtime = None
+_bm25_index_lock = threading.Lock()
+
+
+def get_bm25_index():
+    """Get the BM25 index (BM25_INDEX_PATH), or None if it has not been built"""
+    global bm25_index, _bm25_index_mtime
+    path = os.getenv("BM25_INDEX_PATH", BM25_INDEX_PATH)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if mtime != _bm25_index_mtime:
+        with _bm25_index_lock:
+            if mtime != _bm25_index_mtime:
+                previous = bm25_index
+                try:
+                    bm25_index = BM25Index(path)
+                    print(f"Loaded BM25 index ({bm25_index.n_docs} documents, {bm25_index.n_terms} terms)")
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Could not load BM25 index {path}: {e}")
+                    bm25_index = None
+                _bm25_index_mtime = mtime
+                # Unmap the replaced file (after any search still running on it)
+                if previous is not None:
+                    previous.close()
+    return bm25_index
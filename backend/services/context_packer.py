@@ -0,0 +1,162 @@
+"""
+Token-budgeted product context for the answer prompt
+Retrieved products go in as compact summaries in relevance order; full documents only where the budget allows
+"""
+import os
+import re
+import threading
+
+# Section headers written by create_rich_embedding_text()
+MATERIAL_SECTION = 'MATERIAL/APPLICATION (CRITICAL FOR COMPATIBILITY):'
+DIMENSION_SECTIONS = {'Specifications:', 'Attributes:'}
+SECTION_HEADERS = {
+    MATERIAL_SECTION, 'Specifications:', 'Attributes:', 'Machine Compatibility:',
+    'Additional Information:', 'Other Product Details:',
+}
+
+# Spec/attribute names that describe a dimension worth keeping in the summary
+DIMENSION_KEY_PATTERN = re.compile(
+    r'diameter|bore|thickness|length|width|height|depth|teeth|tooth|\bz\b|kerf|shank|pitch|tpi|angle|size|\bmm\b|inch|ø',
+    re.IGNORECASE
+)
+MAX_SUMMARY_DIMENSIONS = 8
+
+# Separator between products in the context
+DOCUMENT_SEPARATOR = "\n\n"
+
+
+def summarize_product_text(rich_text):
+    """
+    Compact summary of a product's rich text: description, item number, category,
+    material/application and key dimensions
+    """
+    description = item_number = category = ''
+    materials = []
+    dimensions = []
+    section = None
+
+    for line in (rich_text or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line in SECTION_HEADERS:
+            section = line
+            continue
+        if line.startswith('Product: ') and not description:
+            description = line[len('Product: '):]
+        elif line.startswith('Item Number: '):
+            item_number = line[len('Item Number: '):]
+            section = None
+        elif line.startswith('Category: ') and section is None:
+            category = line[len('Category: '):]
+        elif section == MATERIAL_SECTION:
+            materials.append(line.split(': ', 1)[-1])
+        elif section in DIMENSION_SECTIONS and len(dimensions) < MAX_SUMMARY_DIMENSIONS:
+            key = line.split(': ', 1)[0]
+            if ': ' in line and DIMENSION_KEY_PATTERN.search(key):
+                dimensions.append(line)
+
+    parts = []
+    if description:
+        parts.append(f"Product: {description}")
+    identifiers = f"Item Number: {item_number}"
+    if category:
+        identifiers += f" | Category: {category}"
+    parts.append(identifiers)
+    if materials:
+        parts.append(f"Material/Application: {'; '.join(materials)}")
+    if dimensions:
+        parts.append(f"Key dimensions: {'; '.join(dimensions)}")
+    return '\n'.join(parts)
+
+
+class ContextPacker:
+    """Fills CONTEXT_TOKEN_BUDGET with product summaries first, then upgrades the most relevant to full text"""
+
+    def __init__(self, token_budget=None, model_name='gpt-4o-mini'):
+        self.token_budget = int(token_budget or os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+        self._encoding = self._load_encoding(model_name)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.context_tokens = 0
+        self.full_documents = 0
+        self.summary_documents = 0
+        self.dropped_documents = 0
+
+    @staticmethod
+    def _load_encoding(model_name):
+        """tiktoken encoding for the model, or None to fall back to ~4 characters per token"""
+        try:
+            import tiktoken
+            return tiktoken.encoding_for_model(model_name)
+        except Exception as e:
+            print(f"[WARN] tiktoken unavailable ({e}) - estimating context tokens as characters / 4")
+            return None
+
+    def count_tokens(self, text):
+        if self._encoding is None:
+            return (len(text) + 3) // 4
+        return len(self._encoding.encode(text))
+
+    def pack(self, documents):
+        """
+        Build the context string for documents (most relevant first)
+
+        Returns (context, stats) where stats has the tokens used and how many products
+        went in as full text, as summaries or not at all.
+        """
+        separator_tokens = self.count_tokens(DOCUMENT_SEPARATOR)
+        full_texts = [doc.page_content for doc in documents]
+        summaries = [doc.metadata.get('summary') or summarize_product_text(doc.page_content) for doc in documents]
+        full_tokens = [self.count_tokens(text) for text in full_texts]
+        summary_tokens = [min(self.count_tokens(text), full) for text, full in zip(summaries, full_tokens)]
+
+        # Pass 1: a summary for as many products as fit, in relevance order
+        chosen = []
+        used = 0
+        for index, tokens in enumerate(summary_tokens):
+            cost = tokens + (separator_tokens if chosen else 0)
+            if used + cost > self.token_budget:
+                break
+            chosen.append(index)
+            used += cost
+
+        # Pass 2: upgrade to the full document, most relevant first, while the budget allows
+        full = set()
+        for index in chosen:
+            extra = full_tokens[index] - summary_tokens[index]
+            if used + extra <= self.token_budget:
+                full.add(index)
+                used += extra
+
+        context = DOCUMENT_SEPARATOR.join(
+            full_texts[index] if index in full else summaries[index] for index in chosen
+        )
+        stats = {
+            "context_tokens": used,
+            "token_budget": self.token_budget,
+            "full_documents": len(full),
+            "summary_documents": len(chosen) - len(full),
+            "dropped_documents": len(documents) - len(chosen),
+        }
+        with self._lock:
+            self.requests += 1
+            self.context_tokens += used
+            self.full_documents += stats["full_documents"]
+            self.summary_documents += stats["summary_documents"]
+            self.dropped_documents += stats["dropped_documents"]
+        return context, stats
+
+    def stats(self):
+        """Average context size and how products were packed"""
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "tokenizer": self._encoding.name if self._encoding is not None else "chars/4",
+                "requests": self.requests,
+                "avg_context_tokens": round(self.context_tokens / self.requests, 1) if self.requests else 0.0,
+                "full_documents": self.full_documents,
+                "summary_documents": self.summary_documents,
+                "dropped_documents": self.dropped_documents,
+            }
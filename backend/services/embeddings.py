@@ -1,25 +1,24 @@
 """
 Sentence Transformer and ChromaDB service for embeddings
 """
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+from services.model_registry import get_chroma_client, get_embedding_backend, get_encoder
 
 class EmbeddingService:
     """Service for generating and managing embeddings"""
     
-    def __init__(self):
-        """Initialize Sentence Transformer and ChromaDB"""
+    def __init__(self, backend=None):
+        """Initialize Sentence Transformer and ChromaDB (backend: 'torch' or 'onnx', default EMBEDDING_BACKEND)"""
         # All configuration hardcoded (no .env required)
         # Using all-MiniLM-L6-v2 for faster embedding generation (384 dims vs 768)
         self.embedding_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
         self.chroma_persist_dir = './scripts/scripts/chroma_db'
+        self.embedding_backend = get_embedding_backend(backend)
+        # What the stored vectors were encoded with: int8 vectors differ slightly from torch ones
+        self.embedding_model_id = self.embedding_model_name + ('' if self.embedding_backend == 'torch' else '@onnx-int8')
         
-        print(f"Loading Sentence Transformer model: {self.embedding_model_name}")
-        self.model = SentenceTransformer(self.embedding_model_name)
-        
-        print(f"Initializing ChromaDB at: {self.chroma_persist_dir}")
-        self.client = chromadb.PersistentClient(path=self.chroma_persist_dir)
+        # Shared with LangChainService through the model registry (loaded once per process)
+        self.model = get_encoder(self.embedding_model_name, backend=self.embedding_backend)
+        self.client = get_chroma_client(self.chroma_persist_dir)
         
         # Create or get collection
         self.collection = None
@@ -36,9 +35,9 @@ class EmbeddingService:
         """Generate embedding for text"""
         return self.model.encode(text, convert_to_tensor=False)
     
-    def encode_batch(self, texts):
+    def encode_batch(self, texts, show_progress_bar=True):
         """Generate embeddings for batch of texts"""
-        return self.model.encode(texts, convert_to_tensor=False, show_progress_bar=True)
+        return self.model.encode(texts, convert_to_tensor=False, show_progress_bar=show_progress_bar)
     
     def add_to_collection(self, ids, embeddings, documents, metadatas):
         """Add embeddings to ChromaDB collection"""
@@ -52,6 +51,42 @@ class EmbeddingService:
             metadatas=metadatas
         )
     
+    def upsert_to_collection(self, ids, embeddings, documents, metadatas):
+        """Insert new ids and replace existing ones"""
+        if self.collection is None:
+            raise ValueError("Collection not initialized. Call get_or_create_collection() first")
+        
+        # Chroma's upsert/update merge metadata keys, so a key the product no longer has
+        # (e.g. a removed dimension) would survive - delete and re-add instead
+        self.collection.delete(ids=ids)
+        self.collection.add(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas
+        )
+    
+    def update_metadata_in_collection(self, ids, metadatas):
+        """Replace metadata of existing ids, keeping their stored embeddings and documents"""
+        if self.collection is None:
+            raise ValueError("Collection not initialized. Call get_or_create_collection() first")
+        
+        stored = self.collection.get(ids=ids, include=['embeddings', 'documents'])
+        by_id = dict(zip(ids, metadatas))
+        self.upsert_to_collection(
+            ids=stored['ids'],
+            embeddings=stored['embeddings'],
+            documents=stored['documents'],
+            metadatas=[by_id[item_id] for item_id in stored['ids']]
+        )
+    
+    def delete_from_collection(self, ids):
+        """Delete ids from the collection"""
+        if self.collection is None:
+            raise ValueError("Collection not initialized. Call get_or_create_collection() first")
+        
+        self.collection.delete(ids=ids)
+    
     def query_collection(self, query_embedding, n_results=5):
         """Query collection with embedding"""
         if self.collection is None:
@@ -0,0 +1,359 @@
+"""
+SQL side of the product export
+Sources wrap the database driver (pyodbc for SQL Server, sqlite3 for a local stand-in with the
+same schema) and iter_joined_products() streams products with their specifications and data
+using three ordered, set-based queries instead of two queries per product
+
+Delta exports pass changed_since=(watermark column, value) to read only the rows whose
+UpdateIndex / Timestamp moved past the last export, and partitioned exports pass
+key_range=(low, high) to read one slice of the product key (see partition_bounds)
+"""
+import sqlite3
+import threading
+
+# Products that are exported (Danish market, not deleted, no purchase items)
+PRODUCT_FILTER_TEMPLATE = (
+    "{alias}.IsDeleted = 0 AND {alias}.Parent != 'purchases' AND {alias}.MarketsSerialized LIKE '%001%'"
+)
+PRODUCT_FILTER = PRODUCT_FILTER_TEMPLATE.format(alias='p')
+DEFAULT_FETCH_SIZE = 5000
+
+
+class SqlServerSource:
+    """SQL Server over pyodbc (ODBC Driver 17)"""
+
+    name = 'sqlserver'
+    # Binary collation for the merge order: code point order, whatever the column collations are
+    key_collation = 'Latin1_General_BIN2'
+
+    def __init__(self, connection_string):
+        self.connection_string = connection_string
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def table_columns(self, conn, table_name):
+        """[(column, data type, nullable), ...] in table order"""
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION",
+            table_name
+        )
+        columns = [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        cursor.close()
+        return columns
+
+
+class SqliteSource:
+    """SQLite file with the same tables - for tests and benchmarks without SQL Server"""
+
+    name = 'sqlite'
+    key_collation = 'BINARY'
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def connect(self):
+        # A ConnectionPool may hand the connection to another worker thread (one at a time)
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def table_columns(self, conn, table_name):
+        rows = conn.execute(f"PRAGMA table_info([{table_name}])").fetchall()
+        return [(row[1], row[2], 'NO' if row[3] else 'YES') for row in rows]
+
+
+class ConnectionPool:
+    """
+    Source that reuses connections: close() on a pooled connection returns it to the pool
+    Lets the partition workers of a parallel export share a few connections instead of
+    logging in again for every partition
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.name = source.name
+        self.key_collation = source.key_collation
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self.source.connect()
+            with self._lock:
+                self.opened += 1
+        return _PooledConnection(conn, self)
+
+    def table_columns(self, conn, table_name):
+        return self.source.table_columns(conn, table_name)
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class _PooledConnection:
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+        self._cursors = []
+
+    def cursor(self):
+        cursor = self._conn.cursor()
+        self._cursors.append(cursor)
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        # Discard unread results first; a connection that fails at that is not reused
+        try:
+            for cursor in self._cursors:
+                cursor.close()
+        except Exception:
+            self._conn.close()
+            return
+        self._pool._release(self._conn)
+
+
+def iter_rows(cursor, fetch_size=DEFAULT_FETCH_SIZE):
+    """Rows of an executed cursor, fetched fetch_size at a time"""
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def execute(cursor, query, params=()):
+    """Execute with parameters only if there are any (pyodbc and sqlite3 differ on empty ones)"""
+    if params:
+        cursor.execute(query, params)
+    else:
+        cursor.execute(query)
+    return cursor
+
+
+def merge_key(value):
+    """
+    Key as the database compares it: SQL Server's default collation ignores case and
+    trailing spaces, so 'w123 ' in ProductSpecifications belongs to 'W123' in Products
+    """
+    return str(value).rstrip().casefold() if value is not None else None
+
+
+def _merge_order(column, collation):
+    """
+    ORDER BY expression that sorts like merge_key() in Python: trimmed, lower case, binary
+    collation. The three merged streams must use it - a column's own collation (varchar vs
+    nvarchar, SQL collations that ignore hyphens) can order the same keys differently.
+    """
+    return f"LOWER(RTRIM({column})) COLLATE {collation}"
+
+
+def _quote(columns, alias=None):
+    prefix = f"{alias}." if alias else ''
+    return ', '.join(f"{prefix}[{column}]" for column in columns)
+
+
+def _product_where(changed_since, id_column=None, key_range=None):
+    """
+    WHERE clause and parameters for exported products, optionally only those changed since a
+    watermark and / or with low <= key < high (None for an open end; the first range also
+    takes NULL keys)
+    """
+    clauses, params = [], []
+    if changed_since is not None:
+        column, value = changed_since
+        clauses.append(f"p.[{column}] > ?")
+        params.append(value)
+    if key_range is not None:
+        low, high = key_range
+        if low is not None:
+            clauses.append(f"p.[{id_column}] >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"(p.[{id_column}] < ?{f' OR p.[{id_column}] IS NULL' if low is None else ''})")
+            params.append(high)
+    clauses.append(PRODUCT_FILTER)
+    return ' AND '.join(clauses), tuple(params)
+
+
+def _child_query(table, columns, join_column, id_column, product_where, collation):
+    # Semi-join, so duplicate item numbers in Products do not duplicate child rows
+    return f"""
+    SELECT {_quote(columns, 'c')}
+    FROM {table} c
+    WHERE c.[{join_column}] IN (SELECT p.[{id_column}] FROM Products p WHERE {product_where})
+    ORDER BY {_merge_order(f'c.[{join_column}]', collation)}
+    """
+
+
+def max_watermark(conn, column):
+    """Highest watermark (UpdateIndex / Timestamp) in Products, taken before reading the rows"""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MAX(p.[{column}]) FROM Products p")
+    value = cursor.fetchone()[0]
+    cursor.close()
+    return value
+
+
+def partition_bounds(conn, id_column, partitions):
+    """
+    Split the exported products into up to `partitions` key ranges of similar size
+    Returns the lower bound of every range, in key order: [None, b1, b2, ...] where range i
+    is bounds[i] <= key < bounds[i + 1]. Bounds come from the database's own ordering, so
+    the ranges follow its collation (and duplicate keys never straddle two ranges).
+    """
+    cursor = conn.cursor()
+    execute(cursor, f"""
+    SELECT MIN(t.[key])
+    FROM (
+        SELECT p.[{id_column}] AS [key], NTILE({int(partitions)}) OVER (ORDER BY p.[{id_column}]) AS bucket
+        FROM Products p
+        WHERE p.[{id_column}] IS NOT NULL AND {PRODUCT_FILTER}
+    ) t
+    GROUP BY t.bucket
+    ORDER BY t.bucket
+    """)
+    bounds = [None]
+    for (low,) in cursor.fetchall()[1:]:
+        # A run of equal keys can fill several buckets
+        if len(bounds) == 1 or merge_key(low) != merge_key(bounds[-1]):
+            bounds.append(low)
+    cursor.close()
+    return bounds
+
+
+def iter_tombstones(source, changed_since, id_column='SanitizedItemNumber', fetch_size=DEFAULT_FETCH_SIZE):
+    """
+    Item numbers of products changed since the watermark that are no longer exported
+    (IsDeleted = 1, moved to purchases or dropped from market 001)
+    An item number that another row still exports under (changed or not) is not a tombstone
+    """
+    column, value = changed_since
+    conn = source.connect()
+    try:
+        cursor = conn.cursor()
+        execute(cursor, f"""
+        SELECT DISTINCT p.[{id_column}]
+        FROM Products p
+        WHERE p.[{column}] > ? AND (CASE WHEN {PRODUCT_FILTER} THEN 1 ELSE 0 END) = 0
+          AND NOT EXISTS (
+              SELECT 1 FROM Products live
+              WHERE live.[{id_column}] = p.[{id_column}] AND {PRODUCT_FILTER_TEMPLATE.format(alias='live')}
+          )
+        """, (value,))
+        for row in iter_rows(cursor, fetch_size):
+            if row[0] is not None:
+                yield row[0]
+    finally:
+        conn.close()
+
+
+def iter_joined_products(source, products_columns, specs_columns, data_columns,
+                         id_column='SanitizedItemNumber', fetch_size=DEFAULT_FETCH_SIZE, changed_since=None,
+                         key_range=None):
+    """
+    Yield product dicts with 'specifications' and 'product_data' lists
+
+    Products, ProductSpecifications and ProductData are read as three streams ordered by
+    the product key (child tables join on their first column, as before) and merged by
+    key equality. All three are ordered with the same explicit collation (_merge_order), so
+    each product's child rows arrive contiguously and in product order; a stream that is out
+    of order or has rows left at the end raises instead of leaving products without children.
+    Each stream has its own connection, since SQL Server allows one active result set per
+    connection.
+    changed_since=(column, value) limits all three streams to products changed after value,
+    key_range=(low, high) to one partition of the key (see partition_bounds).
+    """
+    product_where, params = _product_where(changed_since, id_column, key_range)
+    connections = []
+    try:
+        conn = source.connect()
+        connections.append(conn)
+        products_cursor = conn.cursor()
+        execute(products_cursor, f"""
+        SELECT {_quote(products_columns, 'p')}
+        FROM Products p
+        WHERE {product_where}
+        ORDER BY {_merge_order(f'p.[{id_column}]', source.key_collation)}
+        """, params)
+
+        children = []
+        for field, table, columns in (
+            ('specifications', 'ProductSpecifications', specs_columns),
+            ('product_data', 'ProductData', data_columns),
+        ):
+            if not columns:
+                continue
+            child_conn = source.connect()
+            connections.append(child_conn)
+            cursor = child_conn.cursor()
+            execute(cursor, _child_query(table, columns, columns[0], id_column, product_where, source.key_collation),
+                    params)
+            children.append(_ChildStream(field, columns, iter_rows(cursor, fetch_size)))
+
+        id_index = products_columns.index(id_column)
+        previous = None
+        for row in iter_rows(products_cursor, fetch_size):
+            product = dict(zip(products_columns, row))
+            key = merge_key(row[id_index])
+            if key is not None and previous is not None and key < previous:
+                raise RuntimeError(f"Products are not in merge order: {row[id_index]!r} after {previous!r}")
+            previous = key if key is not None else previous
+            for child in children:
+                product[child.field] = child.rows_for(key)
+            yield product
+        for child in children:
+            if child.pending is not None:
+                raise RuntimeError(
+                    f"{child.field}: rows left after the last product (key {child.pending[0]!r}) - "
+                    f"the streams are not in the same order"
+                )
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+class _ChildStream:
+    """Ordered child rows, handed out per product key"""
+
+    def __init__(self, field, columns, rows):
+        self.field = field
+        self.columns = columns
+        self.rows = rows
+        self.pending = next(self.rows, None)
+        self.last_key = None
+        self.last_rows = []
+
+    def rows_for(self, key):
+        # Duplicate product keys are adjacent in the ordered stream and share their children
+        if key == self.last_key:
+            return [dict(row) for row in self.last_rows]
+        matched = []
+        while self.pending is not None:
+            child_key = merge_key(self.pending[0])
+            if child_key != key:
+                # Rows for a key before this product would never be matched - the streams disagree on order
+                if child_key is not None and key is not None and child_key < key:
+                    raise RuntimeError(
+                        f"{self.field}: row for {self.pending[0]!r} is out of order (current product {key!r})"
+                    )
+                break
+            matched.append(dict(zip(self.columns, self.pending)))
+            self.pending = next(self.rows, None)
+        self.last_key = key
+        self.last_rows = matched
+        return matched
@@ -0,0 +1,271 @@
+"""
+Product export writers used by export_data.py
+Products are written to disk as they are fetched, so the export never holds the catalog in memory
+
+- ShardedExportWriter: data/products_export/ with JSON Lines shards (gzip by default),
+  meta_fields.json and a manifest.json with row counts and sha256 checksums
+- PartitionedExportWriter: the same layout, one shard per key range, written concurrently
+  and checkpointed so an interrupted export resumes (export_data.py --partitions)
+- JsonExportWriter: the legacy products_joined.json layout, compact and streamed
+
+Delta exports (export_data.py --delta) use the sharded layout under data/products_delta/<name>/,
+with changed products in the shards and removed item numbers in tombstones.jsonl
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+
+EXPORT_FORMAT = 'products-jsonl-shards/1'
+EXPORT_DIR_NAME = 'products_export'
+LEGACY_EXPORT_NAME = 'products_joined.json'
+MANIFEST_NAME = 'manifest.json'
+META_FIELDS_NAME = 'meta_fields.json'
+TOMBSTONES_NAME = 'tombstones.jsonl'
+CHECKPOINT_NAME = 'checkpoint.json'
+DELTA_DIR_NAME = 'products_delta'
+DEFAULT_SHARD_SIZE = 50000
+
+
+def json_default(value):
+    """JSON for the SQL Server types pyodbc returns (datetime, Decimal, rowversion bytes, GUIDs)"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        # rowversion / Timestamp columns are 8 bytes - hex keeps them readable and comparable
+        return value.hex() if len(value) <= 8 else base64.b64encode(value).decode('ascii')
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Compact single-line JSON (no indent, UTF-8 kept as-is)"""
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=json_default)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _StagedExport:
+    """
+    Shards are written to a staging directory that replaces path on publish, so readers
+    never see a half-written export
+    """
+
+    def __init__(self, output_dir, compress=True):
+        self.path = Path(output_dir)
+        self.compress = compress
+        self.staging_dir = self.path.with_name(self.path.name + '.partial')
+        self.shards = []
+        self.rows = 0
+
+    def _shard_name(self, index):
+        return f"products-{index:05d}.jsonl" + ('.gz' if self.compress else '')
+
+    def _open_shard_file(self, path):
+        if self.compress:
+            return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        return open(path, 'w', encoding='utf-8')
+
+    def _file_entry(self, name, rows):
+        path = self.staging_dir / name
+        return {'file': name, 'rows': rows, 'bytes': path.stat().st_size, 'sha256': file_sha256(path)}
+
+    def _publish(self, meta_fields, extra):
+        """Write meta_fields and the manifest, then swap the staging directory in"""
+        with open(self.staging_dir / META_FIELDS_NAME, 'w', encoding='utf-8') as f:
+            f.write(dumps(meta_fields))
+
+        manifest = {
+            'format': EXPORT_FORMAT,
+            'created_at': datetime.utcnow().isoformat(),
+            'products': self.rows,
+            'compressed': self.compress,
+            'shards': self.shards,
+            'meta_fields': self._file_entry(META_FIELDS_NAME, len(meta_fields)),
+            **extra,
+        }
+        with open(self.staging_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, default=json_default)
+
+        # A directory cannot be os.replace'd over a non-empty one
+        old_dir = self.path.with_name(self.path.name + '.old')
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.path.exists():
+            os.replace(self.path, old_dir)
+        os.replace(self.staging_dir, self.path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return manifest
+
+
+class ShardedExportWriter(_StagedExport):
+    """Writes products to numbered JSON Lines shards of shard_size rows"""
+
+    def __init__(self, output_dir, shard_size=DEFAULT_SHARD_SIZE, compress=True):
+        super().__init__(output_dir, compress)
+        self.shard_size = shard_size
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.staging_dir.mkdir(parents=True)
+
+        self.tombstones = 0
+        self._file = None
+        self._shard_rows = 0
+        self._tombstone_file = None
+
+    def _open_shard(self):
+        self._current_shard = self._shard_name(len(self.shards))
+        self._file = self._open_shard_file(self.staging_dir / self._current_shard)
+        self._shard_rows = 0
+
+    def _close_shard(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.shards.append(self._file_entry(self._current_shard, self._shard_rows))
+
+    def write(self, product):
+        if self._file is None or self._shard_rows >= self.shard_size:
+            self._close_shard()
+            self._open_shard()
+        self._file.write(dumps(product))
+        self._file.write('\n')
+        self._shard_rows += 1
+        self.rows += 1
+
+    def write_tombstone(self, item_number):
+        """Record a product that must be removed (delta exports)"""
+        if self._tombstone_file is None:
+            self._tombstone_file = open(self.staging_dir / TOMBSTONES_NAME, 'w', encoding='utf-8')
+        self._tombstone_file.write(dumps({'SanitizedItemNumber': item_number}))
+        self._tombstone_file.write('\n')
+        self.tombstones += 1
+
+    def close(self, meta_fields, **extra):
+        """
+        Finish the last shard, write meta_fields and the manifest, then publish the directory
+        extra is stored in the manifest (delta exports record their kind and watermarks)
+        """
+        self._close_shard()
+        if self._tombstone_file is not None:
+            self._tombstone_file.close()
+            extra['tombstones'] = self._file_entry(TOMBSTONES_NAME, self.tombstones)
+        return self._publish(meta_fields, extra)
+
+
+class PartitionedExportWriter(_StagedExport):
+    """
+    One shard per key-range partition, written concurrently by export_data.py --partitions
+
+    Finished partitions are recorded in a checkpoint in the staging directory, so an
+    interrupted export resumes with the partitions that are missing (and the same plan).
+    """
+
+    def __init__(self, output_dir, compress=True):
+        super().__init__(output_dir, compress)
+        self.checkpoint_path = self.staging_dir / CHECKPOINT_NAME
+        self.checkpoint = None
+        self._lock = threading.Lock()
+
+    def resume(self, schema):
+        """
+        Pick up an unfinished export with the same schema (columns, key, partition count)
+        Returns its plan, or None if there is nothing to resume
+        """
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint['plan'].get('schema') != schema or checkpoint.get('compress') != self.compress:
+            return None
+        self.checkpoint = checkpoint
+        self.rows = sum(entry['rows'] for entry in checkpoint['done'].values())
+        return checkpoint['plan']
+
+    def start(self, plan):
+        """Begin a new export; plan['bounds'] has the lower key bound of every partition"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.staging_dir.mkdir(parents=True)
+        self.checkpoint = {'plan': plan, 'compress': self.compress, 'done': {}}
+        self.rows = 0
+        self._save_checkpoint(self.checkpoint)
+
+    def _save_checkpoint(self, checkpoint):
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, indent=2, default=json_default)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def is_done(self, index):
+        return str(index) in self.checkpoint['done']
+
+    def write_partition(self, index, products):
+        """Write one partition's products to its shard (thread-safe) and checkpoint it"""
+        name = self._shard_name(index)
+        tmp_path = self.staging_dir / (name + '.tmp')
+        rows = 0
+        with self._open_shard_file(tmp_path) as f:
+            for product in products:
+                f.write(dumps(product))
+                f.write('\n')
+                rows += 1
+        os.replace(tmp_path, self.staging_dir / name)
+        entry = self._file_entry(name, rows)
+        with self._lock:
+            self.checkpoint['done'][str(index)] = entry
+            self.rows += rows
+            self._save_checkpoint(self.checkpoint)
+        return entry
+
+    def close(self, meta_fields, **extra):
+        """Publish once every partition is done (shards in key order)"""
+        partitions = len(self.checkpoint['plan']['bounds'])
+        missing = [index for index in range(partitions) if not self.is_done(index)]
+        if missing:
+            raise RuntimeError(f"Partitions {missing} are not exported yet")
+        self.shards = [self.checkpoint['done'][str(index)] for index in range(partitions)]
+        self.checkpoint_path.unlink()
+        return self._publish(meta_fields, extra)
+
+
+class JsonExportWriter:
+    """Streams the legacy {"products": [...], "meta_fields": [...]} file, one compact product per line"""
+
+    def __init__(self, output_file):
+        self.path = Path(output_file)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_file = self.path.with_suffix(self.path.suffix + '.tmp')
+        self._file = open(self.tmp_file, 'w', encoding='utf-8')
+        self._file.write('{"products":[\n')
+        self.rows = 0
+
+    def write(self, product):
+        if self.rows:
+            self._file.write(',\n')
+        self._file.write(dumps(product))
+        self.rows += 1
+
+    def close(self, meta_fields):
+        self._file.write('\n],\n"meta_fields":')
+        self._file.write(dumps(meta_fields))
+        self._file.write('}\n')
+        self._file.close()
+        os.replace(self.tmp_file, self.path)
+        return {'products': self.rows, 'meta_fields': len(meta_fields)}
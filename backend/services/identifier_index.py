@@ -0,0 +1,185 @@
+"""
+Item-number / EAN lookup index
+Built by setup_embeddings.py from products_joined.json so pasted identifiers skip retrieval and the LLM
+"""
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+IDENTIFIER_INDEX_PATH = './scripts/scripts/identifier_index.json'
+
+# Words customers put around a pasted identifier ("EAN 5701234567890", "item no. W381195-2125412")
+IDENTIFIER_LABELS = {
+    'ean', 'item', 'number', 'no', 'nr', 'sku', 'art', 'product', 'varenr', 'varenummer', 'vare', '#',
+}
+TOKEN_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def normalize_identifier(text):
+    """
+    Case and '.' vs '-' do not matter ('w381195-2125412' and 'W381195.2125412' share a key),
+    other separators and their positions do ('12-345' and '123-45' are different items)
+    """
+    return (text or '').strip().casefold().replace('.', '-')
+
+
+def _add(mapping, key, item_number):
+    # A key may still belong to several items ("AB-1" and "ab.1"); all are kept so lookup can tell
+    item_numbers = mapping.setdefault(key, [])
+    if item_number not in item_numbers:
+        item_numbers.append(item_number)
+
+
+def _add_identifiers(items, eans, products):
+    for item_number, ean in products:
+        if not item_number:
+            continue
+        _add(items, normalize_identifier(item_number), item_number)
+        ean = str(ean or '').strip()
+        if ean:
+            _add(eans, normalize_identifier(ean), item_number)
+
+
+def _read_index(data):
+    """(items, eans) as key -> [item numbers]; item keys are rebuilt, so older index files still load"""
+    items = {}
+    for item_numbers in data.get("items", {}).values():
+        for item_number in item_numbers if isinstance(item_numbers, list) else [item_numbers]:
+            _add(items, normalize_identifier(item_number), item_number)
+    eans = {
+        key: item_numbers if isinstance(item_numbers, list) else [item_numbers]
+        for key, item_numbers in data.get("eans", {}).items()
+    }
+    return items, eans
+
+
+def _write_index(path, items, eans):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"built_at": datetime.utcnow().isoformat(), "items": items, "eans": eans}, f)
+    # Atomic replace so a running server never reads a half-written index
+    os.replace(tmp_path, path)
+    return len(items), len(eans)
+
+
+def write_identifier_index(path, products):
+    """Write the index from (item_number, ean) pairs"""
+    items = {}
+    eans = {}
+    _add_identifiers(items, eans, products)
+    return _write_index(path, items, eans)
+
+
+def _without(mapping, item_numbers):
+    kept = {key: [item for item in items if item not in item_numbers] for key, items in mapping.items()}
+    return {key: items for key, items in kept.items() if items}
+
+
+def update_identifier_index(path, products, removed):
+    """Apply changed (item_number, ean) pairs and removed item numbers to an existing index"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    removed = set(removed)
+    changed = {item_number for item_number, _ in products if item_number}
+    # A changed product may have a new EAN, so its old one is dropped too
+    stale = removed | changed
+    items, eans = _read_index(data)
+    items = _without(items, removed)
+    eans = _without(eans, stale)
+    _add_identifiers(items, eans, products)
+    return _write_index(path, items, eans)
+
+
+class IdentifierIndex:
+    """Dictionary lookup of normalized item numbers and EANs -> SanitizedItemNumber"""
+
+    def __init__(self, index_path=IDENTIFIER_INDEX_PATH):
+        self.index_path = index_path
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.built_at = data.get("built_at")
+        self.items, self.eans = _read_index(data)
+
+        self._lock = threading.Lock()
+        self.messages_checked = 0
+        self.identifier_only_messages = 0
+
+    def lookup(self, identifier):
+        """SanitizedItemNumber for an item number or EAN, or None if unknown or ambiguous"""
+        key = normalize_identifier(identifier)
+        item_numbers = set(self.items.get(key, [])) | set(self.eans.get(key, []))
+        # Several products under one key: let normal retrieval sort it out
+        return item_numbers.pop() if len(item_numbers) == 1 else None
+
+    def match_message(self, message):
+        """
+        [(identifier, item_number), ...] if the message is nothing but known identifiers
+        (optionally labelled, e.g. "EAN 5701234567890"), otherwise None
+        """
+        with self._lock:
+            self.messages_checked += 1
+
+        matches = []
+        for token in TOKEN_SEPARATORS.split(message.strip()):
+            token = token.strip('"\'.:()[]<>')
+            if not token or token.casefold() in IDENTIFIER_LABELS:
+                continue
+            # Anything that is not a known identifier (every identifier has a digit) means a real question
+            item_number = self.lookup(token) if any(c.isdigit() for c in token) else None
+            if item_number is None:
+                return None
+            matches.append((token, item_number))
+
+        if not matches:
+            return None
+        with self._lock:
+            self.identifier_only_messages += 1
+        return matches
+
+    def stats(self):
+        with self._lock:
+            return {
+                "built_at": self.built_at,
+                "item_numbers": len(self.items),
+                "eans": len(self.eans),
+                "messages_checked": self.messages_checked,
+                "identifier_only_messages": self.identifier_only_messages,
+            }
+
+
+# Global instance, reloaded when setup_embeddings.py replaces the file
+identifier_index = None
+_identifier_index_mtime = None
+_identifier_index_lock = threading.Lock()
+
+
+def get_identifier_index():
+    """Get the identifier index (IDENTIFIER_INDEX_PATH), or None if it has not been built"""
+    global identifier_index, _identifier_index_mtime
+    path = os.getenv("IDENTIFIER_INDEX_PATH", IDENTIFIER_INDEX_PATH)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if mtime != _identifier_index_mtime:
+        with _identifier_index_lock:
+            if mtime != _identifier_index_mtime:
+                try:
+                    identifier_index = IdentifierIndex(path)
+                    print(
+                        f"Loaded identifier index ({len(identifier_index.items)} item numbers, "
+                        f"{len(identifier_index.eans)} EANs)"
+                    )
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Could not load identifier index {path}: {e}")
+                    identifier_index = None
+                _identifier_index_mtime = mtime
+    return identifier_index
@@ -0,0 +1,226 @@
+"""
+Staged ingest for setup_embeddings.py: embedding and ChromaDB writes in their own threads
+
+The main thread reads products, builds texts (ProductPreparer) and decides what changed;
+EncodeWritePipeline encodes and persists in the background, so the encoder does not wait for
+Chroma writes and Chroma does not wait for the encoder. Stages are connected by bounded
+queues (at most queue_size chunks between two stages), so memory stays flat however far
+ahead the build stage gets. Per-stage StageStats show which stage is the bottleneck.
+"""
+import os
+import queue
+import threading
+import time
+
+# Texts per encode_batch call and rows per Chroma write, overridable with
+# ENCODE_BATCH_SIZE / WRITE_BATCH_SIZE / INGEST_QUEUE_SIZE
+DEFAULT_ENCODE_BATCH_SIZE = 256
+DEFAULT_WRITE_BATCH_SIZE = 1000
+DEFAULT_QUEUE_SIZE = 4
+
+
+class StageStats:
+    """Work and waiting time of one pipeline stage, and the depth of its input queue"""
+
+    def __init__(self, name, unit='products'):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.calls = 0
+        self.busy_seconds = 0.0
+        # Waiting for input (starved) / for room in the next queue (backpressure)
+        self.wait_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+    def sample_depth(self, depth):
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def throughput(self):
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def report(self):
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'calls': self.calls,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'wait_seconds': round(self.wait_seconds, 3),
+            'blocked_seconds': round(self.blocked_seconds, 3),
+            'items_per_second': round(self.throughput(), 1),
+            'queue_depth_avg': round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0.0,
+            'queue_depth_max': self.max_depth,
+        }
+
+
+class _Stage(threading.Thread):
+    """
+    Worker thread over a bounded input queue
+    After an error the stage keeps draining its queue (so producers never block forever)
+    and the pipeline re-raises the error on the next call
+    """
+
+    def __init__(self, name, queue_size, handle, unit='products'):
+        super().__init__(name=f"ingest-{name}", daemon=True)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats(name, unit)
+        self.handle = handle
+        self.error = None
+
+    def put(self, item, producer_stats):
+        self.stats.sample_depth(self.queue.qsize())
+        started = time.perf_counter()
+        self.queue.put(item)
+        producer_stats.blocked_seconds += time.perf_counter() - started
+
+    def run(self):
+        while True:
+            started = time.perf_counter()
+            item = self.queue.get()
+            self.stats.wait_seconds += time.perf_counter() - started
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.handle(item)
+            except Exception as e:
+                self.error = e
+
+
+class EncodeWritePipeline:
+    """
+    encode() / update_metadata() return as soon as the work is queued; flush() waits until
+    everything queued so far is in the collection. Chroma is only written from the write
+    thread, in the order the rows were encoded.
+    """
+
+    def __init__(self, embedding_service, encode_batch_size=None, write_batch_size=None, queue_size=None):
+        self.embedding_service = embedding_service
+        self.encode_batch_size = encode_batch_size or int(os.getenv("ENCODE_BATCH_SIZE", DEFAULT_ENCODE_BATCH_SIZE))
+        self.write_batch_size = write_batch_size or int(os.getenv("WRITE_BATCH_SIZE", DEFAULT_WRITE_BATCH_SIZE))
+        self.queue_size = queue_size or int(os.getenv("INGEST_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        # Reading, text building and change detection on the caller's thread
+        self.build = StageStats('build')
+        self.metadata_updates = 0
+        self._to_encode = []
+        self._to_write = []
+        self.encoder = _Stage('encode', self.queue_size, self._encode_item)
+        self.writer = _Stage('write', self.queue_size, self._write_item)
+        self.encoder.start()
+        self.writer.start()
+        self.closed = False
+
+    def _check(self):
+        for stage in (self.encoder, self.writer):
+            if stage.error is not None:
+                raise RuntimeError(f"Ingest {stage.stats.name} stage failed: {stage.error}") from stage.error
+
+    def encode(self, ids, texts, metadatas):
+        """Queue products for encoding and writing"""
+        self._check()
+        if ids:
+            self.encoder.put(('rows', list(zip(ids, texts, metadatas))), self.build)
+
+    def update_metadata(self, ids, metadatas):
+        """Queue a metadata-only update (stored embedding and document are kept)"""
+        self._check()
+        if ids:
+            self.writer.put(('metadata', ids, metadatas), self.build)
+
+    def flush(self):
+        """Wait until everything queued so far is encoded and written"""
+        self._check()
+        done = threading.Event()
+        self.encoder.put(('flush', done), self.build)
+        while not done.wait(0.5):
+            self._check()
+        self._check()
+
+    def close(self):
+        """Stop the stage threads (call flush() first - anything still queued is dropped)"""
+        if self.closed:
+            return
+        self.closed = True
+        for stage in (self.encoder, self.writer):
+            stage.put(None, self.build)
+            stage.join()
+
+    def _encode_item(self, item):
+        if item[0] == 'flush':
+            if self._to_encode:
+                self._encode(len(self._to_encode))
+            self.writer.put(item, self.encoder.stats)
+            return
+        self._to_encode.extend(item[1])
+        while len(self._to_encode) >= self.encode_batch_size:
+            self._encode(self.encode_batch_size)
+
+    def _encode(self, count):
+        rows, self._to_encode = self._to_encode[:count], self._to_encode[count:]
+        stats = self.encoder.stats
+        started = time.perf_counter()
+        # No per-call progress bar - print_report() covers throughput
+        embeddings = self.embedding_service.encode_batch([text for _, text, _ in rows], show_progress_bar=False)
+        stats.busy_seconds += time.perf_counter() - started
+        stats.items += len(rows)
+        stats.calls += 1
+        self.writer.put(('rows', [
+            (item_id, embedding, text, metadata)
+            for (item_id, text, metadata), embedding in zip(rows, embeddings.tolist())
+        ]), stats)
+
+    def _write_item(self, item):
+        kind = item[0]
+        if kind == 'rows':
+            self._to_write.extend(item[1])
+            while len(self._to_write) >= self.write_batch_size:
+                self._write(self.write_batch_size)
+        elif kind == 'metadata':
+            started = time.perf_counter()
+            self.embedding_service.update_metadata_in_collection(ids=item[1], metadatas=item[2])
+            self.writer.stats.busy_seconds += time.perf_counter() - started
+            self.metadata_updates += len(item[1])
+        else:
+            if self._to_write:
+                self._write(len(self._to_write))
+            item[1].set()
+
+    def _write(self, count):
+        rows, self._to_write = self._to_write[:count], self._to_write[count:]
+        stats = self.writer.stats
+        started = time.perf_counter()
+        # Upsert, so re-runs do not fail on existing ids
+        self.embedding_service.upsert_to_collection(
+            ids=[row[0] for row in rows],
+            embeddings=[row[1] for row in rows],
+            documents=[row[2] for row in rows],
+            metadatas=[row[3] for row in rows]
+        )
+        stats.busy_seconds += time.perf_counter() - started
+        stats.items += len(rows)
+        stats.calls += 1
+
+    def stages(self):
+        return [self.build, self.encoder.stats, self.writer.stats]
+
+    def print_report(self):
+        print(f"Pipeline: encode batches of {self.encode_batch_size}, write batches of {self.write_batch_size}, "
+              f"queues of {self.queue_size}")
+        for stats in self.stages():
+            report = stats.report()
+            line = (f"  {stats.name:<7} {stats.items:>8} {stats.unit}  busy {report['busy_seconds']:7.1f}s  "
+                    f"{report['items_per_second']:>8,.0f}/s  waited {report['wait_seconds']:6.1f}s  "
+                    f"blocked {report['blocked_seconds']:6.1f}s")
+            if stats is not self.build:
+                line += f"  queue avg {report['queue_depth_avg']:.1f} / max {report['queue_depth_max']}"
+            print(line)
+        if self.metadata_updates:
+            print(f"  write   {self.metadata_updates} metadata-only updates")
+        bottleneck = max(self.stages(), key=lambda stats: stats.busy_seconds)
+        if bottleneck.busy_seconds:
+            print(f"  Bottleneck: {bottleneck.name} (most busy time)")
@@ -3,12 +3,20 @@ LangChain integration with ChromaDB and OpenAI
 Implements retrieval chain with conversation history
 """
 import os
+import asyncio
+import threading
+import time
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
+from langchain_core.output_parsers import StrOutputParser
+from langchain_community.callbacks import get_openai_callback
+from services.model_registry import SharedEncoderEmbeddings, get_chroma_client
+from services.query_embedding_cache import QueryEmbeddingCache
+from services.question_rewriter import QuestionRewriter
+from services.context_packer import ContextPacker
+from services.product_retriever import ProductRetriever
 
 class LangChainService:
     """Service for LangChain retrieval and conversation"""
@@ -29,41 +37,50 @@ class LangChainService:
         self.site_host = 'www.kyocera-unimerco.com'
         self.default_locale = 'en-dk'
         
+        # Maximum number of chat queries running at once (embedding + MMR search + LLM calls)
+        self.max_concurrent_queries = int(os.getenv("CHAT_MAX_CONCURRENCY", "8"))
+        self._query_semaphore = asyncio.Semaphore(self.max_concurrent_queries)
+        
+        # Seconds spent initialising each component (reported by /api/ready)
+        self.init_timings = {}
+        
         # Initialize embeddings (same model as used for creating embeddings)
-        print(f"Initializing HuggingFace embeddings: {self.embedding_model_name}")
-        self.embeddings = HuggingFaceEmbeddings(
+        # The encoder is shared with EmbeddingService through the model registry
+        # EMBEDDING_BACKEND=onnx switches to the int8 ONNX Runtime encoder (set it for setup_embeddings.py too)
+        started = time.perf_counter()
+        # Repeated queries skip the encoder (size: QUERY_EMBEDDING_CACHE_SIZE)
+        self.query_embedding_cache = QueryEmbeddingCache()
+        self.embeddings = SharedEncoderEmbeddings(
             model_name=self.embedding_model_name,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+            device='cpu',
+            normalize_embeddings=True,
+            query_cache=self.query_embedding_cache
         )
+        print(f"Initialized embeddings: {self.embedding_model_name} ({self.embeddings.backend} backend)")
+        self.init_timings['embedding_model'] = time.perf_counter() - started
         
         # Initialize OpenAI LLM
         print(f"Initializing OpenAI: {self.openai_model}")
+        started = time.perf_counter()
         self.llm = ChatOpenAI(
             model=self.openai_model,
             temperature=self.openai_temperature,
             openai_api_key=self.openai_api_key
         )
+        self.init_timings['openai_client'] = time.perf_counter() - started
         
         # Connect to ChromaDB
         print(f"Connecting to ChromaDB at: {self.chroma_persist_dir}")
+        started = time.perf_counter()
         self.vectorstore = Chroma(
-            persist_directory=self.chroma_persist_dir,
+            client=get_chroma_client(self.chroma_persist_dir),
             embedding_function=self.embeddings,
             collection_name="products"
         )
+        self.init_timings['chroma_client'] = time.perf_counter() - started
         
-        # Create retriever with increased results for better matches
-        # Higher k value ensures we get more product options to verify material compatibility
-        # Using MMR (Maximum Marginal Relevance) for diverse results instead of just similarity
-        self.retriever = self.vectorstore.as_retriever(
-            search_type="mmr",  # MMR gives more diverse results than pure similarity
-            search_kwargs={
-                "k": 25,  # Top 25 most similar products - more options to verify material match
-                "fetch_k": 50,  # Fetch 50 candidates before MMR filtering for diversity
-                "lambda_mult": 0.7  # Balance between relevance (1.0) and diversity (0.0)
-            }
-        )
+        # MMR retriever, pre-filtered on dimensions named in the question (see ProductRetriever)
+        self.retriever = ProductRetriever(self.vectorstore)
         
         # System prompt - optimized for user-friendly responses with inline product references
         self.product_link_base = f"https://{self.site_host}/{self.default_locale}/product-detail/"
@@ -150,13 +167,16 @@ Product 3 context contains text: "...circular saw 160mm diameter..."
 
 REMEMBER: If ANY part of the context mentions "wood" but user needs "metal", REJECT that product immediately.
 
-The context below contains COMPLETE product information including:
+The context below contains product information including:
 - Product descriptions (main, secondary, additional)
 - Item Number and Category
 - Specifications (dimensions, materials, technical details)
 - Attributes (material type, application, filter metadata)
 - Additional Information (product data)
 
+Less relevant products may be given as a compact summary instead (Product, Item Number, Category,
+Material/Application, Key dimensions). Treat a summary as the complete data you have for that product.
+
 You MUST read and analyze ALL of this data before making any recommendation.
 
 HOW TO FORMAT PRODUCT REFERENCES:
@@ -196,14 +216,14 @@ Respond naturally and helpfully with inline product reference links using the fo
             input_variables=["context", "chat_history", "question"]
         )
         
-        # Create conversational chain
-        self.qa_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.retriever,
-            return_source_documents=True,
-            verbose=False,
-            combine_docs_chain_kwargs={"prompt": self.qa_prompt}
-        )
+        # Standalone-question step for follow-ups (same prompt ConversationalRetrievalChain uses)
+        self.condense_chain = CONDENSE_QUESTION_PROMPT | self.llm | StrOutputParser()
+        
+        # Decides locally when the condense LLM call can be skipped (HISTORY_REWRITE_MODE)
+        self.question_rewriter = QuestionRewriter(embeddings=self.embeddings)
+        
+        # Keeps the retrieved products within CONTEXT_TOKEN_BUDGET tokens
+        self.context_packer = ContextPacker(model_name=self.openai_model)
         
         print("[OK] LangChain service initialized successfully")
     
@@ -216,33 +236,161 @@ Respond naturally and helpfully with inline product reference links using the fo
             chat_history: List of tuples [(question1, answer1), (question2, answer2), ...]
         
         Returns:
-            Dictionary with answer and source documents
+            Dictionary with answer, source documents and LLM tokens used
         """
         if chat_history is None:
             chat_history = []
         
-        result = self.qa_chain.invoke({
-            "question": question,
-            "chat_history": chat_history
-        })
+        with get_openai_callback() as usage:
+            standalone_question = self.condense_question(question, chat_history)
+            documents = self.retriever.retrieve(standalone_question)
+            prompt, packing = self.build_answer_prompt(standalone_question, documents, chat_history)
+            answer = self.llm.invoke(prompt).content
+        
+        return {
+            "answer": answer,
+            "source_documents": documents,
+            "chat_history": chat_history,
+            "total_tokens": usage.total_tokens,
+            "context_tokens": packing["context_tokens"]
+        }
+    
+    async def aquery(self, question, chat_history=None):
+        """
+        Async version of query() that does not block the event loop
+        
+        OpenAI calls are awaited natively, the local embedding and the Chroma MMR search
+        run in worker threads. At most CHAT_MAX_CONCURRENCY queries run at once;
+        further requests wait for a free slot.
+        """
+        if chat_history is None:
+            chat_history = []
+        
+        async with self._query_semaphore:
+            with get_openai_callback() as usage:
+                standalone_question = await self.acondense_question(question, chat_history)
+                documents = await self.aretrieve(standalone_question)
+                prompt, packing = self.build_answer_prompt(standalone_question, documents, chat_history)
+                answer = (await self.llm.ainvoke(prompt)).content
         
         return {
-            "answer": result["answer"],
-            "source_documents": result.get("source_documents", []),
-            "chat_history": chat_history
+            "answer": answer,
+            "source_documents": documents,
+            "chat_history": chat_history,
+            "total_tokens": usage.total_tokens,
+            "context_tokens": packing["context_tokens"]
         }
     
+    def warm_up(self):
+        """
+        Run one encode and one HNSW query so the first real request does not pay for
+        lazy model initialisation and paging the index into memory
+        """
+        started = time.perf_counter()
+        self.embeddings.embed_query("warm-up query")
+        self.init_timings['warm_up_encode'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        self.vectorstore.similarity_search("warm-up query", k=1)
+        self.init_timings['warm_up_hnsw_query'] = time.perf_counter() - started
+        print("[OK] LangChain service warmed up")
+    
+    def query_slot(self):
+        """Concurrency slot shared by all chat queries: `async with service.query_slot(): ...`"""
+        return self._query_semaphore
+    
+    @staticmethod
+    def format_chat_history(chat_history):
+        """Format [(question, answer), ...] the same way ConversationalRetrievalChain does"""
+        buffer = ""
+        for human, ai in chat_history:
+            buffer += "\n" + "\n".join([f"Human: {human}", f"Assistant: {ai}"])
+        return buffer
+    
+    def condense_question(self, question, chat_history):
+        """
+        Rephrase a follow-up question into a standalone question
+        
+        The LLM is only called when the local rewriter cannot handle the question.
+        """
+        standalone_question = self.question_rewriter.rewrite(question, chat_history)
+        if standalone_question is not None:
+            return standalone_question
+        return self.condense_chain.invoke({
+            "question": question,
+            "chat_history": self.format_chat_history(chat_history)
+        })
+    
+    async def acondense_question(self, question, chat_history):
+        """Async version of condense_question()"""
+        standalone_question = await asyncio.to_thread(self.question_rewriter.rewrite, question, chat_history)
+        if standalone_question is not None:
+            return standalone_question
+        return await self.condense_chain.ainvoke({
+            "question": question,
+            "chat_history": self.format_chat_history(chat_history)
+        })
+    
+    async def aretrieve(self, question):
+        """Retrieve product documents for a standalone question"""
+        return await self.retriever.aretrieve(question)
+    
+    def build_answer_prompt(self, question, documents, chat_history):
+        """
+        Fill the answer prompt with the retrieved products packed into the context token budget
+        
+        Returns (prompt, packing stats)
+        """
+        context, packing = self.context_packer.pack(documents)
+        print(
+            f"Context: {packing['context_tokens']}/{packing['token_budget']} tokens "
+            f"({packing['full_documents']} full, {packing['summary_documents']} summaries, "
+            f"{packing['dropped_documents']} dropped)"
+        )
+        prompt = self.qa_prompt.format(
+            context=context,
+            chat_history=self.format_chat_history(chat_history),
+            question=question
+        )
+        return prompt, packing
+    
+    async def astream_answer(self, question, documents, chat_history):
+        """Stream the answer for already-retrieved documents, token by token"""
+        prompt, _ = self.build_answer_prompt(question, documents, chat_history)
+        async for chunk in self.llm.astream(prompt):
+            if chunk.content:
+                yield chunk.content
+    
     def get_collection_count(self):
         """Get number of documents in vectorstore"""
         return self.vectorstore._collection.count()
 
 # Global instance
 langchain_service = None
+_langchain_service_lock = threading.Lock()
+
+# Startup warm-up state (reported by /api/ready)
+readiness = {"ready": False, "error": None, "started_at": None, "total_seconds": None}
 
 def get_langchain_service():
-    """Get or create LangChain service singleton"""
+    """Get or create LangChain service singleton (thread-safe, may be called from worker threads)"""
     global langchain_service
     if langchain_service is None:
-        langchain_service = LangChainService()
+        with _langchain_service_lock:
+            if langchain_service is None:
+                langchain_service = LangChainService()
     return langchain_service
 
+def warm_up_langchain_service():
+    """Create the service and warm it up - run in a background thread at application startup"""
+    readiness["started_at"] = time.time()
+    started = time.perf_counter()
+    try:
+        service = get_langchain_service()
+        service.warm_up()
+        readiness["ready"] = True
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"[ERROR] LangChain warm-up failed: {e}")
+    finally:
+        readiness["total_seconds"] = time.perf_counter() - started
@@ -0,0 +1,139 @@
+"""
+Compiled SimpleMetaFields schema
+Maps specification codes and filter-metadata keys to readable field names. A code gets the
+FieldName of the longest MetaClass that prefixes it (SAW_DIAMETER_MM before SAW_DIAMETER
+before SAW), looked up with one dict probe per distinct prefix length and cached per code,
+instead of a startswith scan over every SimpleMetaFields row.
+
+Used by setup_embeddings.py (get_field_name), validate_data.py and the API (get_meta_schema)
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+# Language preference for multilingual {"da": ..., "en": ...} values
+LANGUAGES = ('en', 'da', 'sv', 'no')
+DATA_DIR = Path(__file__).parent.parent / 'data'
+
+
+@lru_cache(maxsize=65536)
+def _decode_unicode_cached(text):
+    # The same few labels repeat across products
+    try:
+        if '\\u' in text:
+            return text.encode('utf-8').decode('unicode-escape')
+    except Exception:
+        pass
+    return text
+
+
+def decode_unicode(text):
+    """Decode Unicode escape sequences (e.g., \\u00E6 to æ); anything but a non-empty str is returned as is"""
+    if not text or not isinstance(text, str):
+        return text
+    return _decode_unicode_cached(text)
+
+
+def pick_language(value):
+    """Text of a multilingual dict (English > Danish > Swedish > Norwegian > first available), decoded"""
+    if not isinstance(value, dict):
+        return decode_unicode(str(value)) if value is not None else ''
+    for lang in LANGUAGES:
+        if value.get(lang):
+            return decode_unicode(str(value[lang]))
+    return decode_unicode(str(next(iter(value.values())))) if value else ''
+
+
+def _label(field_name):
+    """FieldName as display text: multilingual JSON is resolved, escapes decoded"""
+    if isinstance(field_name, str) and field_name.strip().startswith('{'):
+        try:
+            field_name = json.loads(field_name)
+        except ValueError:
+            pass
+    return pick_language(field_name) if field_name else ''
+
+
+class MetaSchema:
+    """SimpleMetaFields rows compiled for longest-prefix field name lookup"""
+
+    def __init__(self, meta_fields):
+        self.meta_fields = meta_fields
+        self.names = {}
+        for field in meta_fields:
+            prefix = field.get('MetaClass') or ''
+            # An empty MetaClass would prefix every code; the first row of a MetaClass wins
+            if prefix and prefix not in self.names:
+                self.names[prefix] = _label(field.get('FieldName'))
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.names}, reverse=True)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def resolve(self, code):
+        """(MetaClass, field name) of the longest MetaClass prefixing code, or None"""
+        for length in self.prefix_lengths:
+            if length <= len(code):
+                name = self.names.get(code[:length])
+                if name is not None:
+                    return code[:length], name
+        return None
+
+    def field_name(self, code):
+        """Readable field name of a specification code or filter key (the code itself if unknown)"""
+        name = self._cache.get(code)
+        if name is None:
+            match = self.resolve(code) if code else None
+            name = match[1] if match and match[1] else code
+            self._cache[code] = name
+        return name
+
+
+_compiled = None
+
+
+def compile_meta_schema(meta_fields):
+    """MetaSchema of meta_fields, compiled once for the same list (or passed through if already compiled)"""
+    global _compiled
+    if isinstance(meta_fields, MetaSchema):
+        return meta_fields
+    compiled = _compiled
+    if compiled is None or compiled.meta_fields is not meta_fields:
+        compiled = _compiled = MetaSchema(meta_fields)
+    return compiled
+
+
+# Global instance for the API, reloaded when a new export or delta appears
+meta_schema = None
+_meta_schema_source = None
+_meta_schema_lock = threading.Lock()
+
+
+def get_meta_schema():
+    """Schema of the newest export's SimpleMetaFields in DATA_DIR (empty if there is no export)"""
+    from services.product_reader import find_deltas, find_export, load_meta_fields
+
+    global meta_schema, _meta_schema_source
+    data_dir = Path(os.getenv("DATA_DIR", DATA_DIR))
+    deltas = find_deltas(data_dir)
+    # The newest export (delta or full) has the current SimpleMetaFields
+    path = deltas[-1] if deltas else find_export(data_dir)
+    try:
+        source = (str(path), os.stat(path).st_mtime) if path else None
+    except OSError:
+        source = None
+    if meta_schema is None or source != _meta_schema_source:
+        with _meta_schema_lock:
+            if meta_schema is None or source != _meta_schema_source:
+                try:
+                    meta_schema = MetaSchema(load_meta_fields(path) if source else [])
+                    if source:
+                        print(f"Loaded SimpleMetaFields schema ({len(meta_schema)} meta classes) from {path}")
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] Could not load SimpleMetaFields from {path}: {e}")
+                    meta_schema = MetaSchema([])
+                _meta_schema_source = source
+    return meta_schema
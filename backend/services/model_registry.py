@@ -0,0 +1,96 @@
+"""
+Process-wide registry of loaded embedding models and ChromaDB clients
+EmbeddingService and LangChainService share one encoder per model and one client per path
+
+The encoder backend is 'torch' (SentenceTransformer) or 'onnx' (int8 ONNX Runtime, see
+services/onnx_encoder.py), chosen per call or with EMBEDDING_BACKEND for the whole process.
+Both expose encode(), so callers do not care which one they get.
+"""
+import os
+import threading
+from typing import List
+
+import chromadb
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+
+_lock = threading.Lock()
+_encoders = {}
+_chroma_clients = {}
+
+
+def get_embedding_backend(backend=None):
+    """backend, or EMBEDDING_BACKEND (default 'torch')"""
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+    return backend
+
+
+def get_encoder(model_name, device='cpu', backend=None):
+    """Get the shared encoder for a model and backend, loading it on first use"""
+    backend = get_embedding_backend(backend)
+    key = (model_name, device, backend)
+    if key not in _encoders:
+        with _lock:
+            if key not in _encoders:
+                if backend == 'onnx':
+                    # onnxruntime runs on the CPU; torch is not even imported
+                    from services.onnx_encoder import load_onnx_encoder
+                    print(f"Loading ONNX int8 encoder: {model_name}")
+                    _encoders[key] = load_onnx_encoder(model_name)
+                else:
+                    from sentence_transformers import SentenceTransformer
+                    print(f"Loading Sentence Transformer model: {model_name}")
+                    _encoders[key] = SentenceTransformer(model_name, device=device)
+    return _encoders[key]
+
+
+def get_chroma_client(persist_dir):
+    """Get the shared ChromaDB PersistentClient for a directory"""
+    key = os.path.abspath(persist_dir)
+    if key not in _chroma_clients:
+        with _lock:
+            if key not in _chroma_clients:
+                print(f"Initializing ChromaDB at: {persist_dir}")
+                _chroma_clients[key] = chromadb.PersistentClient(path=persist_dir)
+    return _chroma_clients[key]
+
+
+def registry_report():
+    """Describe what is currently loaded"""
+    return {
+        "encoders": [f"{name} ({device}, {backend})" for name, device, backend in _encoders],
+        "chroma_clients": list(_chroma_clients),
+    }
+
+
+class SharedEncoderEmbeddings(Embeddings):
+    """
+    LangChain embeddings adapter over the shared encoder
+
+    Produces the same vectors as HuggingFaceEmbeddings with normalize_embeddings=True,
+    without loading a second copy of the model.
+    """
+
+    def __init__(self, model_name, device='cpu', normalize_embeddings=True, query_cache=None, backend=None):
+        self.model_name = model_name
+        self.normalize_embeddings = normalize_embeddings
+        self.backend = get_embedding_backend(backend)
+        self.encoder = get_encoder(model_name, device, self.backend)
+        # Optional QueryEmbeddingCache in front of embed_query
+        self.query_cache = query_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Same preprocessing as HuggingFaceEmbeddings
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = self.encoder.encode(
+            texts, normalize_embeddings=self.normalize_embeddings, show_progress_bar=False
+        )
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.embed_documents([text])[0]
+        return self.query_cache.get_or_compute(text, lambda key: self.embed_documents([key])[0]).tolist()
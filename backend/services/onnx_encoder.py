@@ -0,0 +1,153 @@
+"""
+ONNX Runtime backend for the sentence encoder (EMBEDDING_BACKEND=onnx)
+
+build_onnx_model() exports the SentenceTransformer's transformer to ONNX once and applies
+dynamic int8 quantization (weights int8, activations quantized on the fly), which suits a
+6-layer MiniLM on CPU. OnnxEncoder then encodes with onnxruntime + tokenizers only - the
+same tokenization, mean pooling and normalization as SentenceTransformer.encode(), without
+importing torch. Building needs torch, sentence-transformers and the onnx package.
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+ONNX_MODEL_DIR = './scripts/scripts/onnx_models'
+CONFIG_NAME = 'onnx_encoder.json'
+INPUT_NAMES = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+def onnx_model_dir(model_name, quantize=True):
+    """Directory of the exported model (ONNX_MODEL_DIR overrides the root)"""
+    name = re.sub(r'[^0-9A-Za-z._-]+', '--', model_name)
+    return Path(os.getenv("ONNX_MODEL_DIR", ONNX_MODEL_DIR)) / (name + ('-int8' if quantize else '-fp32'))
+
+
+def build_onnx_model(model_name, output_dir=None, quantize=True):
+    """Export model_name to ONNX (int8 if quantize) with its tokenizer; returns the directory"""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    output_dir = Path(output_dir) if output_dir else onnx_model_dir(model_name, quantize)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Exporting {model_name} to ONNX{' (dynamic int8 quantization)' if quantize else ''} -> {output_dir}")
+
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0]
+    pooling = next((module for module in st_model if isinstance(module, models.Pooling)), None)
+    if not isinstance(transformer, models.Transformer) or pooling is None or pooling.get_pooling_mode_str() != 'mean':
+        raise ValueError(f"{model_name}: only Transformer + mean Pooling models can be exported")
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(str(output_dir))
+
+    sample = tokenizer(['export sample'], return_tensors='pt')
+    input_names = [name for name in INPUT_NAMES if name in sample]
+    auto_model = transformer.auto_model.eval()
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = auto_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+    fp32_path = output_dir / 'model.fp32.onnx'
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(), tuple(sample[name] for name in input_names), str(fp32_path),
+            input_names=input_names, output_names=['token_embeddings'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in input_names + ['token_embeddings']},
+            opset_version=14, do_constant_folding=True, dynamo=False
+        )
+
+    model_file = 'model.onnx'
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(fp32_path), str(output_dir / model_file), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+    else:
+        os.replace(fp32_path, output_dir / model_file)
+
+    config = {
+        'model_name': model_name,
+        'file': model_file,
+        'quantized': quantize,
+        'input_names': input_names,
+        'max_seq_length': transformer.max_seq_length,
+        'do_lower_case': getattr(transformer, 'do_lower_case', False),
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+        'normalize': any(isinstance(module, models.Normalize) for module in st_model),
+        'dimension': st_model.get_sentence_embedding_dimension(),
+    }
+    with open(output_dir / CONFIG_NAME, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    print(f"[OK] ONNX encoder ready ({(output_dir / model_file).stat().st_size / 1e6:.1f} MB)")
+    return output_dir
+
+
+class OnnxEncoder:
+    """SentenceTransformer.encode() work-alike on ONNX Runtime (CPU)"""
+
+    def __init__(self, model_dir, threads=None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        with open(self.model_dir / CONFIG_NAME, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        options = onnxruntime.SessionOptions()
+        threads = threads or int(os.getenv("ONNX_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(self.model_dir / self.config['file']), options, providers=['CPUExecutionProvider']
+        )
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=self.config['pad_token_id'], pad_token=self.config['pad_token'])
+        self.max_seq_length = self.config['max_seq_length']
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dimension']
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': attention_mask,
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {name: inputs[name] for name in self.config['input_names']})[0]
+        # Mean pooling over the real (unpadded) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_tensor=False,
+               normalize_embeddings=False, **kwargs):
+        """Embeddings as a float32 numpy array (one vector for a single string)"""
+        single = isinstance(sentences, str)
+        texts = [str(text).strip() for text in ([sentences] if single else sentences)]
+        if self.config['do_lower_case']:
+            texts = [text.lower() for text in texts]
+        embeddings = np.zeros((len(texts), self.config['dimension']), dtype=np.float32)
+        # Longest first, like SentenceTransformer, so batches pad to similar lengths
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            embeddings[indices] = self._encode_batch([texts[i] for i in indices])
+        if self.config['normalize'] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+
+def load_onnx_encoder(model_name, quantize=True):
+    """OnnxEncoder for model_name, exporting it first if it has not been built yet"""
+    model_dir = onnx_model_dir(model_name, quantize)
+    if not (model_dir / CONFIG_NAME).exists():
+        build_onnx_model(model_name, model_dir, quantize)
+    return OnnxEncoder(model_dir)
@@ -0,0 +1,312 @@
+"""
+Product attribute vocabulary shared by ingest and query parsing
+Recognises product types, materials (English and Danish), dimensions and item numbers in free text,
+and turns dimension fields and questions into typed numeric attributes (millimetres / tooth count)
+"""
+import re
+
+# Product type -> phrases customers use for it (English and Danish). Only unambiguous product
+# nouns: a follow-up naming one is treated as self-contained, so words that are also everyday
+# words ("saw", "bor", "tap", "mill", "skær") are left out
+PRODUCT_TYPE_TERMS = {
+    'bandsaw blade': ['bandsaw', 'band saw', 'båndsav', 'båndsavsklinge'],
+    'saw blade': ['saw blade', 'saw blades', 'sawblade', 'circular saw', 'savklinge', 'rundsavklinge'],
+    'caliper': ['caliper', 'calliper', 'skydelære'],
+    'micrometer': ['micrometer', 'mikrometer'],
+    'drill': ['drill', 'drills', 'drill bit', 'spiralbor', 'borsæt'],
+    'knife': ['knife', 'knives', 'kniv', 'knive'],
+    'milling cutter': ['end mill', 'end mills', 'milling cutter', 'milling cutters', 'cutter', 'cutters',
+                       'fræser', 'fræsere'],
+    'tap': ['thread tap', 'taps', 'gevindtap', 'snittap'],
+    'router bit': ['router bit', 'overfræser'],
+    'insert': ['cutting insert', 'turning insert', 'carbide insert', 'vendeskær'],
+    'disc': ['disc', 'discs', 'disk', 'cutting disc', 'grinding disc', 'skæreskive', 'slibeskive', 'diamantskive'],
+}
+# Round tools whose bare size ("160mm saw blade", "8 mm drill") is their diameter
+DIAMETER_PRODUCT_TYPES = {'saw blade', 'drill', 'milling cutter', 'router bit', 'disc'}
+# Tools mounted through a bore - for anything else "10mm hole" is the hole it makes
+BORE_PRODUCT_TYPES = {'saw blade', 'milling cutter', 'disc'}
+
+# Material -> phrases (English and Danish)
+MATERIAL_TERMS = {
+    'wood': ['wood', 'timber', 'hardwood', 'softwood', 'soft wood', 'hard wood', 'træ', 'hårdttræ', 'blødttræ'],
+    'panel': ['mdf', 'hdf', 'chipboard', 'plywood', 'particle board', 'laminate', 'spånplade', 'krydsfiner'],
+    'metal': ['metal', 'metals', 'non-ferrous', 'light metal', 'iron', 'jern', 'letmetal'],
+    'steel': ['steel', 'stål', 'hss'],
+    'aluminium': ['aluminium', 'aluminum', 'alu'],
+    'stainless': ['stainless', 'inox', 'rustfri', 'rustfrit'],
+    'plastic': ['plastic', 'plastics', 'acrylic', 'pvc', 'plast', 'akryl'],
+}
+
+# Tags implied by a more specific tag (MDF is a wood-based panel, aluminium is a metal, ...)
+MATERIAL_IMPLIES = {
+    'panel': 'wood',
+    'steel': 'metal',
+    'aluminium': 'metal',
+    'stainless': 'metal',
+}
+# Broad material class used for query filtering - the class tag covers every more specific tag
+MATERIAL_CLASSES = {'wood', 'metal', 'plastic'}
+
+# 160mm, 6.5", 30 mm, 1/2 inch, Z48, Ø160 ...
+DIMENSION_PATTERN = re.compile(
+    r'(?:ø\s*)?\d+(?:[.,]\d+)?(?:\s+\d+/\d+|\s*/\s*\d+)?\s*(?:mm|cm|m\b|inch|in\b|"|tommer)'
+    r'|\bz\s*\d+\b|ø\s*\d+(?:[.,]\d+)?'
+)
+
+# Item numbers look like MT10A6090-910-00530140 or W381195-2125412; EANs are 8/12/13 digits
+ITEM_NUMBER_PATTERN = re.compile(r'\b(?=[a-z0-9./-]*\d)(?=[a-z0-9./-]*[a-z])[a-z0-9]+(?:[-./][a-z0-9]+){1,}\b')
+EAN_PATTERN = re.compile(r'(?<![\w-])(?:\d{13}|\d{12}|\d{8})(?![\w-])')
+
+
+def _compile_terms(terms_by_key):
+    return {
+        key: re.compile(r'(?<![\wæøå])(?:' + '|'.join(re.escape(t) for t in terms) + r')(?![\wæøå])')
+        for key, terms in terms_by_key.items()
+    }
+
+_PRODUCT_TYPE_PATTERNS = _compile_terms(PRODUCT_TYPE_TERMS)
+_MATERIAL_PATTERNS = _compile_terms(MATERIAL_TERMS)
+
+
+def find_terms(text, patterns):
+    """Keys whose phrases occur in the text (case-insensitive, whole words)"""
+    text = text.casefold()
+    return {key for key, pattern in patterns.items() if pattern.search(text)}
+
+
+def material_tags(text):
+    """Normalized material tags in a material/application text, including implied broader tags"""
+    tags = find_terms(text or '', _MATERIAL_PATTERNS)
+    return tags | {MATERIAL_IMPLIES[tag] for tag in tags if tag in MATERIAL_IMPLIES}
+
+
+def requested_material_class(text):
+    """
+    The one material class (wood / metal / plastic) a question asks for, or None
+
+    Questions naming materials from several classes are ambiguous and are not filtered.
+    """
+    classes = material_tags(text) & MATERIAL_CLASSES
+    return classes.pop() if len(classes) == 1 else None
+
+
+def extract_query_entities(text):
+    """
+    Pull the entities that make a question self-contained
+
+    Returns a dict with sets of product types and materials and lists of dimension,
+    item-number and EAN mentions.
+    """
+    folded = (text or '').casefold()
+    return {
+        'product_types': find_terms(folded, _PRODUCT_TYPE_PATTERNS),
+        'materials': find_terms(folded, _MATERIAL_PATTERNS),
+        'dimensions': [m.group(0).strip() for m in DIMENSION_PATTERN.finditer(folded)],
+        'item_numbers': ITEM_NUMBER_PATTERN.findall(folded),
+        'eans': EAN_PATTERN.findall(folded),
+    }
+
+
+# Numeric attribute -> field-name phrases (English and Danish), checked in this order
+# so "bore diameter" is a bore and "shank diameter" is not a diameter
+NUMERIC_ATTRIBUTE_TERMS = [
+    ('bore_mm', ['bore', 'arbor', 'arbour', 'hole', 'spindle', 'boring', 'hul', 'spindelhul', 'centerhul']),
+    ('teeth', ['teeth', 'tooth', 'number of teeth', 'z', 'tænder', 'antal tænder', 'tandantal']),
+    ('thickness_mm', ['thickness', 'kerf', 'cutting width', 'tykkelse', 'skærebredde', 'snitbredde']),
+    ('length_mm', ['length', 'overall length', 'total length', 'længde', 'totallængde']),
+    ('diameter_mm', ['diameter', 'diam', 'dia', 'ø', 'd']),
+]
+# Field names that mention a dimension but describe another part of the tool
+IGNORED_ATTRIBUTE_TERMS = ['shank', 'skaft', 'thread', 'gevind', 'flange', 'pitch', 'tpi', 'angle', 'vinkel']
+NUMERIC_ATTRIBUTES = [attribute for attribute, _ in NUMERIC_ATTRIBUTE_TERMS]
+
+_NUMERIC_ATTRIBUTE_PATTERNS = _compile_terms(dict(NUMERIC_ATTRIBUTE_TERMS))
+_IGNORED_ATTRIBUTE_PATTERN = _compile_terms({'ignored': IGNORED_ATTRIBUTE_TERMS})['ignored']
+
+# 6 1/2, 1/2, 254, 2,5 - with an optional unit
+MEASUREMENT_PATTERN = re.compile(
+    r'(?:(?:(?P<whole>\d+)\s+)?(?P<num>\d+)\s*/\s*(?P<den>\d+)|(?P<number>\d+(?:[.,]\d+)?))'
+    r'\s*(?P<unit>mm|cm|inch|in\b|"|tommer)?'
+)
+INCH_UNITS = {'inch', 'in', '"', 'tommer'}
+
+
+def _attribute_for_name(name):
+    """Numeric attribute a field name describes, or None"""
+    folded = name.casefold().replace('_', ' ')
+    if _IGNORED_ATTRIBUTE_PATTERN.search(folded):
+        return None
+    for attribute, pattern in _NUMERIC_ATTRIBUTE_PATTERNS.items():
+        if pattern.search(folded):
+            return attribute
+    return None
+
+
+def _unit_from_text(text):
+    folded = text.casefold()
+    if re.search(r'inch|tommer|"|\(in\)', folded):
+        return 'inch'
+    if re.search(r'\bcm\b|\(cm\)', folded):
+        return 'cm'
+    return 'mm'
+
+
+def parse_measurement(value, default_unit='mm'):
+    """
+    First number in value as millimetres ("254", "2,5 mm", '6 1/2"', "1/2 inch")
+
+    Returns None if value holds no number.
+    """
+    for match in MEASUREMENT_PATTERN.finditer(str(value).casefold()):
+        if not match.group(0).strip():
+            continue
+        if match.group('number'):
+            number = float(match.group('number').replace(',', '.'))
+        elif int(match.group('den')):
+            number = int(match.group('whole') or 0) + int(match.group('num')) / int(match.group('den'))
+        else:
+            continue
+        unit = match.group('unit') or default_unit
+        if unit in INCH_UNITS:
+            number *= 25.4
+        elif unit == 'cm':
+            number *= 10
+        return round(number, 2)
+    return None
+
+
+def extract_numeric_attributes(fields):
+    """
+    Typed numeric attributes from (field name, value) pairs
+
+    Lengths are normalized to millimetres (unit taken from the value, then the field name),
+    teeth is a count. The first field found for each attribute wins.
+    """
+    attributes = {}
+    for name, value in fields:
+        if value is None or not str(value).strip():
+            continue
+        attribute = _attribute_for_name(str(name))
+        if attribute is None or attribute in attributes:
+            continue
+        if attribute == 'teeth':
+            match = re.search(r'\d+', str(value))
+            if match:
+                attributes['teeth'] = int(match.group(0))
+            continue
+        measurement = parse_measurement(value, default_unit=_unit_from_text(str(name)))
+        if measurement:
+            attributes[attribute] = measurement
+    return attributes
+
+
+# "bore 30", "30 mm bore", "Z48", "48 teeth", "Ø160", "160mm" (a bare size may be the diameter)
+_QUERY_NUMBER = r'(\d+(?:[.,]\d+)?(?:\s+\d+/\d+|\s*/\s*\d+)?\s*(?:mm|cm|inch|in\b|"|tommer)?)'
+_QUERY_SEPARATOR = r'(?:\s*(?:of|size|diameter|på|:|=|ø))*\s*'
+# Keyword-first phrasings are tried before number-first ones ("ø300 hul 30" -> bore 30, not 300).
+# 'hole' and 'thick' depend on the rest of the question, see parse_query_dimensions
+_QUERY_ATTRIBUTE_PATTERNS = [
+    ('teeth', [r'\bz\s*(\d+)\b', r'(\d+)\s*(?:teeth|tooth|tænder)']),
+    ('bore_mm', [r'\b(?:bore|arbou?r|spindelhul|centerhul)' + _QUERY_SEPARATOR + _QUERY_NUMBER,
+                 _QUERY_NUMBER + r'\s*(?:bore|arbou?r)\b']),
+    ('hole', [r'\b(?:hole|hul)' + _QUERY_SEPARATOR + _QUERY_NUMBER, _QUERY_NUMBER + r'\s*(?:hole|hul)\b']),
+    ('thickness_mm', [r'\b(?:thickness|kerf|tykkelse)' + _QUERY_SEPARATOR + _QUERY_NUMBER,
+                      _QUERY_NUMBER + r'\s*kerf\b']),
+    ('thick', [_QUERY_NUMBER + r'\s*(?:thick|tykt?)\b']),
+    ('length_mm', [r'\b(?:length|længde)' + _QUERY_SEPARATOR + _QUERY_NUMBER,
+                   _QUERY_NUMBER + r'\s*(?:long|lang)\b']),
+    ('diameter_mm', [r'(?:\b(?:diameter|dia)\b|ø)' + _QUERY_SEPARATOR + _QUERY_NUMBER]),
+]
+_QUERY_ATTRIBUTE_PATTERNS = [
+    (attribute, [re.compile(pattern) for pattern in patterns]) for attribute, patterns in _QUERY_ATTRIBUTE_PATTERNS
+]
+_BARE_SIZE_PATTERN = re.compile(r'(?<![\w.,/])' + _QUERY_NUMBER)
+# "250x30", "2450 mm x 27 mm", "250 x 3,2 x 30" - one size per part
+_SIZE_PART = r'\d+(?:[.,]\d+)?\s*(?:mm|cm|inch|in\b|"|tommer)?'
+_SIZE_TUPLE_PATTERN = re.compile(
+    r'(?<![\w.,/])(?:ø\s*)?' + _SIZE_PART + r'(?:\s*[x×*]\s*' + _SIZE_PART + r')+(?![\w.,/])'
+)
+_SIZE_UNIT_PATTERN = re.compile(r'mm|cm|inch|in\b|"|tommer')
+
+
+def _blank(text, match):
+    """Blank out a consumed match so it is not read again as another size"""
+    return text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+
+
+def parse_query_dimensions(text):
+    """
+    Sizes a question asks for, as (filters, sizes)
+
+    filters are attributes the question pins down - named ones ("bore 30", "Z48", "Ø160") and,
+    for round tools (DIAMETER_PRODUCT_TYPES), the bare or leading size as the diameter
+    ("160mm saw blade", "250x30 saw blade"). A hole is the bore of a saw blade, cutter or disc
+    and the diameter of anything else ("drill for 10mm hole"). sizes are the other millimetre
+    values whose meaning is unclear ("caliper 150mm", "bandsaw blade 2450 x 27 mm", "30mm thick
+    wood" - the workpiece, not the tool); they should only rank results.
+    """
+    folded = (text or '').casefold()
+    requested = {}
+    sizes = []
+    product_types = find_terms(folded, _PRODUCT_TYPE_PATTERNS)
+    # "band saw blade" also reads as "saw blade" - any other product type makes the size ambiguous
+    round_tool = bool(product_types) and product_types <= DIAMETER_PRODUCT_TYPES
+    bored_tool = bool(product_types) and product_types <= BORE_PRODUCT_TYPES
+    for attribute, patterns in _QUERY_ATTRIBUTE_PATTERNS:
+        match = next((m for m in (pattern.search(folded) for pattern in patterns) if m), None)
+        if not match:
+            continue
+        raw = next(group for group in match.groups() if group)
+        # Blank out what was consumed so "bore 30 mm" is not read again as a bare size
+        folded = _blank(folded, match)
+        if attribute == 'teeth':
+            requested[attribute] = int(raw)
+            continue
+        value = parse_measurement(raw)
+        if not value:
+            continue
+        if attribute == 'hole':
+            # A named bore or diameter elsewhere in the question wins
+            requested.setdefault('bore_mm' if bored_tool else 'diameter_mm', value)
+            continue
+        if attribute == 'thick':
+            # "30mm thick wood" is the board being cut, "3mm thick blade" the tool
+            if material_tags(' '.join(folded[match.end():].split()[:2])):
+                sizes.append(value)
+                continue
+            attribute = 'thickness_mm'
+        requested[attribute] = value
+    unit = _unit_from_text(folded)
+
+    # Size tuples: only the leading size of a round tool is known to be its diameter
+    # (saw blade 250x30 is diameter x bore, drill 8x120 diameter x length)
+    for match in list(_SIZE_TUPLE_PATTERN.finditer(folded)):
+        # "2450 x 27 mm": a part without its own unit takes the question's unit
+        parts = [parse_measurement(part, default_unit=unit) for part in re.split(r'[x×*]', match.group(0))]
+        parts = [part for part in parts if part]
+        if parts and round_tool and 'diameter_mm' not in requested:
+            requested['diameter_mm'] = parts.pop(0)
+        sizes.extend(parts)
+        folded = _blank(folded, match)
+
+    # Bare sizes with a unit ("160mm", '6 1/2"')
+    for match in _BARE_SIZE_PATTERN.finditer(folded):
+        if not _SIZE_UNIT_PATTERN.search(match.group(1)):
+            continue
+        value = parse_measurement(match.group(1))
+        if not value:
+            continue
+        if round_tool and 'diameter_mm' not in requested:
+            requested['diameter_mm'] = value
+        else:
+            sizes.append(value)
+    return requested, sizes
+
+
+def extract_dimension_filters(text):
+    """
+    Numeric attributes a question pins down, e.g. "160mm saw blade, bore 30"
+    -> {'diameter_mm': 160.0, 'bore_mm': 30.0}
+    """
+    return parse_query_dimensions(text)[0]
@@ -0,0 +1,330 @@
+"""
+Streaming reader for the product export
+Yields products one at a time instead of json.load-ing the whole catalog, so ingest memory
+is bounded by the batch size rather than the number of products
+
+Reads every export format:
+- data/products_export/: JSON Lines shards + manifest.json (export_data.py, see export_writer.py)
+- products_joined.json: {"products": [...], "meta_fields": [...]} (export_data.py --format json)
+- JSON Lines (optionally .gz): one product per line, plus a {"meta_fields": [...]} line
+- data/products_delta/<name>/: delta exports (changed products + tombstones), applied on top
+"""
+import gzip
+import json
+import re
+from itertools import islice
+from pathlib import Path
+
+from services.export_writer import (
+    DELTA_DIR_NAME, EXPORT_DIR_NAME, LEGACY_EXPORT_NAME, MANIFEST_NAME, TOMBSTONES_NAME, file_sha256
+)
+
+CHUNK_SIZE = 1 << 20  # characters read per refill
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+TAIL_SCAN_SIZE = 1 << 20
+
+
+class _JsonStream:
+    """Incremental JSON tokenizer over a text file: a sliding buffer plus raw_decode for values"""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Drop the consumed part of the buffer and read more; False at end of file"""
+        if self.eof:
+            return False
+        # Read at least as much as is buffered, so re-decoding a large value stays linear
+        more = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not more:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + more
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of file)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in product export, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number that ends the buffer may continue in the next chunk
+            if end == len(self.buffer) and not isinstance(obj, (dict, list, str)) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def array_items(self):
+        """Yield the items of the array at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+    def object_members(self):
+        """
+        Yield the keys of the object at the current position
+        The caller must consume each value (value() or array_items()) before the next key
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+
+def find_export(data_dir):
+    """
+    The most recent export in data_dir: the sharded export directory or products_joined.json
+    (None if there is neither)
+    """
+    data_dir = Path(data_dir)
+    candidates = [
+        path for path in (data_dir / EXPORT_DIR_NAME / MANIFEST_NAME, data_dir / LEGACY_EXPORT_NAME)
+        if path.exists()
+    ]
+    if not candidates:
+        return None
+    newest = max(candidates, key=lambda path: path.stat().st_mtime)
+    return newest.parent if newest.name == MANIFEST_NAME else newest
+
+
+def is_sharded(path):
+    return Path(path).is_dir() or Path(path).name == MANIFEST_NAME
+
+
+def is_jsonl(path):
+    return str(path).endswith(('.jsonl', '.ndjson', '.jsonl.gz', '.ndjson.gz'))
+
+
+def _open_text(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if str(path).endswith('.gz') else open(path, 'r', encoding='utf-8')
+
+
+def load_export_manifest(path):
+    """manifest.json of a sharded export (path is the directory or the manifest itself)"""
+    path = Path(path)
+    manifest_path = path / MANIFEST_NAME if path.is_dir() else path
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['directory'] = manifest_path.parent
+    return manifest
+
+
+def export_size(path):
+    """Bytes on disk of an export (all shards for a sharded export)"""
+    if is_sharded(path):
+        manifest = load_export_manifest(path)
+        return sum(shard['bytes'] for shard in manifest['shards']) + manifest['meta_fields']['bytes']
+    return Path(path).stat().st_size
+
+
+def verify_export(path):
+    """
+    Check a sharded export against its manifest: sha256 and row count of every file
+    Returns a list of problems (empty if the export is intact)
+    """
+    manifest = load_export_manifest(path)
+    problems = []
+    tombstones = [manifest['tombstones']] if 'tombstones' in manifest else []
+    for entry in manifest['shards'] + [manifest['meta_fields']] + tombstones:
+        file_path = manifest['directory'] / entry['file']
+        if not file_path.exists():
+            problems.append(f"{entry['file']}: missing")
+            continue
+        if file_sha256(file_path) != entry['sha256']:
+            problems.append(f"{entry['file']}: checksum mismatch")
+            continue
+        if entry['file'] != manifest['meta_fields']['file']:
+            with _open_text(file_path) as f:
+                rows = sum(1 for line in f if line.strip())
+            if rows != entry['rows']:
+                problems.append(f"{entry['file']}: {rows} rows, manifest says {entry['rows']}")
+    return problems
+
+
+def find_deltas(data_dir):
+    """Delta export directories in data_dir, oldest first"""
+    delta_root = Path(data_dir) / DELTA_DIR_NAME
+    if not delta_root.is_dir():
+        return []
+    return sorted(path for path in delta_root.iterdir() if (path / MANIFEST_NAME).exists())
+
+
+def load_tombstones(path):
+    """Item numbers a delta export removes"""
+    manifest = load_export_manifest(path)
+    if 'tombstones' not in manifest:
+        return []
+    with _open_text(manifest['directory'] / TOMBSTONES_NAME) as f:
+        return [json.loads(line)['SanitizedItemNumber'] for line in f if line.strip()]
+
+
+def iter_products_with_deltas(path, deltas):
+    """
+    Products of the full export at path with the delta exports applied in order:
+    changed products replace their full-export version, tombstoned ones are left out.
+    Only the (small) deltas are held in memory.
+    """
+    overrides = {}
+    for delta in deltas:
+        for product in iter_products(delta):
+            overrides[product.get('SanitizedItemNumber')] = product
+        for item_number in load_tombstones(delta):
+            overrides[item_number] = None
+    for product in iter_products(path):
+        if product.get('SanitizedItemNumber') not in overrides:
+            yield product
+    for product in overrides.values():
+        if product is not None:
+            yield product
+
+
+def _iter_jsonl(path):
+    with _open_text(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'meta_fields' in record and 'SanitizedItemNumber' not in record:
+                continue
+            yield record
+
+
+def iter_products(path, chunk_size=CHUNK_SIZE):
+    """Yield the products of an export one at a time"""
+    if is_sharded(path):
+        manifest = load_export_manifest(path)
+        for shard in manifest['shards']:
+            rows = 0
+            for product in _iter_jsonl(manifest['directory'] / shard['file']):
+                rows += 1
+                yield product
+            if rows != shard['rows']:
+                raise ValueError(f"Shard {shard['file']} has {rows} products, manifest says {shard['rows']}")
+        return
+
+    if is_jsonl(path):
+        yield from _iter_jsonl(path)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        for key in stream.object_members():
+            if key == 'products':
+                yield from stream.array_items()
+                return
+            stream.value()
+
+
+def iter_batches(products, batch_size):
+    """Group an iterable of products into lists of at most batch_size"""
+    products = iter(products)
+    while True:
+        batch = list(islice(products, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _tail_meta_fields(path):
+    """
+    meta_fields from the end of a products_joined.json written by export_data.py
+    (products first, then meta_fields), without reading the products; None if not found
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        scan = TAIL_SCAN_SIZE
+        while True:
+            start = max(0, size - scan)
+            f.seek(start)
+            # The scan may start inside a multi-byte character; only the tail end matters
+            tail = f.read().decode('utf-8', errors='ignore')
+            key_at = tail.rfind('"meta_fields"')
+            while key_at != -1:
+                colon = WHITESPACE.match(tail, key_at + len('"meta_fields"')).end()
+                if tail.startswith(':', colon):
+                    try:
+                        value, end = decoder.raw_decode(tail, WHITESPACE.match(tail, colon + 1).end())
+                        # Only the top-level key is followed by the end of the file
+                        if isinstance(value, list) and tail[end:].strip() == '}':
+                            return value
+                    except json.JSONDecodeError:
+                        pass
+                key_at = tail.rfind('"meta_fields"', 0, key_at)
+            if start == 0:
+                return None
+            scan *= 4
+
+
+def load_meta_fields(path, chunk_size=CHUNK_SIZE):
+    """SimpleMetaFields rows of an export (small, so loaded whole)"""
+    if is_sharded(path):
+        manifest = load_export_manifest(path)
+        with open(manifest['directory'] / manifest['meta_fields']['file'], 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if is_jsonl(path):
+        with _open_text(path) as f:
+            for line in f:
+                if line.startswith('{"meta_fields"'):
+                    return json.loads(line)['meta_fields']
+        return []
+
+    meta_fields = _tail_meta_fields(path)
+    if meta_fields is not None:
+        return meta_fields
+
+    # Fall back to one streaming pass (e.g. meta_fields written before products)
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        for key in stream.object_members():
+            if key == 'meta_fields':
+                return stream.value()
+            if key == 'products':
+                for _ in stream.array_items():
+                    pass
+            else:
+                stream.value()
+    return []
@@ -0,0 +1,222 @@
+"""
+Product retrieval for the chat pipeline
+MMR vector search, pre-filtered on the numeric attributes (diameter, bore, ...) and the
+material class (wood, metal, plastic) a question asks for, fused with BM25 keyword hits.
+Sizes whose meaning is unclear ("caliper 150mm") only move matching products up.
+"""
+import asyncio
+import os
+import threading
+
+from langchain_core.documents import Document
+
+from services.bm25_index import get_bm25_index
+from services.product_attributes import NUMERIC_ATTRIBUTES, parse_query_dimensions, requested_material_class
+
+
+class ProductRetriever:
+    """Retrieves product documents from the Chroma vectorstore for a standalone question"""
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+
+        # Using MMR (Maximum Marginal Relevance) for diverse results instead of just similarity
+        # Higher k value ensures we get more product options to verify material compatibility
+        self.search_kwargs = {
+            "k": 25,  # Top 25 most similar products - more options to verify material match
+            "fetch_k": 50,  # Fetch 50 candidates before MMR filtering for diversity
+            "lambda_mult": 0.7  # Balance between relevance (1.0) and diversity (0.0)
+        }
+        # With a pre-filter every candidate already has the requested size / material,
+        # so far fewer are needed
+        self.filtered_search_kwargs = {"k": 10, "fetch_k": 25, "lambda_mult": 0.7}
+
+        # Relative tolerance for millimetre values (covers inch conversions and rounding)
+        self.dimension_tolerance = float(os.getenv("DIMENSION_FILTER_TOLERANCE", "0.02"))
+        # Fewer filtered matches than this are topped up with less strictly filtered results
+        self.min_filtered_results = int(os.getenv("RETRIEVAL_FILTER_MIN_RESULTS", "3"))
+
+        # "hybrid" fuses BM25 keyword hits into the vector results, "vector" is MMR only
+        self.mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        # BM25 candidates considered for fusion and the reciprocal rank fusion constant
+        self.bm25_candidates = int(os.getenv("BM25_CANDIDATES", "25"))
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+
+        self._lock = threading.Lock()
+        self.counts = {
+            "requests": 0, "dimension_filtered": 0, "material_filtered": 0, "filter_fallbacks": 0,
+            "hybrid_fused": 0, "bm25_only_results": 0, "size_boosted": 0,
+        }
+
+    def _count(self, *names, amount=1):
+        with self._lock:
+            for name in names:
+                self.counts[name] += amount
+
+    def dimension_conditions(self, question):
+        """Chroma `where` conditions for the dimensions the question pins down"""
+        conditions = []
+        for attribute, value in parse_query_dimensions(question)[0].items():
+            if attribute == 'teeth':
+                conditions.append({attribute: {"$eq": value}})
+                continue
+            margin = max(value * self.dimension_tolerance, 0.5)
+            conditions.append({attribute: {"$gte": value - margin}})
+            conditions.append({attribute: {"$lte": value + margin}})
+        return conditions
+
+    def material_conditions(self, question):
+        """
+        Chroma `where` condition for the material class in the question
+
+        Filters on the class tag (mat_wood covers MDF/panels, mat_metal covers steel,
+        aluminium and stainless) so generic "for wood" / "for metal" products still match.
+        Products with no material tags at all (calipers, measuring tools) are kept.
+        """
+        material_class = requested_material_class(question)
+        if not material_class:
+            return []
+        return [{"$or": [{f"mat_{material_class}": True}, {"mat_tagged": False}]}]
+
+    @staticmethod
+    def _where(conditions):
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _size_matches(self, metadata, sizes):
+        """Whether any millimetre attribute of a product is one of the sizes (within tolerance)"""
+        for attribute in NUMERIC_ATTRIBUTES:
+            value = metadata.get(attribute)
+            if attribute == 'teeth' or not isinstance(value, (int, float)):
+                continue
+            if any(abs(value - size) <= max(size * self.dimension_tolerance, 0.5) for size in sizes):
+                return True
+        return False
+
+    def boost_sizes(self, question, documents):
+        """
+        Move products that have one of the question's unassigned sizes to the front
+
+        "caliper 150mm" does not say which dimension 150 mm is, so it ranks instead of filtering.
+        """
+        sizes = parse_query_dimensions(question)[1]
+        if not sizes or not documents:
+            return documents
+        matching = [doc for doc in documents if self._size_matches(doc.metadata or {}, sizes)]
+        if not matching or len(matching) == len(documents):
+            return documents
+        self._count("size_boosted")
+        matching_ids = {id(doc) for doc in matching}
+        return matching + [doc for doc in documents if id(doc) not in matching_ids]
+
+    def _search(self, question, search_kwargs, where=None):
+        return self.vectorstore.max_marginal_relevance_search(question, filter=where, **search_kwargs)
+
+    def retrieve(self, question):
+        """Retrieve product documents, most relevant first"""
+        documents, where, k = self.vector_retrieve(question)
+        index = get_bm25_index() if self.mode == "hybrid" else None
+        if index is not None:
+            documents = self.fuse(documents, index.search(question, self.bm25_candidates), where, k)
+        return self.boost_sizes(question, documents)
+
+    def vector_retrieve(self, question):
+        """
+        MMR vector search, returns (documents, where clause used, k)
+
+        If the question names dimensions or a material, only products with matching metadata
+        are searched. When that leaves too few, the filters are relaxed step by step
+        (material only, then none) and the extra results fill up the rest.
+        """
+        dimensions = self.dimension_conditions(question)
+        materials = self.material_conditions(question)
+        if not dimensions and not materials:
+            self._count("requests")
+            return self._search(question, self.search_kwargs), None, self.search_kwargs["k"]
+
+        stages = [dimensions + materials]
+        if dimensions and materials:
+            stages.append(materials)
+        stages.append([])
+
+        documents = []
+        seen = set()
+        for stage, conditions in enumerate(stages):
+            search_kwargs = self.filtered_search_kwargs if conditions else self.search_kwargs
+            for doc in self._search(question, search_kwargs, self._where(conditions)):
+                if len(documents) >= self.search_kwargs["k"]:
+                    break
+                if doc.metadata.get('item_number') not in seen:
+                    seen.add(doc.metadata.get('item_number'))
+                    documents.append(doc)
+            if len(documents) >= self.min_filtered_results:
+                break
+
+        counters = ["requests"]
+        if stage > 0:
+            counters.append("filter_fallbacks")
+        if stage == 0 and dimensions:
+            counters.append("dimension_filtered")
+        if materials and stages[stage]:
+            counters.append("material_filtered")
+        self._count(*counters)
+        return documents, self._where(stages[stage]), search_kwargs["k"]
+
+    def fuse(self, documents, bm25_hits, where, k):
+        """
+        Reciprocal rank fusion of vector results and BM25 hits: score = sum of 1 / (RRF_K + rank)
+
+        BM25 hits missing from the vector results are loaded from Chroma, subject to the same
+        metadata filter, so a keyword match never bypasses the dimension / material filter.
+        """
+        scores = {}
+        by_id = {}
+        for rank, doc in enumerate(documents):
+            item_number = doc.metadata.get('item_number')
+            by_id[item_number] = doc
+            scores[item_number] = scores.get(item_number, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        missing = [item_number for item_number, _ in bm25_hits if item_number not in by_id]
+        for doc in self.get_documents(missing, where):
+            by_id[doc.metadata.get('item_number')] = doc
+
+        for rank, (item_number, _) in enumerate(bm25_hits):
+            if item_number in by_id:
+                scores[item_number] = scores.get(item_number, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        vector_ids = {doc.metadata.get('item_number') for doc in documents}
+        self._count("hybrid_fused")
+        self._count("bm25_only_results", amount=sum(1 for item_number in ranked if item_number not in vector_ids))
+        return [by_id[item_number] for item_number in ranked]
+
+    def get_documents(self, item_numbers, where=None):
+        """Product documents by id (item number), optionally restricted by a `where` clause"""
+        if not item_numbers:
+            return []
+        get_kwargs = {"ids": list(item_numbers), "include": ["documents", "metadatas"]}
+        if where is not None:
+            get_kwargs["where"] = where
+        found = self.vectorstore._collection.get(**get_kwargs)
+        return [
+            Document(page_content=text, metadata={"item_number": item_id, **(metadata or {})})
+            for item_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        ]
+
+    async def aretrieve(self, question):
+        """Async version of retrieve() - the local embedding and Chroma search run in a worker thread"""
+        return await asyncio.to_thread(self.retrieve, question)
+
+    def stats(self):
+        """How often retrieval was narrowed by a dimension or material filter, fused with BM25 or re-ranked by size"""
+        index = get_bm25_index()
+        with self._lock:
+            return {
+                **self.counts,
+                "mode": self.mode,
+                "bm25_index": index.stats() if index is not None else None,
+                "search_kwargs": self.search_kwargs,
+                "filtered_search_kwargs": self.filtered_search_kwargs,
+                "dimension_tolerance": self.dimension_tolerance,
+            }
@@ -0,0 +1,73 @@
+"""
+LRU cache of query embeddings
+Shoppers repeat a small set of queries, so the query-side encoder is skipped for text seen before
+"""
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text):
+    """Normalize unicode (NFKC), case and whitespace so trivially different queries share an entry"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class QueryEmbeddingCache:
+    """Bounded, thread-safe LRU mapping normalized query text -> read-only vector"""
+
+    def __init__(self, max_size=None):
+        self.max_size = int(max_size or os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def get_or_compute(self, text, encode):
+        """
+        Return the cached vector for text, or compute it with encode(normalized_text)
+
+        The normalized text is what gets encoded, so every spelling that maps to the
+        same key gets exactly the same vector.
+        """
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        started = time.perf_counter()
+        vector = np.array(encode(key), dtype=np.float32)
+        vector.setflags(write=False)
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self.misses += 1
+            self.encode_seconds += elapsed
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector
+
+    def stats(self):
+        """Hit ratio and estimated encode time saved"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_encode = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "avg_encode_ms": round(avg_encode * 1000, 2),
+                "encode_ms_saved": round(self.hits * avg_encode * 1000, 1),
+            }
@@ -0,0 +1,114 @@
+"""
+Fast history rewrite for follow-up questions
+Decides locally whether the question-condensing LLM round-trip is needed at all
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+from services.product_attributes import extract_query_entities
+
+# Words that point back into the conversation ("which of those is cheaper?", "does it fit
+# the second one?", "hvad koster den?") - such a follow-up always needs the LLM condense step
+REFERRING_PATTERN = re.compile(
+    r"(?<![\wæøå])(?:those|these|that|this one|it|its|they|them|the (?:first|second|third|last|other) ones?"
+    r"|the former|the latter|den|det|dem|denne|dette|disse)(?![\wæøå])"
+)
+
+
+class QuestionRewriter:
+    """
+    Turns (question, chat_history) into a standalone retrieval question without an LLM where possible
+
+    - first turn: used as-is
+    - follow-up that refers back ("those", "it", "the second one", "den/det/dem"): LLM condense step
+    - self-contained follow-up (names a product type / identifier, or an unrelated new topic): used as-is
+    - short follow-up that refines an earlier request ("and 200 mm?", "for aluminium instead"):
+      rewritten locally by carrying over the earlier product type, material and dimensions
+    - anything else (e.g. "tell me more about the second one"): left to the LLM condense step
+    """
+
+    def __init__(self, embeddings=None, mode=None, new_topic_similarity=None):
+        # "fast" uses the local rules above, "llm" always condenses follow-ups with the LLM
+        self.mode = mode or os.getenv("HISTORY_REWRITE_MODE", "fast")
+        # Below this cosine similarity to the previous question, a longer question is a new topic
+        self.new_topic_similarity = float(new_topic_similarity or os.getenv("REWRITE_NEW_TOPIC_SIMILARITY", "0.3"))
+        self.embeddings = embeddings
+
+        self._lock = threading.Lock()
+        self.counts = {"first_turn": 0, "self_contained": 0, "local_rewrite": 0, "llm": 0}
+
+    def _count(self, reason):
+        with self._lock:
+            self.counts[reason] += 1
+
+    def _similarity(self, a, b):
+        if self.embeddings is None:
+            return None
+        va = np.asarray(self.embeddings.embed_query(a))
+        vb = np.asarray(self.embeddings.embed_query(b))
+        return float(va @ vb / ((np.linalg.norm(va) * np.linalg.norm(vb)) or 1.0))
+
+    def rewrite(self, question, chat_history):
+        """
+        Return a standalone question, or None when the LLM condense step is needed
+
+        May run the (cached) query encoder, so call it from a worker thread in async code.
+        """
+        if not chat_history:
+            self._count("first_turn")
+            return question
+        if self.mode == "llm":
+            self._count("llm")
+            return None
+
+        if REFERRING_PATTERN.search(question.casefold()):
+            self._count("llm")
+            return None
+
+        entities = extract_query_entities(question)
+        if entities['product_types'] or entities['item_numbers'] or entities['eans']:
+            self._count("self_contained")
+            return question
+
+        previous_question = chat_history[-1][0]
+        if len(question.split()) >= 4:
+            similarity = self._similarity(question, previous_question)
+            if similarity is not None and similarity < self.new_topic_similarity:
+                self._count("self_contained")
+                return question
+
+        # Carry over what the earlier turns asked for and the follow-up does not override
+        if entities['materials'] or entities['dimensions']:
+            carried = []
+            for earlier_question, _ in reversed(chat_history):
+                earlier = extract_query_entities(earlier_question)
+                if not earlier['product_types']:
+                    continue
+                carried.extend(sorted(earlier['product_types']))
+                if not entities['materials']:
+                    carried.extend(sorted(earlier['materials']))
+                if not entities['dimensions']:
+                    carried.extend(earlier['dimensions'])
+                break
+            if carried:
+                self._count("local_rewrite")
+                return f"{' '.join(carried)} {question}"
+
+        self._count("llm")
+        return None
+
+    def stats(self):
+        """How often each path was taken and how many condense LLM calls were skipped"""
+        with self._lock:
+            follow_ups = self.counts["self_contained"] + self.counts["local_rewrite"] + self.counts["llm"]
+            skipped = self.counts["first_turn"] + self.counts["self_contained"] + self.counts["local_rewrite"]
+            return {
+                "mode": self.mode,
+                **self.counts,
+                "llm_calls_skipped": skipped,
+                "follow_up_llm_calls_skipped": follow_ups - self.counts["llm"],
+                "follow_ups": follow_ups,
+            }
@@ -0,0 +1,183 @@
+"""
+Semantic response cache for first-turn questions
+Near-identical opening questions reuse a finished ChatResponse instead of retrieval + two LLM calls.
+Questions that differ only in a size, material or item number embed almost identically, so an
+entry is only reused when the question's structured query key matches as well.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from services.product_attributes import extract_query_entities, parse_query_dimensions, requested_material_class
+
+# Written by setup_embeddings.py whenever the Chroma collection is rebuilt
+COLLECTION_VERSION_PATH = './scripts/scripts/collection_version.json'
+
+
+def write_collection_version(product_count, path=COLLECTION_VERSION_PATH):
+    """Stamp the collection with a new version so caches built on the old one are dropped"""
+    stamp = {
+        "version": uuid.uuid4().hex,
+        "built_at": datetime.utcnow().isoformat(),
+        "product_count": product_count,
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stamp, f)
+    return stamp
+
+
+def read_collection_version(path=COLLECTION_VERSION_PATH):
+    """Current collection version, or None if the collection was never stamped"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def query_key(question):
+    """
+    The parts of a question the embedding barely tells apart: dimension filters and unassigned
+    sizes, the requested material class and item numbers / EANs
+    """
+    filters, sizes = parse_query_dimensions(question)
+    entities = extract_query_entities(question)
+    return (
+        tuple(sorted(filters.items())),
+        tuple(sorted(sizes)),
+        requested_material_class(question),
+        tuple(sorted(set(entities['item_numbers']) | set(entities['eans']))),
+    )
+
+
+class SemanticResponseCache:
+    """Matches questions by embedding similarity; entries expire by TTL and are evicted LRU by count"""
+
+    def __init__(self, threshold=None, ttl=None, max_entries=None, version_path=COLLECTION_VERSION_PATH):
+        # Cosine similarity needed to reuse an answer (query vectors are normalized)
+        self.threshold = float(threshold or os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        self.ttl = float(ttl or os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+        self.max_entries = int(max_entries or os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+        self.version_path = version_path
+
+        self._lock = threading.Lock()
+        self._entries = []  # dicts: question, key, vector, response, created_at, last_used, latency, tokens
+        self._matrix = None  # stacked vectors, rebuilt lazily after changes
+        self._version = read_collection_version(version_path)
+        self._version_mtime = self._stat_version()
+
+        self.lookups = 0
+        self.hits = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self.saved_tokens = 0
+
+    def _stat_version(self):
+        try:
+            return os.stat(self.version_path).st_mtime
+        except OSError:
+            return None
+
+    def _check_version(self):
+        """Drop every entry when setup_embeddings.py has rebuilt the collection (caller holds the lock)"""
+        mtime = self._stat_version()
+        if mtime == self._version_mtime:
+            return
+        self._version_mtime = mtime
+        version = read_collection_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                print(f"Collection version changed - clearing {len(self._entries)} cached responses")
+                self.invalidations += 1
+            self._entries = []
+            self._matrix = None
+
+    def _expire(self, now):
+        alive = [entry for entry in self._entries if now - entry["created_at"] <= self.ttl]
+        if len(alive) != len(self._entries):
+            self._entries = alive
+            self._matrix = None
+
+    def lookup(self, vector, question):
+        """Return the cached response dict for the most similar question with the same query key, or None"""
+        vector = np.asarray(vector, dtype=np.float32)
+        key = query_key(question)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            self._check_version()
+            self._expire(now)
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._matrix = np.stack([entry["vector"] for entry in self._entries])
+            similarities = self._matrix @ vector
+            # Only entries asking for the same sizes / material / identifiers are candidates
+            similarities = np.where([entry["key"] == key for entry in self._entries], similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry = self._entries[best]
+            entry["last_used"] = now
+            self.hits += 1
+            self.saved_seconds += entry["latency"]
+            self.saved_tokens += entry["tokens"]
+            return entry["response"]
+
+    def store(self, question, vector, response, latency, tokens=0):
+        """Cache a finished response (as a plain dict) for a first-turn question"""
+        now = time.time()
+        entry = {
+            "question": question,
+            "key": query_key(question),
+            "vector": np.asarray(vector, dtype=np.float32),
+            "response": response,
+            "created_at": now,
+            "last_used": now,
+            "latency": latency,
+            "tokens": tokens or 0,
+        }
+        with self._lock:
+            self._check_version()
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                # Evict the least recently used entry
+                self._entries.remove(min(self._entries, key=lambda e: e["last_used"]))
+            self._matrix = None
+
+    def stats(self):
+        """Hit rate plus latency and LLM tokens saved"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "collection_version": self._version,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "invalidations": self.invalidations,
+                "latency_ms_saved": round(self.saved_seconds * 1000, 1),
+                "llm_tokens_saved": self.saved_tokens,
+            }
+
+
+# Global instance
+response_cache = None
+
+
+def get_response_cache():
+    """Get or create response cache singleton"""
+    global response_cache
+    if response_cache is None:
+        response_cache = SemanticResponseCache()
+    return response_cache
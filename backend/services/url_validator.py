@@ -0,0 +1,131 @@
+"""
+Concurrent product URL validation against the live site
+Keeps a process-wide pool of keep-alive connections and fans out checks with bounded concurrency
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+# Keep-alive connections per pooled client (see _get_clients)
+CONNECTIONS_PER_CLIENT = 10
+# Status codes that mean the product page is gone; any other 4xx/5xx says nothing definite
+MISSING_STATUSES = (404, 410)
+
+
+def page_status(status_code: int) -> Optional[bool]:
+    """True for 2xx/3xx, False for 404/410, None (unknown) for anything else"""
+    if status_code < 400:
+        return True
+    if status_code in MISSING_STATUSES:
+        return False
+    return None
+
+
+class ProductUrlValidator:
+    """Checks which product-detail URLs exist, all in roughly one round-trip"""
+
+    def __init__(self, max_in_flight=None, batch_deadline=None, request_timeout=5.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """Initialize validator limits (overridable through environment variables)"""
+        # Maximum number of URL checks running at the same time
+        self.max_in_flight = int(max_in_flight or os.getenv("URL_CHECK_MAX_IN_FLIGHT", "20"))
+        # Hard limit in seconds for a whole batch; unfinished checks are unknown (None)
+        self.batch_deadline = float(batch_deadline or os.getenv("URL_CHECK_DEADLINE", "6.0"))
+        self.request_timeout = request_timeout
+        # Stub transport for tests (e.g. httpx.MockTransport); None uses real connection pools
+        self.transport = transport
+
+        self._clients: List[httpx.AsyncClient] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_clients(self) -> List[httpx.AsyncClient]:
+        """Create the pooled clients lazily so they bind to the running event loop"""
+        if not self._clients or any(client.is_closed for client in self._clients):
+            # httpcore scans every pooled connection for each queued request, which gets
+            # quadratic with large pools - so spread the connections over a few small pools
+            n_clients = math.ceil(self.max_in_flight / CONNECTIONS_PER_CLIENT)
+            per_client = math.ceil(self.max_in_flight / n_clients)
+            limits = httpx.Limits(
+                max_connections=per_client,
+                max_keepalive_connections=per_client,
+                keepalive_expiry=30.0,
+            )
+            timeout = httpx.Timeout(self.request_timeout, connect=self.request_timeout)
+            self._clients = [
+                httpx.AsyncClient(timeout=timeout, limits=limits, follow_redirects=True, transport=self.transport)
+                for _ in range(n_clients)
+            ]
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._clients
+
+    async def _check_one(self, client: httpx.AsyncClient, url: str) -> Optional[bool]:
+        """Check a single URL with one HEAD request (GET only if the server rejects HEAD)"""
+        async with self._semaphore:
+            resp = await client.head(url)
+            if resp.status_code in (405, 501):
+                # HEAD not supported - read only the status line and headers of a GET
+                async with client.stream("GET", url) as resp:
+                    return page_status(resp.status_code)
+            return page_status(resp.status_code)
+
+    async def check(self, base_url: str, item_numbers: Iterable[str]) -> Dict[str, Optional[bool]]:
+        """
+        Check {base_url}/{item_number} for every item number concurrently.
+
+        Returns a dict: { item_number: True/False/None } - True for a 2xx/3xx page, False for
+        404/410, None (unknown) for other errors, network errors and checks not answered
+        before the batch deadline.
+        """
+        items = list(dict.fromkeys(item_numbers))
+        if not items:
+            return {}
+
+        clients = self._get_clients()
+        started = time.perf_counter()
+        tasks = {
+            item: asyncio.create_task(
+                self._check_one(clients[i % len(clients)], f"{base_url}/{item}")
+            )
+            for i, item in enumerate(items)
+        }
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.batch_deadline)
+        for task in pending:
+            task.cancel()
+
+        results: Dict[str, Optional[bool]] = {}
+        for item, task in tasks.items():
+            if task in done and not task.cancelled() and task.exception() is None:
+                results[item] = task.result()
+            else:
+                # Error or deadline miss -> unknown, not a broken page
+                results[item] = None
+
+        elapsed = time.perf_counter() - started
+        unknown = sum(1 for ok in results.values() if ok is None)
+        print(
+            f"  URL check: {sum(1 for ok in results.values() if ok)}/{len(results)} available "
+            f"in {elapsed * 1000:.0f} ms ({unknown} unknown, {len(pending)} timed out)"
+        )
+        return results
+
+    async def aclose(self):
+        """Close pooled connections"""
+        for client in self._clients:
+            await client.aclose()
+        self._clients = []
+
+
+# Global instance
+url_validator = None
+
+
+def get_url_validator():
+    """Get or create URL validator singleton"""
+    global url_validator
+    if url_validator is None:
+        url_validator = ProductUrlValidator()
+    return url_validator
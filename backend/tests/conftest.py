@@ -0,0 +1,6 @@
+"""
+Tests run from backend/: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
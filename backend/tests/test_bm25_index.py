@@ -0,0 +1,51 @@
+"""
+BM25Index unmaps its file when get_bm25_index swaps in a rebuilt one
+"""
+import os
+
+import services.bm25_index as bm25
+from services.bm25_index import BM25Index, BM25IndexBuilder
+
+
+def build(path, texts):
+    builder = BM25IndexBuilder()
+    for doc_id, text in texts.items():
+        builder.add(doc_id, text)
+    builder.write(str(path))
+
+
+def test_swap_closes_previous_index(tmp_path, monkeypatch):
+    path = tmp_path / 'bm25.idx'
+    monkeypatch.setenv('BM25_INDEX_PATH', str(path))
+    monkeypatch.setattr(bm25, 'bm25_index', None)
+    monkeypatch.setattr(bm25, '_bm25_index_mtime', None)
+
+    build(path, {'W1': 'circular saw blade', 'W2': 'digital caliper'})
+    first = bm25.get_bm25_index()
+    assert [doc_id for doc_id, _ in first.search('caliper')] == ['W2']
+
+    build(path, {'W1': 'circular saw blade', 'W3': 'vernier caliper'})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = bm25.get_bm25_index()
+    assert second is not first
+    assert first._mmap.closed
+    assert [doc_id for doc_id, _ in second.search('caliper')] == ['W3']
+    second.close()
+
+
+def test_close_waits_for_search_in_flight(tmp_path):
+    path = tmp_path / 'bm25.idx'
+    build(path, {'W1': 'circular saw blade'})
+    index = BM25Index(str(path))
+    real_search = index._search
+
+    def search_closed_midway(query, top_n):
+        index.close()
+        assert not index._mmap.closed
+        return real_search(query, top_n)
+
+    index._search = search_closed_midway
+    assert [doc_id for doc_id, _ in index.search('saw')] == ['W1']
+    assert index._mmap.closed
+    assert index.search('saw') == []
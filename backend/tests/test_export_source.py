@@ -0,0 +1,33 @@
+"""
+Delta export tombstones against a SQLite stand-in for the Products table
+"""
+import sqlite3
+
+from services.export_source import SqliteSource, iter_tombstones
+
+
+def make_source(tmp_path, rows):
+    path = tmp_path / 'source.db'
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE Products (SanitizedItemNumber TEXT, UpdateIndex INTEGER, IsDeleted INTEGER, "
+        "Parent TEXT, MarketsSerialized TEXT)"
+    )
+    conn.executemany("INSERT INTO Products VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+    return SqliteSource(path)
+
+
+def test_key_still_exported_by_another_row_is_not_a_tombstone(tmp_path):
+    source = make_source(tmp_path, [
+        # Deleted and changed, but an unchanged row still exports W1
+        ('W1', 20, 1, 'tools', '001'),
+        ('W1', 5, 0, 'tools', '001'),
+        # Gone everywhere
+        ('W2', 20, 1, 'tools', '001'),
+        ('W3', 20, 0, 'purchases', '001'),
+        # Changed and still exported
+        ('W4', 20, 0, 'tools', '001;002'),
+    ])
+    assert sorted(iter_tombstones(source, ('UpdateIndex', 10))) == ['W2', 'W3']
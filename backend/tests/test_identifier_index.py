@@ -0,0 +1,28 @@
+"""
+IdentifierIndex only answers for an identifier that names exactly one product
+"""
+from services.identifier_index import IdentifierIndex, normalize_identifier, write_identifier_index
+
+
+def make_index(tmp_path, products):
+    path = tmp_path / 'identifier_index.json'
+    write_identifier_index(path, products)
+    return IdentifierIndex(str(path))
+
+
+def test_separator_positions_keep_keys_apart(tmp_path):
+    assert normalize_identifier('12-345') != normalize_identifier('123-45')
+    assert normalize_identifier('W381195.2125412') != normalize_identifier('W3811952.125412')
+    index = make_index(tmp_path, [('12-345', ''), ('123-45', ''), ('W381195-2125412', '5701234567890')])
+    assert index.lookup('12-345') == '12-345'
+    assert index.lookup('123-45') == '123-45'
+    assert index.lookup('12345') is None
+    # Case and '.' vs '-' still do not matter
+    assert index.lookup('w381195.2125412') == 'W381195-2125412'
+    assert index.match_message('EAN 5701234567890') == [('5701234567890', 'W381195-2125412')]
+
+
+def test_ambiguous_key_falls_through(tmp_path):
+    index = make_index(tmp_path, [('AB-1', ''), ('ab.1', '')])
+    assert index.lookup('AB-1') is None
+    assert index.match_message('AB-1') is None
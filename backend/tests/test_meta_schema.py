@@ -0,0 +1,17 @@
+"""
+decode_unicode keeps the guards of the uncached version
+"""
+from services.meta_schema import decode_unicode
+
+
+def test_decodes_escapes():
+    assert decode_unicode('S\\u00e6t') == 'Sæt'
+    assert decode_unicode('plain') == 'plain'
+
+
+def test_non_strings_pass_through():
+    value = {'da': 'S\\u00e6t'}
+    assert decode_unicode(value) is value
+    assert decode_unicode(['a']) == ['a']
+    assert decode_unicode(None) is None
+    assert decode_unicode('') == ''
@@ -0,0 +1,25 @@
+"""
+parse_query_dimensions: which sizes in a question become filters and which only rank
+"""
+from services.product_attributes import parse_query_dimensions
+
+
+def test_named_bore_and_leading_diameter():
+    assert parse_query_dimensions("160mm saw blade, bore 30") == ({'bore_mm': 30.0, 'diameter_mm': 160.0}, [])
+    assert parse_query_dimensions("ø300 hul 30 rundsavklinge") == ({'bore_mm': 30.0, 'diameter_mm': 300.0}, [])
+
+
+def test_hole_is_bore_only_for_bored_tools():
+    assert parse_query_dimensions("saw blade 250mm, 30mm hole") == ({'bore_mm': 30.0, 'diameter_mm': 250.0}, [])
+    assert parse_query_dimensions("drill for 10mm hole") == ({'diameter_mm': 10.0}, [])
+
+
+def test_thick_material_is_an_unassigned_size():
+    assert parse_query_dimensions("saw blade for 30mm thick wood") == ({}, [30.0])
+    assert parse_query_dimensions("savklinge til 40 mm tykt træ") == ({}, [40.0])
+    assert parse_query_dimensions("3.2mm thick saw blade") == ({'thickness_mm': 3.2}, [])
+
+
+def test_unclear_sizes_only_rank():
+    assert parse_query_dimensions("digital caliper 150mm") == ({}, [150.0])
+    assert parse_query_dimensions("bandsaw blade 2450 mm x 27 mm") == ({}, [2450.0, 27.0])
@@ -0,0 +1,41 @@
+"""
+SemanticResponseCache only reuses answers for questions with the same structured query key
+"""
+import numpy as np
+
+from services.response_cache import SemanticResponseCache, query_key
+
+
+def make_cache(tmp_path):
+    return SemanticResponseCache(threshold=0.95, ttl=3600, max_entries=10,
+                                 version_path=str(tmp_path / 'collection_version.json'))
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_sizes_do_not_share_an_entry(tmp_path):
+    cache = make_cache(tmp_path)
+    # The two questions embed almost identically (cosine well above the threshold)
+    vector_160 = unit([1.0, 0.0, 0.01])
+    vector_180 = unit([1.0, 0.0, 0.02])
+    assert float(vector_160 @ vector_180) > 0.99
+
+    cache.store("saw blade 160mm for wood", vector_160, {"response": "160"}, latency=1.0)
+    assert cache.lookup(vector_180, "saw blade 180mm for wood") is None
+    assert cache.lookup(vector_160, "saw blade 160mm for wood") == {"response": "160"}
+
+
+def test_same_key_within_threshold_is_a_hit(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("saw blade 160mm for wood", unit([1.0, 0.0, 0.01]), {"response": "160"}, latency=1.0)
+    assert cache.lookup(unit([1.0, 0.0, 0.02]), "160mm saw blade for wood?") == {"response": "160"}
+    assert cache.lookup(unit([0.0, 1.0, 0.0]), "saw blade 160mm for wood") is None
+
+
+def test_query_key_separates_material_and_identifiers():
+    assert query_key("saw blade for wood") != query_key("saw blade for metal")
+    assert query_key("price of W381195-2125412") != query_key("price of W381195-2125413")
+    assert query_key("saw blade 160mm for wood") == query_key("160 mm saw blade for wood")
@@ -0,0 +1,44 @@
+"""
+ProductUrlValidator checks a batch concurrently, against a stub site with a fixed delay
+"""
+import asyncio
+import time
+
+import httpx
+
+from services.url_validator import ProductUrlValidator, page_status
+
+DELAY = 0.2
+BASE_URL = "https://stub.local/en-dk/product-detail"
+
+
+async def stub_site(request):
+    """Odd item numbers exist, even ones are gone; every response takes DELAY seconds"""
+    await asyncio.sleep(DELAY)
+    item = request.url.path.rsplit("/", 1)[-1]
+    return httpx.Response(200 if int(item) % 2 else 404)
+
+
+async def serial_check(items):
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.MockTransport(stub_site)) as client:
+        for item in items:
+            results[item] = page_status((await client.head(f"{BASE_URL}/{item}")).status_code)
+    return results
+
+
+async def concurrent_check(items):
+    validator = ProductUrlValidator(max_in_flight=len(items), transport=httpx.MockTransport(stub_site))
+    try:
+        started = time.perf_counter()
+        results = await validator.check(BASE_URL, items)
+        return results, time.perf_counter() - started
+    finally:
+        await validator.aclose()
+
+
+def test_concurrent_matches_serial_in_about_one_round_trip():
+    items = [str(i) for i in range(1, 21)]
+    results, elapsed = asyncio.run(concurrent_check(items))
+    assert results == asyncio.run(serial_check(items))
+    assert elapsed < 2 * DELAY
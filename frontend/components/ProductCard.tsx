@@ -3,6 +3,7 @@ import React from 'react'
 interface Specification {
   Type: string
   Data: string
+  FieldName?: string
 }
 
 interface ProductData {
@@ -71,7 +72,7 @@ export default function ProductCard({ product }: ProductCardProps) {
             <div className="grid grid-cols-1 md:grid-cols-2 gap-3">
               {product.specifications.slice(0, isExpanded ? product.specifications.length : 6).map((spec, i) => (
                 <div key={i} className="bg-gray-50 rounded-xl p-3 border border-gray-200 hover:border-red-300 transition-colors">
-                  <span className="font-semibold text-gray-600 text-xs block mb-1">{spec.Type}</span>
+                  <span className="font-semibold text-gray-600 text-xs block mb-1">{spec.FieldName || spec.Type}</span>
                   <span className="text-gray-900 text-sm font-medium">{spec.Data}</span>
                 </div>
               ))}